@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from typing import Callable
+
+from Log import LogOpen
+from PageHeader import PageHeader
+
+from ConSeries import ConSeriesPage
+from ConInstance import ConInstance
+from ConpubsCounts import ConpubsCounts
+from PageSource import PageSource, MirrorPageSource
+from SyntheticSite import SyntheticSite
+
+
+#####################################################################################
+# Benchmarks of the parsing and counting stages, run against a site (normally a synthetic one) held in memory
+# Each stage is timed separately:
+#   series-html     ConSeriesPage on v1/v2 HTML series pages (LoadConSeriesFromHTML)
+#   series-json     ConSeriesPage on v0 fanac-json series pages
+#   instance-html   ConInstance on HTML con pages (LoadConInstanceFromHTML)
+#   instance-json   ConInstance on v0 fanac-json con pages
+#   aggregate       ComputeCounts for every con instance and the series and grand totals
+# For each we report pages/s, MB/s and peak memory.  Results can be saved as a baseline and later runs compared to it.
+
+
+# A PageSource over pages already read into memory, so that no file I/O is timed
+class MemoryPageSource(PageSource):
+
+    def __init__(self, pages: dict[str, str]):
+        self._pages: dict[str, str]=pages
+
+
+    def GetFileAsString(self, directory: str, fname: str) -> str|None:
+        return self._pages.get("/"+"/".join(PageSource.PathParts(directory, fname)))
+
+
+# ----------------------------------------------
+# Read the whole site into memory
+# Returns the pages and, for each series, its con instances which have pages
+def LoadSite(root: str) -> tuple[dict[str, str], dict[str, list[str]]]:
+    mirror=MirrorPageSource(root)
+    pages: dict[str, str]={}
+    site: dict[str, list[str]]={}
+    for seriesname in sorted(os.listdir(root)):
+        if not os.path.isdir(os.path.join(root, seriesname)):
+            continue
+        page=mirror.GetFileAsString(seriesname, "index.html")
+        if page is None:
+            continue
+        pages[f"/{seriesname}/index.html"]=page
+        site[seriesname]=[]
+        for conname in sorted(os.listdir(os.path.join(root, seriesname))):
+            page=mirror.GetFileAsString(f"{seriesname}/{conname}", "index.html")
+            if page is not None:
+                pages[f"/{seriesname}/{conname}/index.html"]=page
+                site[seriesname].append(conname)
+    return pages, site
+
+
+def _IsJsonPage(page: str) -> bool:
+    return PageHeader(page).IsJson
+
+
+# ----------------------------------------------
+# Time one stage, and then (optionally) run it again under tracemalloc to get its peak memory
+def _RunStage(name: str, work: Callable[[], None], numpages: int, numbytes: int, repeat: int, measureMemory: bool) -> dict:
+    best=None
+    for _ in range(repeat):
+        start=time.perf_counter()
+        work()
+        elapsed=time.perf_counter()-start
+        if best is None or elapsed < best:
+            best=elapsed
+
+    peak=0
+    if measureMemory:
+        tracemalloc.start()
+        work()
+        _, peak=tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    best=max(best, 1e-9)
+    result={"pages": numpages, "MB": numbytes/(1024*1024), "seconds": best, "pages/s": numpages/best,
+            "MB/s": numbytes/(1024*1024)/best, "peak MB": peak/(1024*1024)}
+    print(f"{name:15} {numpages:7} pages {result['MB']:8.1f} MB {best:8.3f} s {result['pages/s']:10.0f} pages/s "
+          f"{result['MB/s']:8.2f} MB/s   peak {result['peak MB']:8.1f} MB")
+    return result
+
+
+# ----------------------------------------------
+def RunBenchmarks(root: str, repeat: int=3, measureMemory: bool=True) -> dict[str, dict]:
+    pages, site=LoadSite(root)
+    source=MemoryPageSource(pages)
+
+    # Sort the pages by format so that each stage sees just the pages it handles
+    seriesByFormat: dict[bool, list[str]]={True: [], False: []}
+    for seriesname in site.keys():
+        seriesByFormat[_IsJsonPage(pages[f"/{seriesname}/index.html"])].append(seriesname)
+    instancesByFormat: dict[bool, list[tuple[str, str]]]={True: [], False: []}
+    for seriesname, connames in site.items():
+        for conname in connames:
+            instancesByFormat[_IsJsonPage(pages[f"/{seriesname}/{conname}/index.html"])].append((seriesname, conname))
+
+    def SeriesBytes(names: list[str]) -> int:
+        return sum(len(pages[f"/{x}/index.html"]) for x in names)
+
+    def InstanceBytes(names: list[tuple[str, str]]) -> int:
+        return sum(len(pages[f"/{s}/{c}/index.html"]) for s, c in names)
+
+    def LoadSeries(names: list[str]) -> Callable[[], None]:
+        return lambda: [ConSeriesPage(x, source=source, loadInstances=False) for x in names]
+
+    def LoadInstances(names: list[tuple[str, str]]) -> Callable[[], None]:
+        return lambda: [ConInstance(s, c, page=pages[f"/{s}/{c}/index.html"]) for s, c in names]
+
+    results: dict[str, dict]={}
+    results["series-html"]=_RunStage("series-html", LoadSeries(seriesByFormat[False]), len(seriesByFormat[False]), SeriesBytes(seriesByFormat[False]), repeat, measureMemory)
+    results["series-json"]=_RunStage("series-json", LoadSeries(seriesByFormat[True]), len(seriesByFormat[True]), SeriesBytes(seriesByFormat[True]), repeat, measureMemory)
+    results["instance-html"]=_RunStage("instance-html", LoadInstances(instancesByFormat[False]), len(instancesByFormat[False]), InstanceBytes(instancesByFormat[False]), repeat, measureMemory)
+    results["instance-json"]=_RunStage("instance-json", LoadInstances(instancesByFormat[True]), len(instancesByFormat[True]), InstanceBytes(instancesByFormat[True]), repeat, measureMemory)
+
+    # Aggregation is timed on already-loaded con instances
+    allInstances=instancesByFormat[False]+instancesByFormat[True]
+    loaded: dict[str, list[ConInstance]]={x: [] for x in site.keys()}
+    for s, c in allInstances:
+        loaded[s].append(ConInstance(s, c, page=pages[f"/{s}/{c}/index.html"]))
+
+    def Aggregate() -> None:
+        total=ConpubsCounts()
+        for seriesname, cis in loaded.items():
+            counts=ConpubsCounts()
+            for ci in cis:
+                counts+=ci.ComputeCounts
+            counts.numcons=len(cis)
+            counts.numseries=1
+            total+=counts
+    results["aggregate"]=_RunStage("aggregate", Aggregate, len(allInstances), InstanceBytes(allInstances), repeat, measureMemory)
+
+    return results
+
+
+# ----------------------------------------------
+# Compare a run with a saved baseline.  Returns the list of stages whose throughput dropped by more than tolerance.
+def CompareWithBaseline(results: dict[str, dict], baseline: dict[str, dict], tolerance: float) -> list[str]:
+    regressions=[]
+    print("\nCompared with baseline:")
+    for stage, result in results.items():
+        if stage not in baseline:
+            print(f"{stage:15} (not in baseline)")
+            continue
+        ratio=result["pages/s"]/max(baseline[stage]["pages/s"], 1e-9)
+        flag=""
+        if ratio < 1-tolerance:
+            flag="  <-- REGRESSION"
+            regressions.append(stage)
+        print(f"{stage:15} {ratio:6.2f}x throughput   peak memory {result['peak MB']:8.1f} MB (was {baseline[stage]['peak MB']:8.1f} MB){flag}")
+    return regressions
+
+
+#############################################
+if __name__ == "__main__":
+    parser=argparse.ArgumentParser(description="Benchmark the ConpubsAnalyzer parsing and counting stages")
+    parser.add_argument("--site", metavar="DIR", default="", help="Benchmark against the site in DIR (default: generate a synthetic site)")
+    parser.add_argument("--series", type=int, default=2000, help="Number of series in the synthetic site")
+    parser.add_argument("--cons", type=int, default=10, help="Average number of con instances per series in the synthetic site")
+    parser.add_argument("--files", type=int, default=12, help="Average number of files per con instance in the synthetic site")
+    parser.add_argument("--repeat", type=int, default=3, help="Time each stage this many times and report the best")
+    parser.add_argument("--no-memory", action="store_true", help="Skip measuring peak memory (which runs each stage once more)")
+    parser.add_argument("--save", metavar="FILE", default="", help="Save the results as a baseline")
+    parser.add_argument("--compare", metavar="FILE", default="", help="Compare the results with a saved baseline")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Throughput drop which counts as a regression (default 0.10)")
+    args=parser.parse_args()
+
+    LogOpen("Log -- Benchmark.txt", "Log (Errors) -- Benchmark.txt")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root=args.site
+        if root == "":
+            root=tmp
+            print(f"Generating a synthetic site with {args.series} series...")
+            SyntheticSite(args.series, args.cons, args.files).Write(root)
+        results=RunBenchmarks(root, repeat=args.repeat, measureMemory=not args.no_memory)
+
+    if args.save != "":
+        with open(args.save, "w") as f:
+            f.write(json.dumps(results, indent=2))
+    if args.compare != "":
+        with open(args.compare) as f:
+            if len(CompareWithBaseline(results, json.loads(f.read()), args.tolerance)) > 0:
+                exit(1)
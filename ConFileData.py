@@ -1,16 +1,45 @@
+from __future__ import annotations
+
+from array import array
 import os
 import json
+import sys
 
-from Log import Log
+from LogLevels import LogDebug
 from HelpersPackage import Float0, Int0
 from ConpubsCounts import ConpubsCounts
 
 
+# The kinds of file which are counted, classified by the file's extension
+KindOther=0
+KindPdf=1
+KindImage=2
+
+_kindByExtension={".pdf": KindPdf, ".jpeg": KindImage, ".jpg": KindImage, ".gif": KindImage, ".png": KindImage}
+
+
+# This is called for every file row, so it looks up the text after the last "." rather than calling os.path.splitext()
+def FileKind(sitefilename: str) -> int:
+    dot=sitefilename.rfind(".")
+    if dot <= 0:
+        return KindOther
+    kind=_kindByExtension.get(sitefilename[dot:].lower(), KindOther)
+    if kind != KindOther and sitefilename[dot-1] in "./":
+        # Names like "x/.pdf" have no extension as far as splitext() is concerned, so let it decide
+        _, ext=os.path.splitext(sitefilename.lower())
+        kind=_kindByExtension.get(ext, KindOther)
+    return kind
+
+
 # An individual file to be listed under a convention
 # This is a version 0 format which is now used just to retrieve data from embedded json
 # Once retrieved, we move the data to a ConFileData class
 class ConInstanceLine:
+    __slots__=("DisplayTitle", "Notes", "SiteFilename", "Size", "IsTextRow", "IsLinkRow", "_URL", "Pages")
+
     def __init__(self):
+        self.DisplayTitle: str=""
+        self.Notes: str=""
         self.SiteFilename: str=""      # The name to be used for this file on the website
         self.Size: int=0               # The file's size in bytes
         self.IsTextRow: bool=False        # Is this a piece of text rather than a convention?
@@ -47,11 +76,11 @@ class ConInstanceLine:
 # An individual file to be listed under a convention
 # This is a single row
 class ConFileData:
-    def __init__(self, CIL: ConInstanceLine=None):
+    __slots__=("DisplayTitle", "Notes", "SiteFilename", "Size", "IsTextRow", "IsLinkRow", "Pages")
+
+    def __init__(self, CIL: ConInstanceLine|None=None):
         self.DisplayTitle: str=""      # The name as shown to the world on the website
         self.Notes: str=""             # The free-format description
-        self._localfilename: str=""     # The filename of the source file
-        self._localpathname: str="."    # The local pathname of the source file (path+filename)
         self.SiteFilename: str=""      # The name to be used for this file on the website (It will be (part of) the URL and holds the URL for link rows.)
         self.Size: int=0               # The file's size in bytes
         self.IsTextRow: bool=False        # Is this a piece of text rather than a convention?
@@ -89,13 +118,13 @@ class ConFileData:
 
     @property
     def Counts(self) -> ConpubsCounts:
-        Log(f"ConInstanceFile.Counts({self.SiteFilename})")
+        LogDebug("ConInstanceFile.Counts(%s)", self.SiteFilename)
         cpc=ConpubsCounts()
-        _, ext = os.path.splitext(self.SiteFilename.lower())
+        kind=FileKind(self.SiteFilename)
 
-        if ext == ".pdf":
+        if kind == KindPdf:
             cpc.numpdfs=1
-        if ext in [".jpeg", ".jpg", ".gif", ".png"]:
+        if kind == KindImage:
             cpc.numimages=1
         if self.IsLinkRow:
             cpc.numlinks=1
@@ -108,3 +137,71 @@ class ConFileData:
     @property
     def IsEmptyRow(self) -> bool:
         return self.SiteFilename == "" and self.DisplayTitle == "" and Int0(self.Pages) == 0 and self.Notes != ""
+
+
+###################################################################
+# A con instance's rows, held compactly for the model of the whole site which is kept in memory (see SiteServer.py)
+# The rows are held column by column, with the sizes and page counts in typed arrays and the flags as bits, so there is
+#   no object per row and no float or int object per value.  The strings are interned: the same titles and filenames
+#   ("Program Book", "Progress Report 1.pdf", ...) turn up at con after con.  (Links' URLs are not, as they rarely repeat.)
+# Iterating over it gives the rows as ResultsIndex.FileRow() tuples, with the values just as they were in the ConFileData.
+#   (A size which was an int is flagged, so it comes back as one.  The few rows whose size or page count was anything
+#   else, e.g. a string from a v0 page's json, keep the originals on the side.)
+class ConFileRows:
+    __slots__=("_titles", "_notes", "_sitefilenames", "_sizes", "_pages", "_flags", "_originals")
+
+    _noPages=-1         # A row whose Pages is None
+    _textRow=1          # The bits of _flags
+    _linkRow=2
+    _intSize=4
+
+    def __init__(self, files: list[ConFileData]|None=None):
+        files=files or []
+        self._titles: tuple[str, ...]=tuple([_Intern(cf.DisplayTitle) for cf in files])
+        self._notes: tuple[str, ...]|None=None        # (They are nearly always all empty)
+        if any(cf.Notes != "" for cf in files):
+            self._notes=tuple([_Intern(cf.Notes) for cf in files])
+        self._sitefilenames: tuple[str, ...]=tuple([cf.SiteFilename if cf.IsLinkRow else _Intern(cf.SiteFilename) for cf in files])
+        self._sizes=array("d", [cf.Size if type(cf.Size) is float else Float0(cf.Size) for cf in files])
+        self._pages=array("q", [ConFileRows._noPages if cf.Pages is None else cf.Pages if type(cf.Pages) is int else Int0(cf.Pages) for cf in files])
+        self._flags=array("b", [(ConFileRows._textRow if cf.IsTextRow else 0) | (ConFileRows._linkRow if cf.IsLinkRow else 0)
+                                | (ConFileRows._intSize if type(cf.Size) is int else 0) for cf in files])
+        self._originals: dict[int, tuple]|None=None     # Row -> (Size, Pages) of the rows whose values the arrays can't give back
+        odd={i: (cf.Size, cf.Pages) for i, cf in enumerate(files)
+             if type(cf.Size) not in (float, int) or (cf.Pages is not None and type(cf.Pages) is not int)}
+        if len(odd) > 0:
+            self._originals=odd
+
+
+    def __len__(self) -> int:
+        return len(self._titles)
+
+
+    def __iter__(self):
+        for i in range(len(self._titles)):
+            size=self._sizes[i]
+            pages=self._pages[i]
+            flags=self._flags[i]
+            if flags & ConFileRows._intSize:
+                size=int(size)
+            if pages == ConFileRows._noPages:
+                pages=None
+            if self._originals is not None and i in self._originals:
+                size, pages=self._originals[i]
+            yield (self._titles[i], "" if self._notes is None else self._notes[i], self._sitefilenames[i], size, pages,
+                   flags & ConFileRows._textRow != 0, flags & ConFileRows._linkRow != 0)
+
+
+    # The rows as ConFileData again
+    def Files(self) -> list[ConFileData]:
+        files=[]
+        for title, notes, sitefilename, size, pages, istext, islink in self:
+            cf=ConFileData()
+            cf.DisplayTitle, cf.Notes, cf.SiteFilename, cf.Size, cf.Pages, cf.IsTextRow, cf.IsLinkRow=title, notes, sitefilename, size, pages, istext, islink
+            files.append(cf)
+        return files
+
+
+# (sys.intern() takes only str itself)
+def _Intern(s):
+    return sys.intern(s) if type(s) is str else s
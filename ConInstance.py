@@ -2,15 +2,22 @@ from __future__ import annotations
 from typing import List
 
 import json
-import re
+import time
 
-from Log import Log, LogError
+from Log import LogError
+from LogLevels import LogDebug, LogInfo, IsLogging, Debug
 from FTP import FTP
 from ConpubsCounts import ConpubsCounts
-from HelpersPackage import FindBracketedText, Float0, Int0, ExtractInvisibleTextInsideFanacComment, FindBracketedText2
-from HelpersPackage import FindNextBracketedText, FindLinkInString
+from HelpersPackage import Float0, FindLinkInString
 
-from ConFileData import ConFileData, ConInstanceLine
+from ConFileData import ConFileData
+from FanacJson import DecodeConFileList
+from FileColumns import FileColumns
+from RowMetadata import IsLinkHref, NormalizeHref, SmallMetadata
+from PdfPages import GetPdfPageCounter
+from HtmlScanner import HtmlElement
+from PageHeader import PageHeader
+from Instrumentation import RecordTime, Observe
 
 
 #####################################################################################################
@@ -20,19 +27,14 @@ from ConFileData import ConFileData, ConInstanceLine
 
 class ConInstancePage:
     def __init__(self):
-        self._conPageFileList: List[ConInstanceLine]=[]
+        self._conPageFileList: List[ConFileData]=[]
 
 
     def FromJson(self, val: str) -> ConInstancePage:
         d=json.loads(val)
         if d["ver"] >= 1:
             #self._name=d["_name"]
-            cfld=d["_conFileList"]
-            self._conPageFileList=[]
-            for c in cfld:
-                cil=ConInstanceLine().FromJson(c)
-                cp=ConFileData(CIL=cil)
-                self._conPageFileList.append(cp)
+            self._conPageFileList=DecodeConFileList(d["_conFileList"])
 
         return self
 
@@ -40,57 +42,81 @@ class ConInstancePage:
 #####################################################################################
 class ConInstance:
 
-    def __init__(self, seriesname, coninstancename):
+    # source is the PageSource to read from; if it's not supplied we use FTP() itself
+    # If the page has already been downloaded, it can be passed in as page and the source is not used
+    def __init__(self, seriesname, coninstancename, source=None, page: str|None=None):
         self._listConFiles: list[ConFileData]=[]
         self._coninstancename=coninstancename
         self._seriesname=seriesname
 
-        Log(f"CIC.__init__: Loading /{seriesname}/{coninstancename}/index.html")
+        LogInfo("CIC.__init__: Loading /%s/%s/index.html", seriesname, coninstancename)
 
         # Read the existing CIP
-        file=FTP().GetFileAsString(f"/{seriesname}/{self._coninstancename}", "index.html")
+        file=page
         if file is None:
-            Log(f"CI.__init__: Download ConInstance Page: /{seriesname}/{self._coninstancename}/index.html does not exist")
+            if source is None:
+                source=FTP()
+            file=source.GetFileAsString(f"/{seriesname}/{self._coninstancename}", "index.html")
+        if file is None:
+            LogInfo("CI.__init__: Download ConInstance Page: /%s/%s/index.html does not exist", seriesname, self._coninstancename)
             return  # Just return with the ConInstance page empty
 
-        version=0
-        j=FindBracketedText(file, "fanac-json")[0]
-        if j is None or len(j) < 20:
-            version=2
-        else:
-            version=Float0(ExtractInvisibleTextInsideFanacComment(file, "version"))
+        start=time.perf_counter()
+        version=self._LoadPage(file)
+        RecordTime(f"parse.instance.v{version:g}", time.perf_counter()-start, f"/{seriesname.strip('/')}/{coninstancename}/index.html")
+        Observe("rows.instance", len(self._listConFiles))
+
+
+    # Parse the page, and return its format version
+    def _LoadPage(self, file: str) -> float:
+        header=PageHeader(file)
+        j=header.Json
+        version=2
+        if header.IsJson:
+            version=Float0(header.Version)
 
-        Log(f"{coninstancename} -- {version}")
+        LogDebug("%s -- %s", self._coninstancename, version)
 
         if version < 1.99:
             # Load it from json
             try:
                 self.FromJson(j)
             except (json.decoder.JSONDecodeError):
-                LogError(f"CI.__init__: JSONDecodeError when loading convention information from /{coninstancename}index.html")
-                return
+                LogError(f"CI.__init__: JSONDecodeError when loading convention information from /{self._coninstancename}index.html")
+                return version
 
             # Extract the info we need
-            self._listConFiles=[ConFileData(CIL=x) for x in self.CIP._conPageFileList]
+            self._listConFiles=self.CIP._conPageFileList
 
         else:
             # Interpret the HTML
-            if not self.LoadConInstanceFromHTML(file):
-                LogError(f"CI.__init__: LoadConInstanceFromHTML() failed when loading convention information from /{coninstancename}index.html")
-                return
+            if not self.LoadConInstanceFromHTML(file, header):
+                LogError(f"CI.__init__: LoadConInstanceFromHTML() failed when loading convention information from /{self._coninstancename}index.html")
+                return version
 
-        Log(f"CIC: /{seriesname}/{self._coninstancename}/index.html downloaded")
+        LogDebug("CIC: /%s/%s/index.html downloaded", self._seriesname, self._coninstancename)
+        return version
+
+
+    # ----------------------------------------------
+    @property
+    def ConFiles(self) -> list[ConFileData]:
+        return self._listConFiles
 
 
     # ----------------------------------------------
     @property
     def ComputeCounts(self) -> ConpubsCounts:
-        counts=ConpubsCounts()
-        for cf in self._listConFiles:
-            if not cf.IsTextRow and not cf.IsEmptyRow:
-                counts+=cf.Counts
-        Log(f"{self._coninstancename} = {counts}")
-        return counts
+        return self.ComputeColumns.Counts
+
+
+    # The same, as the counted rows' columns (see CountConFileColumns())
+    @property
+    def ComputeColumns(self) -> FileColumns:
+        columns=CountConFileColumns(self._seriesname, self._coninstancename, self._listConFiles)
+        if IsLogging(Debug):
+            LogDebug("%s = %s", self._coninstancename, columns.Counts)
+        return columns
 
 
     # ----------------------------------------------
@@ -105,92 +131,108 @@ class ConInstance:
         return self
 
 
-    def LoadConInstanceFromHTML(self, file: str) -> bool:
+    # If the page's PageHeader is supplied, its scanner and table are used rather than scanning the page again
+    def LoadConInstanceFromHTML(self, file: str, header: PageHeader|None=None) -> bool:
 
-        file=file.replace("/n", "")  # I don't know where these are coming from, but they don't belong there!
-
-        body, _=FindBracketedText2(file, "body", caseInsensitive=True)
+        fixed=file.replace("/n", "")  # I don't know where these are coming from, but they don't belong there!
+        if header is None or len(fixed) != len(file):   # (If anything was removed, the header's offsets are off)
+            header=PageHeader(fixed)
+        scanner=header.Scanner
+        body=scanner.Find("body")
         if body is None:
             LogError("LoadConInstanceFromHTML(): Can't find <body> tag")
             return False
 
-        rows: list[tuple[str, str]]=[]
-        ulists, _=FindBracketedText2(body, "fanac-table", caseInsensitive=True)
+        rows: list[HtmlElement]=[]
+        ulists=header.Table
+        if ulists is None or ulists.start < body.contentStart or ulists.end > body.contentEnd:
+            ulists=scanner.Find("fanac-table", body.contentStart, body.contentEnd)
+        if ulists is None:
+            return True
 
         # The ulists are a series of ulist items, each ulist is a series of <li></li> items
         # The tags usually have ' id="conpagetable"' which can be ignored
-        remainder=ulists.replace(' id="conpagetable"', "")
+        loc=ulists.contentStart
         while True:
-            lead, tag, contents, remainder=FindNextBracketedText(remainder)
-            if tag == "":
+            element=scanner.FindNext(loc, ulists.contentEnd)
+            if element is None:
                 break
-            Log(f"*** {tag=}  {contents=}")
-            if tag == "ul":
-                remainder=lead+contents+remainder  # If we encounter a <ul>...</ul> tag, we edit it out, keeping what's outside it and what's inside it
+            if IsLogging(Debug):
+                LogDebug("*** tag=%r  contents=%r", element.tag, scanner.Contents(element))
+            if element.tag == "ul":
+                loc=element.contentStart  # If we encounter a <ul>...</ul> tag, we edit it out, keeping what's outside it and what's inside it
                 continue
-            rows.append((tag, contents))
+            rows.append(element)
+            loc=element.end
 
         # Now decode the lines
         for row in rows:
-            if row[0] == "li":
-                Log(f"\n{row[1]=}")
+            if row.tag == "li":
+                if IsLogging(Debug):
+                    LogDebug("\nrow=%r", scanner.Contents(row))
                 conf=ConFileData()
                 # We're looking for an <a></a> followed by <small>/</small>
-                a, rest=FindBracketedText2(row[1], "a", includeBrackets=True)
-                Log(f"{a=}   {rest=}")
-                if a == "":
-                    LogError(f"LoadConInstanceFromHTML(): Can't find <a> tag in {row}")
+                aelement=scanner.Find("a", row.contentStart, row.contentEnd)
+                if aelement is None:
+                    LogError(f"LoadConInstanceFromHTML(): Can't find <a> tag in {scanner.Outer(row)}")
                     return False
+                a=scanner.Outer(aelement)
+                rest=scanner.Text(aelement.end, row.contentEnd)
+                LogDebug("a=%r   rest=%r", a, rest)
                 _, href, text, _=FindLinkInString(a)
                 if href == "":
-                    LogError(f"LoadConInstanceFromHTML(): Can't find href= in <a> tag in {row}")
+                    LogError(f"LoadConInstanceFromHTML(): Can't find href= in <a> tag in {scanner.Outer(row)}")
                     return False
                 # if href is a foreign link, then this is a link line
-                if "/" in href:
+                if IsLinkHref(href):
                     conf.DisplayTitle=text
                     conf.SiteFilename=href
                     conf.IsLinkRow=True
                     self._listConFiles.append(conf)
                     continue
 
-                # Strip any view-Fit specs from the end of the URL.  There may be more than one.
-                # They may be of the form
-                #       #view=Fit
-                #       #xxx=yyy&view-Fit
-                # Strategy is to first remove all view=Fit&, then any #view=Fit
-                while "view=fit" in href.lower():
-                    href=re.sub("view=fit&", "", href, count=99, flags=re.IGNORECASE)
-                    href=re.sub("#view=fit", "", href, count=1, flags=re.IGNORECASE)
-
-                # It appears to be an ordinary file like
+                # It appears to be an ordinary file like.  Strip any view-Fit specs from the end of the URL.
                 conf.DisplayTitle=text
-                conf.SiteFilename=href
+                conf.SiteFilename=NormalizeHref(href)
 
                 if len(rest.strip()) > 0:
-                    small, _=FindBracketedText2(rest, "small")
+                    small=scanner.Contents(scanner.Find("small", aelement.end, row.contentEnd))
                     if small == "":
                         LogError(f"LoadConInstanceFromHTML(): Can't find <small> tag in {rest}")
                         return False
-                    small=small.replace("&nbsp;", " ")
-                    m=re.match(".*?([0-9.]+) MB", small, re.IGNORECASE)
-                    if m is not None:
-                        val=Float0(m.group(1))
-                        if val > 500:  # We're looking for a value in MB, but if we get a value in bytes, convert it
-                            val=val/(1024**2)
-                        conf.Size=val
-                    m=re.match(".*?([0-9]+) pp", small, re.IGNORECASE)
-                    if m is not None:
-                        conf.Pages=Int0(m.group(1))
+                    size, pages=SmallMetadata(small)
+                    if size is not None:
+                        conf.Size=size
+                    if pages is not None:
+                        conf.Pages=pages
 
                 self._listConFiles.append(conf)
 
-            elif row[0] == "b":
+            elif row.tag == "b":
                 conf=ConFileData()
                 conf.IsTextRow=True
-                conf.DisplayTitle=row[1]
+                conf.DisplayTitle=scanner.Contents(row)
                 #self._listConFiles.append(conf)
-                Log(f"LoadConInstanceFromHTML(): Text line: {conf.DisplayTitle}")
+                LogDebug("LoadConInstanceFromHTML(): Text line: %s", conf.DisplayTitle)
 
         return True
 
 
+#####################################################################################
+# The counts of a con instance's rows
+# If there is a PdfPageCounter, the page counts the rows are missing are first filled in from it (which changes the rows)
+#   unless fillInPages is False
+def CountConFiles(seriesname: str, coninstancename: str, files: list[ConFileData], fillInPages: bool=True) -> ConpubsCounts:
+    return CountConFileColumns(seriesname, coninstancename, files, fillInPages).Counts
+
+
+# The same, but returning the counted rows' columns, so that the kinds and page counts can be passed on (e.g., to the
+#   FileIdentityIndex) rather than worked out again
+def CountConFileColumns(seriesname: str, coninstancename: str, files: list[ConFileData], fillInPages: bool=True) -> FileColumns:
+    start=time.perf_counter()
+    counter=GetPdfPageCounter()
+    if counter is not None and fillInPages:
+        counter.FillInPages(seriesname, coninstancename, files)
+    columns=FileColumns(files)
+    RecordTime("count.instance", time.perf_counter()-start)
+    return columns
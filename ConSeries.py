@@ -1,17 +1,26 @@
 from __future__ import annotations
 from typing import List
 import json
-import re
+import time
 
-from Log import Log
+from Log import LogError
+from LogLevels import LogDebug, LogInfo
 from FTP import FTP
-from HelpersPackage import RemoveAccents, FindBracketedText, FindBracketedText2, ExtractInvisibleTextInsideFanacComment, Float0
+from HelpersPackage import RemoveAccents, Float0
 from ConpubsCounts import ConpubsCounts, NameLinkCounts
 from ConInstance import ConInstance
+from FanacJson import LoadJsonRows
+from HtmlScanner import HtmlScanner
+from PageHeader import PageHeader
+from Instrumentation import RecordTime, Observe
+from ResultsIndex import ResultsIndex, PageHash
+from RowMetadata import UnpackConNameInfo
 
 
 ####################################################################################
 class Con:
+    __slots__=("_name", "_seriesname", "_URL")
+
     def __init__(self, seriesname: str):
         self._name: str=""                  # Name including number designation
         self._seriesname: str=seriesname
@@ -19,9 +28,12 @@ class Con:
 
 
     def FromJson(self, val: str) -> Con:
-        d=json.loads(val)
+        return self.FromDict(json.loads(val))
+
+
+    def FromDict(self, d: dict) -> Con:
         self._name=RemoveAccents(d["_name"])
-        if "_URL" in d.keys():
+        if "_URL" in d:
             self._URL=d["_URL"]
         return self
 
@@ -30,6 +42,7 @@ class Con:
 ####################################################################################
 class ConSeries():
 #    _element=Con
+    __slots__=("_name", "_seriesname", "_series", "_stuff")
 
     def __init__(self, seriesname: str):
         self._name: str=""
@@ -43,11 +56,14 @@ class ConSeries():
         self._name=RemoveAccents(d["_name"])      # Clean out old accented entries
         if "_stuff" in d.keys():
             self._stuff=d["_stuff"]
-        self._series=[]
-        i=0
-        while str(i) in d.keys():       # This is because json merges 1 and "1" as the same. (It appears to be a bug.)
-            self._series.append(Con(self._seriesname).FromJson(d[str(i)]))
-            i+=1
+        # The cons are stored under the keys "0", "1", ...  (This is because json merges 1 and "1" as the same. (It appears to be a bug.))
+        rows=[]
+        while True:
+            row=d.get(str(len(rows)))
+            if row is None:
+                break
+            rows.append(row)
+        self._series=[Con(self._seriesname).FromDict(x) for x in LoadJsonRows(rows)]
 
         return self
 
@@ -55,29 +71,79 @@ class ConSeries():
 #####################################################################################
 # This holds a con series index page
 class ConSeriesPage():
-    def __init__(self, conseriesname: str):
+    # source is the PageSource to read from; if it's not supplied we use FTP() itself
+    # If loadInstances is False, only the series page is read and the con instances are left for the caller to load
+    #   (see Crawler.py) using ConInstanceNLCs and AddConInstanceCounts()
+    # If a ResultsIndex is supplied, the series page is only parsed if it has changed since it was last indexed
+    # If the series page has already been downloaded, it can be passed in as page
+    def __init__(self, conseriesname: str, source=None, loadInstances: bool=True, index: ResultsIndex|None=None, page: str|None=None):
 
         assert len(conseriesname) > 0
         self.Seriesname=conseriesname
         self.SeriesCons=ConSeries(conseriesname)
         self.Counts=ConpubsCounts()
         self.Counts.title=conseriesname
+        self.ConInstanceNLCs: list[NameLinkCounts]=[]     # The con instances which have pages to be loaded
+        self._version: float=0                            # The page's format, set by LoadConInstanceList()
+        if source is None:
+            source=FTP()
+        self._source=source
+
+        file=page
+        if file is None:
+            LogInfo("Loading /%s/index.html from fanac.org", self.Seriesname)
+            file=source.GetFileAsString("/"+self.Seriesname, "index.html")
+            if file is None:
+                LogError(f"ConSeriesPage: /{self.Seriesname}/index.html does not exist")
+                return
+
+        listOfNLCs: list[NameLinkCounts]|None=None
+        if index is not None:
+            path=f"/{self.Seriesname}/index.html"
+            pagehash=PageHash(file)
+            stored=index.LookupSeriesPage(path, pagehash)
+            if stored is not None:
+                self.Seriesname, listOfNLCs=stored      # The name as it was when the page was parsed (see FromJson())
+        if listOfNLCs is None:
+            start=time.perf_counter()
+            listOfNLCs=self.LoadConInstanceList(file)
+            RecordTime(f"parse.series.v{self._version:g}", time.perf_counter()-start, f"/{self.Seriesname}/index.html")
+            if listOfNLCs is None:
+                return
+            if index is not None:
+                index.StoreSeriesPage(path, pagehash, self.Seriesname, listOfNLCs)
+
+        LogInfo("%d instances found", len(listOfNLCs))
+        Observe("rows.series", len(listOfNLCs))
+        self.ConInstanceNLCs=[nlc for nlc in listOfNLCs if nlc.URL != ""]   # No URL is a con that is in the list, but with no data yet
+        self.Counts.numseries=1
 
-        Log(f"Loading /{self.Seriesname}/index.html from fanac.org")
-        file=FTP().GetFileAsString("/"+self.Seriesname, "index.html")
+        if loadInstances:
+            # Process the con instances getting a count for each and sum them up
+            for nlc in self.ConInstanceNLCs:
+                # Load the con instance from the server and compute its counts
+                ci=ConInstance("/"+self.Seriesname, nlc.name, source=self._source)
+                self.AddConInstanceCounts(ci.ComputeCounts)
+
+
+    # ----------------------------------------------
+    # Extract the list of con instances from a series page.  Returns None if the page can't be read.
+    def LoadConInstanceList(self, file: str) -> list[NameLinkCounts]|None:
 
         # Figure out what version this conseriespage is
         # V1.0 is the old json-based format (we have this format if there is a block of json in the file)
         # V2.0 (and potentially higher) is the new pure-HTML format
 
         # Try to get the JSON and the version from the file
+        header=PageHeader(file)
         version=0   # If we find json, then for our purposes, this is a version 0 file. (There are versions in the json, but they are not the overall version)
-        j=FindBracketedText(file, "fanac-json")[0]
-        if j is None or len(j) < 20:
-            version=Float0(ExtractInvisibleTextInsideFanacComment(file, "version"))     # Look for a version in the file
+        j=header.Json
+        if not header.IsJson:
+            version=Float0(header.Version)     # Look for a version in the file
             if version == 0:
                 version=1       # If this is not a version 0 file and no version is found in it, it's version 1
-        Log(f"{conseriesname}: {version=}")
+        LogDebug("%s: version=%s", self.Seriesname, version)
+        self._version=version
 
         # Extract the list of con instances
         # Version 0 files store data entirely differently from version 1 and above, so we handle them differently here
@@ -86,8 +152,8 @@ class ConSeriesPage():
             try:
                 self.FromJson(j)
             except (json.decoder.JSONDecodeError):
-                Log(f"DownloadConSeries: JSONDecodeError when loading convention information from /{self.Seriesname}index.html")
-                return
+                LogError(f"DownloadConSeries: JSONDecodeError when loading convention information from /{self.Seriesname}index.html")
+                return None
 
             # Extract the info we need
             for coninstance in self.SeriesCons._series:
@@ -95,21 +161,15 @@ class ConSeriesPage():
 
         else:
             # Interpret the HTML
-            listOfNLCs=self.LoadConSeriesFromHTML(file)
+            listOfNLCs=self.LoadConSeriesFromHTML(file, header)
 
-        Log(f"{len(listOfNLCs)} instances found")
+        return listOfNLCs
 
-        # Process the con instances getting a count for each and sum them up
-        numcons=0
-        for nlc in listOfNLCs:
-            if nlc.URL != "":   # No URL is a con that is in the list, but with no data yet
-                # Load the con instance from the server and compute its counts
-                ci=ConInstance("/"+self.Seriesname, nlc.name)
-                numcons+=1
-                self.Counts+=ci.ComputeCounts
 
-        self.Counts.numcons=numcons
-        self.Counts.numseries=1     # We just finished a series
+    # Add in the counts of one con instance of this series
+    def AddConInstanceCounts(self, counts: ConpubsCounts) -> None:
+        self.Counts+=counts
+        self.Counts.numcons+=1
 
 
     def FromJson(self, val: str) -> ConSeriesPage:                    # MainConSeriesFrame
@@ -123,32 +183,41 @@ class ConSeriesPage():
 
     #----------------------------
     # Populate the ConSeriesFrame structure
-    def LoadConSeriesFromHTML(self, file: str) -> List[NameLinkCounts]:
+    # If the page's PageHeader is supplied, its scanner and table are used rather than scanning the page again
+    def LoadConSeriesFromHTML(self, file: str, header: PageHeader|None=None) -> List[NameLinkCounts]:
+        if header is None:
+            header=PageHeader(file)
+        scanner=header.Scanner
+
         # Look for the series name in the header
-        head, rest=FindBracketedText2(file, "head", caseInsensitive=True)
+        rest=0
+        head=scanner.Find("head")
+        if head is not None:
+            rest=head.end
 
         # There should only be one table and that contains the list of con instances
-        table, _=FindBracketedText2(rest, "fanac-table", caseInsensitive=True)
-        if table == "":
-            Log(f"DecodeConSeriesHTML(): failed to find the <fanac-table> tags")
+        table=header.Table
+        if table is None or table.start < rest:
+            table=scanner.Find("fanac-table", rest)
+        if table is None or table.contentStart == table.contentEnd:
+            LogInfo("DecodeConSeriesHTML(): failed to find the <fanac-table> tags")
             return []
 
         # Read the table
         # Get the table header and decode the columns
-        header, rest=FindBracketedText2(table, "thead", caseInsensitive=True)
-        if header == "":
-            Log(f"DecodeConSeriesHTML(): failed to find the <thead> tags in the body")
+        header=scanner.Find("thead", table.contentStart, table.contentEnd)
+        if header is None or header.contentStart == header.contentEnd:
+            LogInfo("DecodeConSeriesHTML(): failed to find the <thead> tags in the body")
             return []
         # Find the column headings
-        headers=self.ReadTableRow(header, "th")
+        headers=self._ReadTableCells(scanner, header.contentStart, header.contentEnd, "th")
 
         # Now read the rows
         rows=[]
-        while True:
-            rowtext, rest=FindBracketedText2(rest, "tr", caseInsensitive=True)
-            if rowtext == "":
+        for tr in scanner.FindAll("tr", header.end, table.contentEnd):
+            if tr.contentStart == tr.contentEnd:
                 break
-            row=self.ReadTableRow(rowtext)
+            row=self._ReadTableCells(scanner, tr.contentStart, tr.contentEnd, "td")
             if len(row) < len(headers):
                 row.extend(" "*(len(headers)-len(row)))
             rows.append(row)
@@ -173,12 +242,16 @@ class ConSeriesPage():
     # The input is normally the text bounded by <tr>...</tr>
     # The cells are all the strings delimited by <delim>...</delim>
     def ReadTableRow(self, row: str, delim="td") -> list[str]:
-        rest=row
+        return self._ReadTableCells(HtmlScanner(row), 0, len(row), delim)
+
+
+    # The same, but reading the row from [start, end) of a page that has already been scanned
+    def _ReadTableCells(self, scanner: HtmlScanner, start: int, end: int, delim: str) -> list[str]:
         out=[]
-        while True:
-            item, rest=FindBracketedText2(rest, delim, caseInsensitive=True)
-            if item == "":
+        for cell in scanner.FindAll(delim, start, end):
+            if cell.contentStart == cell.contentEnd:
                 break
+            item=scanner.Contents(cell)
             if f"<{delim}>" in item:    # This corrects for an error in which we have the pattern '<td>xxx<td>yyy</td>' which displays perfectly well
                 item=item.split(f"<{delim}>")
                 out.extend(item)
@@ -194,14 +267,4 @@ class ConSeriesPage():
     # Generate the Name, URL and extra columns
     # Reversed by ConNameInfoPack()
     def ConNameInfoUnpack(self, packed: str) -> (str, str, str):
-        name=packed
-        url=""
-        extra=""
-
-        m=re.match('<a href=\"?(.*?)\"?>(.*?)</a>(.*)$', packed, re.IGNORECASE)
-        if m is not None:
-            url=m.groups()[0].strip()
-            name=m.groups()[1].strip()
-            extra=m.groups()[2].strip()
-
-        return name, url, extra
+        return UnpackConNameInfo(packed)
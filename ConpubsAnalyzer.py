@@ -1,79 +1,295 @@
 from __future__ import annotations
 from typing import List
+import argparse
+import os
+import cProfile
+import time
 
-from ConSeries import ConSeriesPage
-from FTP import FTP
+from Crawler import CrawlSite
+from FTPPool import FTPConnectionPool
+from PageCache import PageCache
+from FetchPolicy import RetryingPageSource
+from PageSource import PageSource, FTPPageSource, MirrorPageSource
+from ResultsIndex import ResultsIndex
+from Journal import Journal
+from SeriesWriter import SeriesWriter
+from PdfPages import PdfPageCounter, SetPdfPageCounter
+from SiteServer import SiteModel, SiteServer
+from Scheduler import SeriesCosts
+from Digests import SeriesDigests
+from FileIndex import FileIdentityIndex, SetFileIndex
+from Shards import ParseShard, ShardArgument, SelectShard, PartialResultsWriter, MergePartials
+from Instrumentation import InstrumentedPageSource, EnableInstrumentation, RecordTime, Observe, Summary
 from ConpubsCounts import ConpubsCounts, NameLinkCounts
 
-from HelpersPackage import ExtractInvisibleTextInsideFanacComment, FindBracketedText2, FindLinkInString
+from PageHeader import PageHeader
+
+from HelpersPackage import FindLinkInString
 from Log import LogOpen, Log
+import LogLevels
+from LogLevels import SetLogLevel, LogInfo
 
 
 def main():
+    parser=argparse.ArgumentParser(description="Count the convention publications on fanac.org")
+    parser.add_argument("--mirror", metavar="DIR", default="", help="Read the site from a local mirror rooted at DIR instead of from the server")
+    parser.add_argument("--workers", type=int, default=1, help="Number of pages to download at once, each over its own FTP connection (default 1: serial)")
+    parser.add_argument("--parse-processes", type=int, default=0, help="Parse and count pages in this many separate processes (default 0: parse as pages are downloaded)")
+    parser.add_argument("--cache", metavar="DIR", default="", help="Keep downloaded pages in DIR and only download pages which have changed")
+    parser.add_argument("--cache-max-mb", type=float, default=500, help="Largest size the page cache may grow to (default 500MB)")
+    parser.add_argument("--cache-max-age", type=float, default=365, help="Drop cached pages not used in this many days (default 365)")
+    parser.add_argument("--refresh", action="store_true", help="Ignore the page cache's contents and download every page again")
+    parser.add_argument("--timeout", type=float, default=60, help="Give up on an FTP operation after this many seconds (default 60)")
+    parser.add_argument("--retries", type=int, default=4, help="Retry a failed page fetch this many times before giving up on the page (default 4)")
+    parser.add_argument("--backoff", type=float, default=1.0, help="Base delay between retries, in seconds; it doubles with each retry (default 1)")
+    parser.add_argument("--index", metavar="FILE", default="", help="Incremental mode: keep the results of each page in FILE and only parse the pages which have changed")
+    parser.add_argument("--no-digests", action="store_true", help="With --index, crawl every series, even those whose pages' sizes and mtimes show that they haven't changed")
+    parser.add_argument("--journal", metavar="FILE", default="Journal -- ConpubsAnalyzer.jsonl", help="Checkpoint completed series and con instances to FILE")
+    parser.add_argument("--resume", action="store_true", help="Resume an interrupted run from its journal, skipping the work it completed")
+    parser.add_argument("--in-order", action="store_true", help="Start the series in the site's order, rather than the biggest (as of the last run) first")
+    parser.add_argument("--output", metavar="FILE", default="", help="Write each series' counts to FILE as soon as it is done ('-' for stdout)")
+    parser.add_argument("--format", choices=["jsonl", "csv"], default="", help="Format of --output (default: csv if FILE ends in .csv, otherwise jsonl)")
+    parser.add_argument("--pdf-mirror", metavar="DIR", default="", help="Fill in missing page counts by counting the pages of the PDFs in a local mirror of the site rooted at DIR")
+    parser.add_argument("--pdf-cache", metavar="FILE", default="PdfPages -- ConpubsAnalyzer.json", help="Cache of PDF page counts (by file size and mtime) for --pdf-mirror")
+    parser.add_argument("--pdf-processes", type=int, default=os.cpu_count() or 1, help="Number of processes counting PDF pages (default: one per CPU)")
+    parser.add_argument("--dedup", action="store_true", help="Also report the totals with each file counted once, however many rows and con instances list it")
+    parser.add_argument("--shard", metavar="I/N", type=ShardArgument, default="", help="Only do shard I of N (1 <= I <= N): the series whose names hash to it")
+    parser.add_argument("--series", metavar="NAME", action="append", default=[], help="Only do this series (may be given more than once)")
+    parser.add_argument("--partial", metavar="FILE", default="", help="Write this run's per-series counts to FILE for a later --merge")
+    parser.add_argument("--merge", metavar="FILE", nargs="+", default=[], help="Don't crawl: combine these partial results files into the report for the whole site")
+    parser.add_argument("--serve", metavar="PORT", type=int, default=0, help="Don't crawl once: keep the site in memory, refresh it in the background and answer queries over HTTP on PORT")
+    parser.add_argument("--host", default="127.0.0.1", help="The address --serve listens on (default 127.0.0.1: this machine only)")
+    parser.add_argument("--refresh-minutes", type=float, default=60, help="How often --serve refreshes the site (default 60)")
+    parser.add_argument("--profile", metavar="FILE", default="", help="Write a cProfile dump of the run to FILE and log a table of stage timings and the slowest series and pages")
+    parser.add_argument("--debug", action="store_true", help="Log the full per-tag and per-row parse trace")
+    parser.add_argument("--quiet", action="store_true", help="Log only errors and the final totals")
+    args=parser.parse_args()
+
     LogOpen("Log -- ConpubsAnalyzer.txt", "Log (Errors) -- ConpubsAnalyzer.txt")
+    if args.debug:
+        SetLogLevel(LogLevels.Debug)
+    elif args.quiet:
+        SetLogLevel(LogLevels.Quiet)
+
+    if len(args.merge) > 0:
+        exit(MergePartialResults(args.merge))
 
-    f=FTP()
-    if not f.OpenConnection("FTP Credentials.json"):
-        Log("Main: OpenConnection('FTP Credentials.json' failed")
+    profiler=None
+    if args.profile != "":
+        EnableInstrumentation()
+        profiler=cProfile.Profile()     # This profiles the main thread; the stage timings cover the worker threads and processes as well
+        profiler.enable()
+
+    source=OpenPageSource(args)
+    if source is None:
         exit(0)
 
-    Log("Loading root/index.html")
-    file=FTP().GetFileAsString("", "index.html")
+    pdfCounter=None
+    if args.pdf_mirror != "":
+        pdfCounter=PdfPageCounter(args.pdf_mirror, args.pdf_cache, processes=args.pdf_processes)
+        SetPdfPageCounter(pdfCounter)
+
+    if args.serve > 0:
+        SiteServer(SiteModel(source, DownloadMainConlist, workers=args.workers), args.host, args.serve, refreshMinutes=args.refresh_minutes).Run()
+        if pdfCounter is not None:
+            pdfCounter.Close()
+        source.Close()
+        exit(0)
+
+    LogInfo("Loading root/index.html")
+    file=source.GetFileAsString("", "index.html")
     if file is None:
         assert False
 
     # The main page is in V2 (or later) format
-    version=ExtractInvisibleTextInsideFanacComment(file, "version")
+    header=PageHeader(file)
+    version=header.Version
     if version == "":
         version="2.0"
 
-    listOfConSeries=DownloadMainConlist()
-    #listOfConSeries=[x for x in listOfConSeries if "Worldcon" in x.name]#  or "Khan" in x .name]
+    listOfConSeries=DownloadMainConlist(source, header)
+
+    # Select the series to do in this run
+    site=[x.name for x in listOfConSeries]
+    if len(args.series) > 0:
+        wanted=set(args.series)
+        listOfConSeries=[x for x in listOfConSeries if x.name in wanted]
+    if args.shard != "":
+        listOfConSeries=SelectShard(listOfConSeries, *ParseShard(args.shard))
+    if len(listOfConSeries) < len(site):
+        LogInfo("Main: doing %d of the site's %d series", len(listOfConSeries), len(site))
+
+    index=None
+    if args.index != "":
+        index=ResultsIndex(args.index)
 
-    FTP().SetLogging(False)
+    # The sizes of the series in the last run, from its journal (before it's started again) and the index, so that the
+    #   biggest can be started first
+    costs={}
+    if not args.in_order:
+        costs=SeriesCosts(Journal.SeriesCountsIn(args.journal), index.SeriesTotals() if index is not None else {})
 
-    # Walk the list of ConSeries, loading each in turn
+    journal=Journal(args.journal, resume=args.resume)
+
+    # With an index, the series whose pages are all unchanged since the last run aren't crawled at all
+    # (Not with --pdf-mirror, though: the PDFs may have changed even if the pages haven't.)
+    digests=None
+    unchanged={}
+    if index is not None and pdfCounter is None and not args.no_digests:
+        digests=SeriesDigests(source, index)
+        unchanged=digests.FindUnchanged(listOfConSeries, args.workers)
+
+    writer=None
+    if args.output != "":
+        writer=SeriesWriter(args.output, args.format)
+    partial=None
+    if args.partial != "":
+        partial=PartialResultsWriter(args.partial, site, shard=args.shard, series=args.series)
+
+    # Walk the list of ConSeries, loading each one and its con instances
+    # Each series' counts are logged (and written out) as it is finished; only the running total and the changes are kept
+    fileIndex=None
+    if args.dedup:
+        fileIndex=FileIdentityIndex()
+        SetFileIndex(fileIndex)
+
+    LogInfo("\n\n")
     cpc=ConpubsCounts()
-    csplist: List[ConpubsCounts]=[]
-    for csnl in listOfConSeries:
-        csp=ConSeriesPage(csnl.name)
-        counts=csp.Counts
+    changes=[]
+    for csnl, counts in zip(listOfConSeries, CrawlSite(listOfConSeries, source, args.workers, index=index, parseProcesses=args.parse_processes, journal=journal,
+                                                                   costs=costs, unchanged=unchanged)):
         counts.title=csnl.name
-        csplist.append(counts)
         cpc+=counts
+        LogInfo("%s", counts)
+        if writer is not None:
+            writer.Write(counts)
+        if partial is not None:
+            partial.Write(counts)
+        if index is not None:
+            changes.extend(index.UpdateSeriesTotals([counts]))
+        if digests is not None:
+            digests.Update(counts, source.FailedPages)
+    journal.Close()
+    if pdfCounter is not None:
+        pdfCounter.Close()
+    if writer is not None:
+        writer.Close()
+    if partial is not None:
+        partial.Close()
 
-    Log("\n\n")
-    for csp in csplist:
-        Log(f"{csp}")
+    # Report which series' totals have changed since the last run
+    if index is not None:
+        LogInfo("\n%d series have changed since the last run:", len(changes))
+        for new, old in changes:
+            LogInfo("   %s", new)
+            LogInfo("      was: %s", "(new)" if old is None else old)
+        index.Close()
+
+    failedPages=source.FailedPages
+    source.Close()
+
+    # Report the pages which could not be read even after retrying.  Their counts are missing from the totals.
+    if len(failedPages) > 0:
+        Log(f"\n{len(failedPages)} pages could not be read and were not counted:", isError=True)
+        for page in failedPages:
+            Log(f"   {page}", isError=True)
+
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+        for line in Summary():
+            Log(line, isError=True)
 
     Log("\nGrand Total: "+cpc.Debug(), isError=True)
 
+    # The same, with each file counted just once (see FileIndex.py)
+    if fileIndex is not None:
+        Log(f"Deduplicated Total: {fileIndex.Totals(cpc).Debug()}   ({fileIndex.NumFiles} distinct files in {fileIndex.NumAppearances} rows)", isError=True)
+        if fileIndex.NumUncovered > 0:
+            Log(f"   {fileIndex.NumUncovered} con instances or series completed in an earlier run have no stored rows (run with --index) and are missing from it", isError=True)
+
+
+###############################################################################
+# Combine the partial results files of a sharded run and report them as main() would.  Returns the exit code.
+def MergePartialResults(filenames: list[str]) -> int:
+    csplist, problems=MergePartials(filenames)
+    cpc=ConpubsCounts()
+    LogInfo("\n\n")
+    for counts in csplist:
+        cpc+=counts
+        LogInfo("%s", counts)
+
+    if len(problems) > 0:
+        Log("\nThe partial results do not cover the site exactly once:", isError=True)
+        for problem in problems:
+            Log(f"   {problem}", isError=True)
+        Log("\nIncomplete Total: "+cpc.Debug(), isError=True)
+        return 1
+
+    Log("\nGrand Total: "+cpc.Debug(), isError=True)
+    return 0
+
+
+###############################################################################
+# Set up the PageSource selected on the command line.  Returns None if it can't be opened.
+# The source is layered: retries on the outside, then the page cache (if any), then the mirror or the FTP server
+def OpenPageSource(args) -> RetryingPageSource|None:
+    if args.mirror != "":
+        source=MirrorPageSource(args.mirror)
+        if args.profile != "":
+            source=InstrumentedPageSource(source)
+    else:
+        # The pages are always fetched over a pool of FTP connections (of just one, with one worker) rather than through FTP():
+        #   the pool's sessions time out, reconnect after a failure and raise PageFetchError, so that a page which can't be
+        #   read is retried and then reported rather than counted as empty.  It also gives the file metadata that the page
+        #   cache and the series digests need.
+        source=FTPConnectionPool("FTP Credentials.json", size=args.workers, timeout=args.timeout)
+        if not source.Open():
+            Log("Main: FTPConnectionPool.Open() failed")
+            return None
+        if args.profile != "":
+            source=InstrumentedPageSource(source)
+
+    if args.cache != "":
+        source=PageCache(source, args.cache, maxMB=args.cache_max_mb, maxAgeDays=args.cache_max_age, forceRefresh=args.refresh)
+    return RetryingPageSource(source, maxRetries=args.retries, backoff=args.backoff)
+
 
 ###############################################################################
 
 
 # (Heavily) modified version of function of same name from ConEditor
-def DownloadMainConlist() -> list[NameLinkCounts]:
+# If root/index.html has already been loaded, pass in its PageHeader so that it isn't downloaded and scanned again
+def DownloadMainConlist(source: PageSource|None=None, header: PageHeader|None=None) -> list[NameLinkCounts]:
 
-    Log("Loading root/index.html")
-    file=FTP().GetFileAsString("", "index.html")
-    if file is None:
-        return []
+    if header is None:
+        if source is None:
+            source=FTPPageSource()
+        LogInfo("Loading root/index.html")
+        file=source.GetFileAsString("", "index.html")
+        if file is None:
+            return []
+        header=PageHeader(file)
 
-    table, rest=FindBracketedText2(file, "fanac-table", caseInsensitive=True)
-    tbody, _=FindBracketedText2(table, "tbody", caseInsensitive=True)
+    start=time.perf_counter()
+    scanner=header.Scanner
+    table=header.Table
+    if table is None:
+        return []
+    tbody=scanner.Find("tbody", table.contentStart, table.contentEnd)
+    if tbody is None:
+        return []
 
     listOfConSeries=[]
-    while True:
-        tr, tbody=FindBracketedText2(tbody, "tr", caseInsensitive=True)
-        if tr == "":
-            break
-        td, _=FindBracketedText2(tr, "td", caseInsensitive=True)
+    for tr in scanner.FindAll("tr", tbody.contentStart, tbody.contentEnd):
+        td=scanner.Contents(scanner.Find("td", tr.contentStart, tr.contentEnd))
         if "----" in td:
             continue  # Skip over dividing lines
         _, link, text, _=FindLinkInString(td)
         listOfConSeries.append(NameLinkCounts(Name=text, URL=link))
 
+    RecordTime("parse.main", time.perf_counter()-start, "/index.html")
+    Observe("rows.main", len(listOfConSeries))
     return listOfConSeries
 
 
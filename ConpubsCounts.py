@@ -1,9 +1,16 @@
 from __future__ import annotations
 
+import sys
+
 class ConpubsCounts():
 
+    # The members which hold counts (everything but the title)
+    Fields=("numpdfs", "numpages", "numimages", "numcons", "numseries", "numlinks")
+
+    __slots__=("title",)+Fields
+
     def __init__(self):
-        self.title: str=""      # We can add a title to a cpc.  Note that it does not copy or add, though it is not destroyed by something being added to it
+        self.title: str=""      # We can add a title to a cpc.  Note that it does not add: the sum has the title of the left-hand side
         self.numpdfs: int=0     # Number of PDFs
         self.numpages: int=0    # Number of pages in all kinds of file
         self.numimages: int=0   # Number of jog/png/gif, etc
@@ -12,13 +19,28 @@ class ConpubsCounts():
         self.numlinks: int=0    # Number of external links
 
 
+    # Adding makes a new ConpubsCounts (with the left-hand title) and changes neither operand.
+    # Since there is no __iadd__, a+=b also leaves the object a was bound to alone.
     def __add__(self, other: ConpubsCounts) -> ConpubsCounts:
-        self.numpdfs+=other.numpdfs
-        self.numpages+=other.numpages
-        self.numimages+=other.numimages
-        self.numcons+=other.numcons
-        self.numseries+=other.numseries
-        self.numlinks+=other.numlinks
+        cpc=ConpubsCounts()
+        cpc.title=self.title
+        cpc.numpdfs=self.numpdfs+other.numpdfs
+        cpc.numpages=self.numpages+other.numpages
+        cpc.numimages=self.numimages+other.numimages
+        cpc.numcons=self.numcons+other.numcons
+        cpc.numseries=self.numseries+other.numseries
+        cpc.numlinks=self.numlinks+other.numlinks
+        return cpc
+
+
+    # The counts as a dict, for saving as json
+    def AsDict(self) -> dict[str, int]:
+        return {x: getattr(self, x) for x in ConpubsCounts.Fields}
+
+
+    def FromDict(self, d: dict[str, int]) -> ConpubsCounts:
+        for x in ConpubsCounts.Fields:
+            setattr(self, x, d.get(x, 0))
         return self
 
 
@@ -55,8 +77,11 @@ class ConpubsCounts():
 
 #-------------------------------------------------------------
 #-------------------------------------------------------------
+# The name of a series or con instance is interned: it turns up over and over (as a dict key, in the journal, the index, ...)
 class NameLinkCounts:
-    def __init__(self, Name: str = "", URL: str="", Counts: ConpubsCounts = ConpubsCounts()):
-        self.name: str=Name
+    __slots__=("name", "URL", "counts")
+
+    def __init__(self, Name: str="", URL: str="", Counts: ConpubsCounts|None=None):
+        self.name: str=sys.intern(Name)
         self.URL: str=URL
-        self.counts: ConpubsCounts=Counts
\ No newline at end of file
+        self.counts: ConpubsCounts=Counts if Counts is not None else ConpubsCounts()     # (Each gets its own)
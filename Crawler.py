@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor, Future
+
+from LogLevels import LogInfo
+from ConSeries import ConSeriesPage
+from ConInstance import ConInstance, CountConFileColumns
+from ConpubsCounts import ConpubsCounts, NameLinkCounts
+from ResultsIndex import ResultsIndex, PageHash, FileRow
+from ParseStage import CrawlSiteWithParseProcesses, SeriesWindow, SumSeries
+from Scheduler import BiggestFirst, Schedule
+from Journal import Journal
+from PageSource import PageFetchError
+from PdfPages import GetPdfPageCounter
+from FileIndex import GetFileIndex
+
+
+#####################################################################################
+# Crawl the whole site, loading the con series pages and con instance pages with a bounded pool of worker threads
+# The crawl is a pipeline of generators (series pages -> con instance counts -> a running sum per series) and the
+#   result is an iterator which yields the counts of each series, in the order of listOfConSeries, as soon as that series
+#   is done.  Only a small window of series is in flight at any time, so memory does not grow with the size of the site.
+# source must be safe to use from several threads at once (e.g., an FTPConnectionPool); maxWorkers is normally the
+#   number of connections it has.
+# Because the instance counts of each series are added up in the series page's order, the results are identical to
+#   loading each ConSeriesPage serially.
+# If a ResultsIndex is supplied, only pages which have changed since they were indexed are parsed and counted.
+# If parseProcesses > 0, the pages are parsed in that many separate processes rather than on the download threads (see ParseStage.py)
+# If a Journal is supplied, each con instance and series is checkpointed to it as it is completed, and anything the
+#   journal shows as completed by an earlier run is not loaded again.
+# A page which can't be read (the source raises PageFetchError) isn't counted, and neither it nor its series is
+#   checkpointed, so that --resume will try it again.
+# If the estimated costs of the series are supplied (see Scheduler.py), a concurrent crawl starts the biggest series first
+# The series in unchanged (name -> counts) are not crawled: their counts are as given.  (See Digests.py.)
+# If there is a FileIdentityIndex (see FileIndex.py), the rows of every con instance are added to it, including those of
+#   the con instances and series which aren't loaded (they come from the ResultsIndex).
+def CrawlSite(listOfConSeries: list[NameLinkCounts], source, maxWorkers: int, index: ResultsIndex|None=None, parseProcesses: int=0,
+              journal: Journal|None=None, costs: dict[str, float]|None=None, unchanged: dict[str, ConpubsCounts]|None=None) -> Iterator[ConpubsCounts]:
+
+    if journal is None and not unchanged:
+        yield from _CrawlSite(listOfConSeries, source, maxWorkers, index, parseProcesses, None, costs or {})
+        return
+
+    def Done(seriesname: str) -> ConpubsCounts|None:
+        counts=journal.SeriesCounts(seriesname) if journal is not None else None
+        if counts is None and unchanged:
+            counts=unchanged.get(seriesname)
+        return counts
+
+    # Crawl just the series which are not done yet, and fill in the rest from the journal (or unchanged) as we go
+    todo=[x for x in listOfConSeries if Done(x.name) is None]
+    if len(todo) < len(listOfConSeries):
+        LogInfo("CrawlSite: skipping %d series completed in an earlier run or unchanged since the last one", len(listOfConSeries)-len(todo))
+    crawled=_CrawlSite(todo, source, maxWorkers, index, parseProcesses, journal, costs or {})
+    fileIndex=GetFileIndex()
+    for csnl in listOfConSeries:
+        counts=Done(csnl.name)
+        if counts is None:
+            counts=next(crawled)
+        elif fileIndex is not None:
+            fileIndex.AddStoredSeries(index, csnl.name)
+        yield counts
+
+
+def _CrawlSite(listOfConSeries: list[NameLinkCounts], source, maxWorkers: int, index: ResultsIndex|None, parseProcesses: int,
+               journal: Journal|None, costs: dict[str, float]) -> Iterator[ConpubsCounts]:
+
+    if parseProcesses > 0:
+        return CrawlSiteWithParseProcesses(listOfConSeries, source, maxWorkers, parseProcesses, index=index, journal=journal, costs=costs)
+    if maxWorkers <= 1:
+        return _CrawlSerially(listOfConSeries, source, index, journal)
+    return _CrawlThreaded(listOfConSeries, source, maxWorkers, index, journal, costs)
+
+
+# The serial path: one series at a time, one con instance at a time
+def _CrawlSerially(listOfConSeries: list[NameLinkCounts], source, index: ResultsIndex|None, journal: Journal|None) -> Iterator[ConpubsCounts]:
+    for csnl in listOfConSeries:
+        series=_LoadSeries(csnl.name, source, index)
+        if series is None:
+            yield _FailedSeriesCounts(csnl.name)
+            continue
+        seriesname, counts, instances=series
+        counts, complete=SumSeries(counts, (_LoadConInstanceCounts(seriesname, name, source, index, journal) for name in instances))
+        if journal is not None and complete:
+            journal.RecordSeries(csnl.name, counts)
+        yield counts
+
+
+# The threaded path
+# A window of series is kept in flight.  Each series page is loaded on a worker, which then queues its con instance
+#   pages behind it, so the workers stay busy with the pages of the next few series while we wait for this one's.
+# The series are started biggest first (see Scheduler.py), but the results are produced in order.
+def _CrawlThreaded(listOfConSeries: list[NameLinkCounts], source, maxWorkers: int, index: ResultsIndex|None, journal: Journal|None,
+                   costs: dict[str, float]) -> Iterator[ConpubsCounts]:
+    with ThreadPoolExecutor(max_workers=maxWorkers, thread_name_prefix="Crawl") as pool:
+
+        # Returns the series' counts so far and the Futures of its con instances' counts, or None if the page can't be read
+        def LoadSeries(seriesname: str) -> tuple[ConpubsCounts, list[Future]]|None:
+            series=_LoadSeries(seriesname, source, index)
+            if series is None:
+                return None
+            seriesname, counts, instances=series
+            LogInfo("CrawlSite: %s: queueing %d con instances", seriesname, len(instances))
+            return counts, [pool.submit(_LoadConInstanceCounts, seriesname, name, source, index, journal) for name in instances]
+
+        # Collect the results, series by series, in the original order, topping up the window as each one is done
+        for i, sf in Schedule(len(listOfConSeries), lambda i: pool.submit(LoadSeries, listOfConSeries[i].name), SeriesWindow(maxWorkers),
+                              BiggestFirst(listOfConSeries, costs)):
+            csnl=listOfConSeries[i]
+            result=sf.result()
+            if result is None:
+                yield _FailedSeriesCounts(csnl.name)
+                continue
+            counts, futures=result
+            counts, complete=SumSeries(counts, (f.result() for f in futures))
+            if journal is not None and complete:
+                journal.RecordSeries(csnl.name, counts)
+            yield counts
+
+
+# Load a series page and return its name, its counts so far and the names of its con instances which have pages
+# Only these are kept: the ConSeriesPage itself is dropped.  Returns None if the page could not be read.
+def _LoadSeries(seriesname: str, source, index: ResultsIndex|None) -> tuple[str, ConpubsCounts, list[str]]|None:
+    try:
+        csp=ConSeriesPage(seriesname, source=source, loadInstances=False, index=index)
+    except PageFetchError:
+        return None     # The page has been listed in the source's FailedPages
+    return csp.Seriesname, csp.Counts, [nlc.name for nlc in csp.ConInstanceNLCs]
+
+
+# The counts of a series whose page never loaded.  It is not journaled, so that --resume will try it again.
+def _FailedSeriesCounts(seriesname: str) -> ConpubsCounts:
+    counts=ConpubsCounts()
+    counts.title=seriesname
+    return counts
+
+
+# Load a single con instance page and return just its counts, or None if it could not be read.  (This is what runs on a worker thread.)
+# With a journal, a con instance completed in an earlier run is not loaded again, and a newly loaded one is checkpointed
+def _LoadConInstanceCounts(seriesname: str, coninstancename: str, source, index: ResultsIndex|None, journal: Journal|None) -> ConpubsCounts|None:
+    if journal is not None:
+        counts=journal.InstanceCounts(seriesname, coninstancename)
+        if counts is not None:
+            if GetFileIndex() is not None:
+                GetFileIndex().AddStored(index, seriesname, coninstancename)
+            return counts
+
+    try:
+        counts=_ReadConInstanceCounts(seriesname, coninstancename, source, index)
+    except PageFetchError:
+        return None     # The page has been listed in the source's FailedPages.  It is not journaled, so that --resume will try it again.
+    if journal is not None:
+        journal.RecordInstance(seriesname, coninstancename, counts)
+    return counts
+
+
+# With an index, the page is only parsed and counted if it has changed; otherwise the stored counts are used.
+def _ReadConInstanceCounts(seriesname: str, coninstancename: str, source, index: ResultsIndex|None) -> ConpubsCounts:
+    fileIndex=GetFileIndex()
+    if index is None:
+        ci=ConInstance("/"+seriesname, coninstancename, source=source)
+        if fileIndex is None:
+            return ci.ComputeCounts
+        columns=ci.ComputeColumns
+        fileIndex.Add(seriesname, coninstancename, ci.ConFiles, columns)
+        return columns.Counts
+
+    page=source.GetFileAsString(f"/{seriesname}/{coninstancename}", "index.html")
+    if page is None:
+        LogInfo("CrawlSite: /%s/%s/index.html does not exist", seriesname, coninstancename)
+        return ConpubsCounts()
+
+    path=f"/{seriesname}/{coninstancename}/index.html"
+    pagehash=PageHash(page)
+    counter=GetPdfPageCounter()
+    files=None
+    columns=None        # The columns the rows were last counted with, if they were
+    counts=index.LookupInstance(path, pagehash)
+    if counts is None:
+        # The index keeps the page's own rows and counts, from before any page counts are filled in from the PDFs
+        files=ConInstance("/"+seriesname, coninstancename, page=page).ConFiles
+        columns=CountConFileColumns("/"+seriesname, coninstancename, files, fillInPages=False)
+        counts=columns.Counts
+        index.StoreInstance(path, seriesname, pagehash, [FileRow(cf) for cf in files], counts)
+    elif counter is not None or fileIndex is not None:
+        files=index.InstanceFiles(path)
+    if counter is not None:
+        # The PDFs may have changed even if the page hasn't, so they're always counted again
+        columns=CountConFileColumns("/"+seriesname, coninstancename, files)
+        counts=columns.Counts
+    if fileIndex is not None:
+        fileIndex.Add(seriesname, coninstancename, files, columns)
+    return counts
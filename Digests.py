@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+
+from Log import Log
+from LogLevels import LogInfo
+from ConpubsCounts import ConpubsCounts, NameLinkCounts
+from ResultsIndex import ResultsIndex
+
+
+#####################################################################################
+# Skipping unchanged series wholesale
+# A series' digest is a hash of the sizes and mtimes of its series page and of each of its con instance pages (as of the
+#   last time the series page was parsed), which is kept in the ResultsIndex along with the series' counts.  If a series'
+#   digest is the same as at the end of the last run, none of its pages has changed, so its stored counts are used and
+#   the series is not crawled at all: no page is downloaded, read from the page cache or parsed.
+# The metadata comes from the source's GetFileMetadata() (MLST on the FTP server, a stat() on a mirror).  A series with
+#   any page whose metadata can't be had gets no digest and is always crawled.  If the source gives no metadata at all,
+#   the digests are turned off (and we say so).
+# The digest is taken before the series is crawled, so a page which changes during the run will show up in the next one.
+#   It's only stored if the crawl of the series succeeded and found the same con instances the digest covered.
+
+
+# The pages a series' digest covers, given the series page's stored series name and con instances (None if we don't know
+#   them yet).  (The con instances are under the stored name, which is not always the series page's directory.)
+def SeriesPages(seriesname: str, stored: tuple[str, list[str]]|None) -> list[tuple[str, str]]:
+    if stored is None:
+        return [(f"/{seriesname}", "index.html")]
+    name, instances=stored
+    return [(f"/{seriesname}", "index.html")]+[(f"/{name}/{x}", "index.html") for x in instances]
+
+
+# The digest of a series, or None if the metadata of one of its pages can't be had
+def SeriesDigest(source, seriesname: str, stored: tuple[str, list[str]]|None) -> str|None:
+    h=hashlib.sha1()
+    for directory, fname in SeriesPages(seriesname, stored):
+        metadata=source.GetFileMetadata(directory, fname)
+        if metadata is None:
+            return None
+        h.update(f"{directory}/{fname}\t{metadata[0]}\t{metadata[1]}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+#####################################################################################
+class SeriesDigests:
+
+    def __init__(self, source, index: ResultsIndex):
+        self._source=source
+        self._index: ResultsIndex=index
+        self._taken: dict[str, tuple[str|None, tuple[str, list[str]]|None]]={}     # Series name -> (digest taken before the crawl, the con instances it covers)
+        self.NumUnchanged: int=0
+
+
+    # ----------------------------------------------
+    # Take the digests of the series and return the stored counts of those which are unchanged (name -> counts)
+    # The metadata is read by up to workers threads at once
+    def FindUnchanged(self, listOfConSeries: list[NameLinkCounts], workers: int) -> dict[str, ConpubsCounts]:
+        if self._source.GetFileMetadata("", "index.html") is None:
+            Log("SeriesDigests: the page source gives no file metadata, so every series will be crawled")
+            return {}
+        totals=self._index.SeriesTotals()
+
+        def Take(seriesname: str) -> tuple[str|None, tuple[str, list[str]]|None]:
+            stored=self._index.SeriesPageInstances(f"/{seriesname}/index.html")
+            return SeriesDigest(self._source, seriesname, stored), stored
+
+        names=[x.name for x in listOfConSeries]
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="Digest") as pool:
+            self._taken=dict(zip(names, pool.map(Take, names)))
+
+        unchanged: dict[str, ConpubsCounts]={}
+        for name, (digest, _) in self._taken.items():
+            if digest is not None and name in totals and digest == self._index.SeriesDigest(name):
+                counts=totals[name]
+                counts.title=name
+                unchanged[name]=counts
+        for name in unchanged:
+            del self._taken[name]       # Their digests are already stored
+        self.NumUnchanged=len(unchanged)
+        LogInfo("SeriesDigests: %d of %d series are unchanged since the last run", len(unchanged), len(names))
+        return unchanged
+
+
+    # Once a series has been crawled, store the digest taken before the crawl, provided that it covered what the crawl found
+    # failedPages are the pages which could not be read in this run
+    def Update(self, counts: ConpubsCounts, failedPages: list[str]) -> None:
+        name=counts.title
+        if name not in self._taken:
+            return
+        digest, stored=self._taken.pop(name)
+        dirs=(f"/{name}/", f"/{stored[0]}/") if stored is not None else (f"/{name}/",)
+        if digest is not None and counts.numseries == 1 and not any(x.startswith(dirs) for x in failedPages) \
+                and stored == self._index.SeriesPageInstances(f"/{name}/index.html"):
+            self._index.StoreSeriesDigest(name, digest)
+        else:
+            self._index.StoreSeriesDigest(name, None)
@@ -0,0 +1,246 @@
+from __future__ import annotations
+
+import ftplib
+import io
+import json
+import queue
+import threading
+import time
+
+from Log import LogError
+from LogLevels import LogInfo
+from PageSource import PageSource, PageFetchError
+
+
+#####################################################################################
+# A pool of independent FTP sessions, all logged in with the same credentials as FTP()
+# FTP() is a single shared session, so it can only have one transfer in flight at a time.  The pool lets several
+#   worker threads fetch pages at once, each on its own session.
+# It is a PageSource, so it supports just the part of the FTP() interface that the analyzer uses to read pages.
+# The credentials file is the one FTP() uses: {"host": ..., "ID": ..., "PW": ..., "root": ...}.  It may also give a "port"
+#   and "tls": false for a plain FTP server (e.g., pyftpdlib serving a local directory, as a stand-in for tests).
+# Sessions are reused.  One which has been idle for more than healthCheckAfter seconds (and so may have been dropped by
+#   the server) is checked with a NOOP before it is handed out, and replaced if it has gone bad.
+class FTPConnectionPool(PageSource):
+
+    # timeout (in seconds) applies to each network operation, so a stalled transfer fails rather than blocking forever
+    def __init__(self, credentialsFilename: str, size: int=4, timeout: float=60, healthCheckAfter: float=30):
+        self._credentialsFilename: str=credentialsFilename
+        self._timeout: float=timeout
+        self._healthCheckAfter: float=healthCheckAfter
+        self._credentials: dict={}
+        self._size: int=max(1, size)
+        self._idle: queue.LifoQueue[tuple[ftplib.FTP, float]]=queue.LifoQueue()    # (session, when it was released)
+        self._numOpen: int=0
+        self._useMlst: bool=True       # Cleared if the server turns out not to support MLST
+        self._lock=threading.Lock()
+
+        self.NumConnects: int=0        # Sessions opened, including the first
+        self.NumDropped: int=0         # Sessions thrown away because they failed a health check
+
+
+    @property
+    def Size(self) -> int:
+        return self._size
+
+
+    # ----------------------------------------------
+    # Read the credentials and make sure we can log in.  The first session is kept for use.
+    def Open(self) -> bool:
+        try:
+            with open(self._credentialsFilename) as f:
+                self._credentials=json.loads(f.read())
+        except (FileNotFoundError, json.decoder.JSONDecodeError) as e:
+            LogError(f"FTPConnectionPool.Open: Can't read credentials file '{self._credentialsFilename}': {e}")
+            return False
+
+        try:
+            ftp=self._Connect()
+        except ftplib.all_errors as e:
+            LogError(f"FTPConnectionPool.Open: Can't connect to {self._credentials.get('host')}: {e}")
+            return False
+        with self._lock:
+            self._numOpen+=1
+        self._Release(ftp)
+        return True
+
+
+    # ----------------------------------------------
+    def Close(self) -> None:
+        while not self._idle.empty():
+            ftp, _=self._idle.get_nowait()
+            try:
+                ftp.quit()
+            except ftplib.all_errors:
+                ftp.close()
+        with self._lock:
+            self._numOpen=0
+        LogInfo("FTPConnectionPool: opened %d sessions, dropped %d which had gone bad while idle", self.NumConnects, self.NumDropped)
+
+
+    # ----------------------------------------------
+    def _Connect(self) -> ftplib.FTP:
+        if self._credentials.get("tls", True):
+            ftp=ftplib.FTP_TLS(timeout=self._timeout)
+        else:
+            ftp=ftplib.FTP(timeout=self._timeout)
+        try:
+            ftp.connect(self._credentials["host"], int(self._credentials.get("port", 21)))
+            ftp.login(self._credentials["ID"], self._credentials["PW"])
+            if isinstance(ftp, ftplib.FTP_TLS):
+                ftp.prot_p()
+        except ftplib.all_errors:
+            ftp.close()
+            raise
+        with self._lock:
+            self.NumConnects+=1
+        return ftp
+
+
+    # ----------------------------------------------
+    # Get an idle session, opening a new one if we're not yet at the pool size.  Otherwise wait for one to be released.
+    # A session which failed was discarded, so this is also how we reconnect.
+    def _Acquire(self) -> ftplib.FTP:
+        while True:
+            try:
+                ftp, released=self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if self._IsHealthy(ftp, released):
+                return ftp
+
+        with self._lock:
+            canOpen=self._numOpen < self._size
+            if canOpen:
+                self._numOpen+=1
+        if canOpen:
+            try:
+                return self._Connect()
+            except ftplib.all_errors as e:
+                with self._lock:
+                    self._numOpen-=1
+                raise PageFetchError(f"Can't connect to {self._credentials.get('host')}: {e}") from e
+
+        # We'll have to wait.  (If what we get has gone bad, start again: we'll be able to open a new one.)
+        ftp, released=self._idle.get()
+        if self._IsHealthy(ftp, released):
+            return ftp
+        return self._Acquire()
+
+
+    def _Release(self, ftp: ftplib.FTP) -> None:
+        self._idle.put((ftp, time.monotonic()))
+
+
+    # A session which has only been idle a short while is assumed to be good; otherwise we ask the server
+    # If it has gone bad, it's discarded
+    def _IsHealthy(self, ftp: ftplib.FTP, released: float) -> bool:
+        if time.monotonic()-released < self._healthCheckAfter:
+            return True
+        try:
+            ftp.voidcmd("NOOP")
+            return True
+        except ftplib.all_errors as e:
+            LogInfo("FTPConnectionPool: dropping a session which has gone bad: %s", e)
+            self._Discard(ftp)
+            with self._lock:
+                self.NumDropped+=1
+            return False
+
+
+    # Throw away a session which has failed
+    def _Discard(self, ftp: ftplib.FTP) -> None:
+        ftp.close()
+        with self._lock:
+            self._numOpen-=1
+
+
+    # ----------------------------------------------
+    # Turn a directory and filename into a single server path
+    # The callers are not consistent about leading and doubled slashes (e.g., "//Boskone/Boskone 1"), so we clean them up
+    def _Path(self, directory: str, fname: str) -> str:
+        parts=PageSource.PathParts(directory, fname)
+        root=self._credentials.get("root", "")
+        if root != "":
+            parts=[x for x in root.split("/") if x != ""]+parts
+        return "/"+"/".join(parts)
+
+
+    # ----------------------------------------------
+    # Download a file and return it as a string.  Returns None if the file does not exist or can't be read.
+    def GetFileAsString(self, directory: str, fname: str) -> str|None:
+        path=self._Path(directory, fname)
+        ftp=self._Acquire()
+        buffer=io.BytesIO()
+        try:
+            ftp.retrbinary(f"RETR {path}", buffer.write)
+        except ftplib.error_perm as e:
+            # The server answered, but the file isn't there.  The session is still good.
+            self._Release(ftp)
+            LogInfo("FTPConnectionPool.GetFileAsString: '%s' could not be read: %s", path, e)
+            return None
+        except ftplib.all_errors as e:
+            # Anything else (a dropped connection, a timeout, ...) leaves the session in an unknown state, so we drop it
+            self._Discard(ftp)
+            raise PageFetchError(f"FTPConnectionPool.GetFileAsString: '{path}' failed: {e}") from e
+        self._Release(ftp)
+
+        return buffer.getvalue().decode("utf-8", errors="replace")
+
+
+    # ----------------------------------------------
+    # Get a file's size and modification time without downloading it
+    # This is one MLST command if the server supports it, and otherwise SIZE and MDTM.  (See _MlstMtime() for how their mtimes are made to agree.)
+    # Returns None if the file does not exist or the server won't say
+    def GetFileMetadata(self, directory: str, fname: str) -> tuple[int, str]|None:
+        path=self._Path(directory, fname)
+        ftp=self._Acquire()
+        try:
+            metadata=self._Mlst(ftp, path) if self._useMlst else self._SizeMdtm(ftp, path)
+        except ftplib.error_perm as e:
+            self._Release(ftp)
+            LogInfo("FTPConnectionPool.GetFileMetadata: '%s': %s", path, e)
+            return None
+        except ftplib.all_errors as e:
+            self._Discard(ftp)
+            raise PageFetchError(f"FTPConnectionPool.GetFileMetadata: '{path}' failed: {e}") from e
+        self._Release(ftp)
+        return metadata
+
+
+    # The reply is "250-...", then " type=file;size=1234;modify=20240131235959; /path", then "250 ..."
+    def _Mlst(self, ftp: ftplib.FTP, path: str) -> tuple[int, str]|None:
+        try:
+            reply=ftp.sendcmd(f"MLST {path}")
+        except ftplib.error_perm as e:
+            if not str(e).startswith(("500", "502")):
+                raise
+            LogInfo("FTPConnectionPool: the server doesn't support MLST, so SIZE and MDTM will be used")
+            self._useMlst=False
+            return self._SizeMdtm(ftp, path)
+
+        lines=reply.splitlines()
+        if len(lines) < 2:
+            return None
+        facts={}
+        for fact in lines[1].strip().partition(" ")[0].split(";"):
+            name, _, value=fact.partition("=")
+            facts[name.lower()]=value
+        if facts.get("type", "file").lower() != "file" or "size" not in facts or "modify" not in facts:
+            return None
+        return int(facts["size"]), _MlstMtime(facts["modify"])
+
+
+    def _SizeMdtm(self, ftp: ftplib.FTP, path: str) -> tuple[int, str]|None:
+        ftp.voidcmd("TYPE I")       # SIZE is only reliable in binary mode
+        size=ftp.size(path)
+        mdtm=ftp.sendcmd(f"MDTM {path}")     # The reply is "213 YYYYMMDDhhmmss"
+        if size is None:
+            return None
+        return size, mdtm[4:].strip()     # (As it always has been, so that the page cache's entries stay valid)
+
+
+# MLST's modify fact may give fractions of a second, which MDTM (which the page cache's entries were made with) usually
+#   doesn't, so they're dropped
+def _MlstMtime(mtime: str) -> str:
+    return mtime.strip().partition(".")[0]
@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import json
+
+from HelpersPackage import Float0
+from ConFileData import ConFileData
+
+
+#####################################################################################
+# Decoding for the legacy (version 0) fanac-json pages
+# The json in these pages is nested: the page's json holds its _datasource as a string of json, and that in turn holds
+#   each row (or con) as yet another string of json.  Rather than calling json.loads() once per row, the rows' strings
+#   are joined into a single json array and decoded in one call.
+
+
+# Decode a list of strings of json, each holding one object
+def LoadJsonRows(rows: list[str]) -> list[dict]:
+    if len(rows) == 0:
+        return []
+    decoded=json.loads("["+",".join(rows)+"]")
+    if len(decoded) != len(rows):
+        # A row which isn't a single json value (e.g., "1, 2") would throw the joined array off, so fall back to decoding them one by one
+        decoded=[json.loads(row) for row in rows]
+    return decoded
+
+
+# ----------------------------------------------
+# Decode the _conFileList of a con instance page's _datasource into its ConFileData rows
+# Each row carries its own "ver", and newer versions add members:
+#   ver 5   _sitefilename (before this, or if it's blank, the display title is used)
+#   ver 6   _isText
+#   ver 7   _pages
+#   ver 8   _isLink
+#   ver 9   _URL
+# (This decodes each row straight into a ConFileData, and matches what used to be made via ConInstanceLine.  In
+#   particular, _notes and _URL are not carried over.)
+def DecodeConFileList(rows: list[str]) -> list[ConFileData]:
+    files=[]
+    for d in LoadJsonRows(rows):
+        ver=d["ver"]
+        cf=ConFileData()
+        cf.DisplayTitle=d["_displayTitle"]
+        size=Float0(d["_size"])
+        if size > 500:  # We're looking for a value in MB, but if we get a value in bytes, convert it
+            size=size/(1024**2)
+        cf.Size=size
+        if ver > 4:
+            cf.SiteFilename=d["_sitefilename"]
+        if ver <= 4 or cf.SiteFilename.strip() == "":
+            cf.SiteFilename=cf.DisplayTitle
+        if ver > 5:
+            cf.IsTextRow=d["_isText"]
+        cf.Pages=d["_pages"] if ver > 6 else None
+        if ver > 7:
+            cf.IsLinkRow=d["_isLink"]
+        files.append(cf)
+    return files
@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import random
+import threading
+import time
+
+from Log import LogError
+from LogLevels import LogInfo
+from PageSource import PageSource, PageFetchError
+
+
+#####################################################################################
+# A PageSource which retries failed fetches of the source behind it
+# A fetch which raises PageFetchError is retried up to maxRetries times, waiting an exponentially growing, randomly
+#   jittered time between tries so that a struggling server isn't hammered by all the workers at once.  (The source
+#   is responsible for reconnecting; FTPConnectionPool drops a failed session and opens a fresh one for the next try.)
+# If a page still can't be read, PageFetchError is raised again.  The page is also remembered in FailedPages so that the
+#   run can report which pages were not counted.
+class RetryingPageSource(PageSource):
+
+    def __init__(self, source: PageSource, maxRetries: int=4, backoff: float=1.0, maxDelay: float=60):
+        self._source: PageSource=source
+        self._maxRetries: int=maxRetries
+        self._backoff: float=backoff        # The base delay, in seconds
+        self._maxDelay: float=maxDelay
+        self._lock=threading.Lock()
+        self.FailedPages: list[str]=[]      # The pages which never loaded
+        self.NumRetries: int=0
+
+
+    def Close(self) -> None:
+        self._source.Close()
+
+
+    # ----------------------------------------------
+    # Call fetch until it succeeds or we run out of retries
+    # If isPage, a fetch which never succeeds is recorded in FailedPages and the error is raised again
+    # If not (it's metadata), it is just reported missing: the caller can still go on and read the page.
+    def _Try(self, what: str, path: str, fetch, isPage: bool):
+        attempt=0
+        while True:
+            try:
+                return fetch()
+            except PageFetchError as e:
+                if attempt >= self._maxRetries:
+                    if not isPage:
+                        LogInfo("RetryingPageSource: giving up on %s of '%s': %s", what, path, e)
+                        return None
+                    LogError(f"RetryingPageSource: giving up on {what} of '{path}' after {attempt+1} tries: {e}")
+                    with self._lock:
+                        self.FailedPages.append(path)
+                    raise
+                delay=random.uniform(0, min(self._maxDelay, self._backoff*2**attempt))     # "Full jitter"
+                LogInfo("RetryingPageSource: %s of '%s' failed (%s); retrying in %.1fs", what, path, e, delay)
+                with self._lock:
+                    self.NumRetries+=1
+                time.sleep(delay)
+                attempt+=1
+
+
+    def GetFileAsString(self, directory: str, fname: str) -> str|None:
+        path="/"+"/".join(PageSource.PathParts(directory, fname))
+        return self._Try("read", path, lambda: self._source.GetFileAsString(directory, fname), True)
+
+
+    def GetFileMetadata(self, directory: str, fname: str) -> tuple[int, str]|None:
+        path="/"+"/".join(PageSource.PathParts(directory, fname))
+        return self._Try("metadata", path, lambda: self._source.GetFileMetadata(directory, fname), False)
@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+from array import array
+
+from ConpubsCounts import ConpubsCounts
+from ConFileData import ConFileData, FileKind, KindPdf, KindImage
+from HelpersPackage import Float0, Int0
+
+
+#####################################################################################
+# The counted file rows of a con instance, held column by column in typed arrays rather than as one object per row
+# Each row which counts (i.e., not a text or empty row) contributes its kind (see FileKind()), its page count, its size
+#   in MB and whether it is a link.  The counts are then reduced over whole columns at once (array.count() and sum() run
+#   in C), so no ConpubsCounts is made for a single row.
+class FileColumns:
+
+    def __init__(self, files: list[ConFileData]|None=None):
+        self.Kinds=array("b")
+        self.Pages=array("q")
+        self.Sizes=array("d")
+        self.Links=array("b")
+        if files is not None:
+            self.Extend(files)
+
+
+    def __len__(self) -> int:
+        return len(self.Kinds)
+
+
+    # ----------------------------------------------
+    # Add the rows which count
+    def Extend(self, files: list[ConFileData]) -> FileColumns:
+        rows=[cf for cf in files if not cf.IsTextRow and not cf.IsEmptyRow]
+        self.Kinds.extend([FileKind(cf.SiteFilename) for cf in rows])
+        self.Pages.extend([Int0(cf.Pages) for cf in rows])
+        self.Sizes.extend([Float0(cf.Size) for cf in rows])
+        self.Links.extend([1 if cf.IsLinkRow else 0 for cf in rows])
+        return self
+
+
+    # ----------------------------------------------
+    # Reduce the columns to a ConpubsCounts
+    @property
+    def Counts(self) -> ConpubsCounts:
+        cpc=ConpubsCounts()
+        cpc.numpdfs=self.Kinds.count(KindPdf)
+        cpc.numimages=self.Kinds.count(KindImage)
+        cpc.numlinks=self.Links.count(1)
+        cpc.numpages=sum(self.Pages)
+        return cpc
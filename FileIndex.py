@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import posixpath
+import threading
+from urllib.parse import unquote, urlsplit
+
+from HelpersPackage import Float0, Int0
+from ConpubsCounts import ConpubsCounts
+from ConFileData import ConFileData, FileKind, KindPdf, KindImage
+from FileColumns import FileColumns
+from PageSource import PageSource
+from PdfPages import GetPdfPageCounter
+from ResultsIndex import ResultsIndex
+
+
+#####################################################################################
+# A site-wide index of the files the con instance pages list, so that each file can be counted once
+# A file's key is its normalized path and its size.  For a file row, the path is /<series>/<con instance>/<SiteFilename>
+#   with any #fragment or ?query dropped; for a link row, it is the URL (resolved against the con instance's directory).
+# Totals() combines the rows listing a file: it has their largest page count, is a PDF (or image) if any of them is, and
+#   is a link only if all of them are.
+
+
+# The identity of a file: (normalized path, size in MB)
+FileKey=tuple[str, float]
+
+
+# ----------------------------------------------
+def FileIdentity(seriesname: str, coninstancename: str, cf: ConFileData) -> FileKey:
+    return _Identity(_Directory(seriesname, coninstancename), cf)
+
+
+# The con instance's directory, normalized
+def _Directory(seriesname: str, coninstancename: str) -> str:
+    return _Resolve("/", "/".join(PageSource.PathParts(seriesname, coninstancename)))
+
+
+def _Identity(directory: str, cf: ConFileData) -> FileKey:
+    if cf.IsLinkRow:
+        parts=urlsplit(cf.SiteFilename.strip())
+        if parts.scheme != "" or parts.netloc != "":
+            path=f"{parts.scheme.lower()}://{parts.netloc.lower()}{unquote(parts.path)}"
+            if parts.query != "":
+                path+="?"+parts.query
+        else:
+            path=_Resolve(directory, parts.path)
+    else:
+        path=_Resolve(directory, cf.SiteFilename.partition("#")[0].partition("?")[0])
+    return path, round(Float0(cf.Size), 2)
+
+
+def _Resolve(directory: str, relpath: str) -> str:
+    relpath=relpath.strip()
+    if relpath != "" and "/" not in relpath and "%" not in relpath and relpath != "." and relpath != "..":
+        return directory+"/"+relpath    # Nearly every file row: a plain name in the con instance's directory
+    path=posixpath.normpath(posixpath.join(directory, unquote(relpath)))
+    return path[1:] if path.startswith("//") else path     # (normpath keeps a leading "//")
+
+
+# The entries which a con instance's rows add to the index: (key, pages, is a link, kind)
+# Text rows and empty rows are not files, and aren't counted, so they're left out
+# If the rows have just been counted, pass their columns (see CountConFileColumns()): the kinds and page counts are then
+#   taken from them rather than worked out a second time.  (The columns hold just the counted rows, in order.)
+FileEntry=tuple[FileKey, int, bool, int]
+
+def FileEntries(seriesname: str, coninstancename: str, files: list[ConFileData], columns: FileColumns|None=None) -> list[FileEntry]:
+    directory=_Directory(seriesname, coninstancename)
+    rows=[cf for cf in files if not cf.IsTextRow and not cf.IsEmptyRow]
+    if columns is None:
+        return [(_Identity(directory, cf), Int0(cf.Pages), bool(cf.IsLinkRow), FileKind(cf.SiteFilename)) for cf in rows]
+    return [(_Identity(directory, cf), pages, link == 1, kind) for cf, kind, pages, link in zip(rows, columns.Kinds, columns.Pages, columns.Links)]
+
+
+#####################################################################################
+class FileIdentityIndex:
+
+    def __init__(self):
+        # File -> (con instance, pages, is a link, kind) of each row listing it.  (Most files are listed just once, so these
+        #   are kept as flat lists, which take much less memory than a record per file.)
+        self._files: dict[FileKey, list[tuple[str, int, bool, int]]]={}
+        self._byInstance: dict[str, tuple[FileKey, ...]]={}     # Con instance -> the files its rows list
+        self._lock=threading.Lock()
+        self.NumUncovered: int=0        # Con instances (or whole series) whose rows weren't available, e.g., resumed from a journal without an index
+
+
+    # ----------------------------------------------
+    # Add the rows of a con instance (and their columns, if they've just been counted: see FileEntries())
+    # Adding a con instance a second time replaces what was added for it before.
+    def Add(self, seriesname: str, coninstancename: str, files: list[ConFileData], columns: FileColumns|None=None) -> None:
+        self.AddEntries(seriesname, coninstancename, FileEntries(seriesname, coninstancename, files, columns))
+
+
+    # Add the entries (see FileEntries()) of a con instance's rows
+    def AddEntries(self, seriesname: str, coninstancename: str, entries: list[FileEntry]) -> None:
+        instance="/"+"/".join(PageSource.PathParts(seriesname, coninstancename))
+        with self._lock:
+            self._Remove(instance)
+            for key, pages, islink, kind in entries:
+                rows=self._files.get(key)
+                if rows is None:
+                    self._files[key]=[(instance, pages, islink, kind)]
+                else:
+                    rows.append((instance, pages, islink, kind))
+            self._byInstance[instance]=tuple(key for key, _, _, _ in entries)
+
+
+    def _Remove(self, instance: str) -> None:
+        for key in set(self._byInstance.pop(instance, ())):
+            rows=[x for x in self._files.get(key, []) if x[0] != instance]
+            if len(rows) > 0:
+                self._files[key]=rows
+            else:
+                self._files.pop(key, None)
+
+
+    # A con instance whose rows couldn't be added
+    def NoteUncovered(self) -> None:
+        with self._lock:
+            self.NumUncovered+=1
+
+
+    # ----------------------------------------------
+    # The con instances which list a file
+    def Appearances(self, key: FileKey) -> list[str]:
+        return list(dict.fromkeys(x[0] for x in self._files.get(key, [])))
+
+
+    @property
+    def NumFiles(self) -> int:
+        return len(self._files)
+
+
+    @property
+    def NumAppearances(self) -> int:
+        return sum(len(x) for x in self._byInstance.values())
+
+
+    # ----------------------------------------------
+    # The totals with each file counted once.  (Cons and series aren't files, so they're taken from the raw totals.)
+    def Totals(self, raw: ConpubsCounts) -> ConpubsCounts:
+        cpc=ConpubsCounts()
+        cpc.title=raw.title
+        cpc.numcons=raw.numcons
+        cpc.numseries=raw.numseries
+        with self._lock:
+            for rows in self._files.values():
+                if len(rows) == 1:
+                    _, pages, islink, kind=rows[0]
+                    kinds=(kind,)
+                else:
+                    pages=max(x[1] for x in rows)
+                    islink=all(x[2] for x in rows)
+                    kinds={x[3] for x in rows}
+                if KindPdf in kinds:
+                    cpc.numpdfs+=1
+                elif KindImage in kinds:
+                    cpc.numimages+=1
+                if islink:
+                    cpc.numlinks+=1
+                cpc.numpages+=pages
+        return cpc
+
+
+    # ----------------------------------------------
+    # Add a con instance's rows as stored in the ResultsIndex (for a con instance which wasn't loaded in this run)
+    # The page counts are filled in from the PDFs, as they would have been had it been loaded.
+    def AddStored(self, index: ResultsIndex|None, seriesname: str, coninstancename: str) -> None:
+        path=f"/{seriesname}/{coninstancename}/index.html"
+        if index is None or not index.HasInstance(path):
+            self.NoteUncovered()
+            return
+        files=index.InstanceFiles(path)
+        counter=GetPdfPageCounter()
+        if counter is not None:
+            counter.FillInPages("/"+seriesname, coninstancename, files)
+        self.Add(seriesname, coninstancename, files)
+
+
+    # The same for all the con instances of a series
+    def AddStoredSeries(self, index: ResultsIndex|None, seriesname: str) -> None:
+        stored=index.SeriesPageInstances(f"/{seriesname}/index.html") if index is not None else None
+        if stored is None:
+            self.NoteUncovered()
+            return
+        seriesname, instances=stored
+        for name in instances:
+            self.AddStored(index, seriesname, name)
+
+
+#####################################################################################
+# The index used for the run, if any.  (Like the PdfPageCounter, it's global so that every crawl path can get at it.)
+_index: FileIdentityIndex|None=None
+
+
+def SetFileIndex(index: FileIdentityIndex|None) -> None:
+    global _index
+    _index=index
+
+
+def GetFileIndex() -> FileIdentityIndex|None:
+    return _index
@@ -0,0 +1,139 @@
+from __future__ import annotations
+from typing import Iterator, NamedTuple
+
+
+# Lower-case ASCII only.  (str.lower() can change the length of some non-ASCII strings, which would throw off the offsets.)
+_asciiLower=str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
+
+
+#####################################################################################
+# A bracketed element <tag ...>contents</tag> located in a page by its offsets
+# start is the "<" of the opening tag, contentStart..contentEnd are the contents, and end is just past the closing tag
+class HtmlElement(NamedTuple):
+    tag: str
+    start: int
+    contentStart: int
+    contentEnd: int
+    end: int
+
+
+#####################################################################################
+# A single-pass scanner over an HTML page
+# This does the same job as FindBracketedText2() and FindNextBracketedText(), but works on offsets into the page
+#   rather than returning freshly sliced copies of the rest of the page on every call.  Walking all the rows of
+#   a page is therefore linear in the size of the page.
+# As with FindBracketedText2(), an element ends at the first matching closing tag (elements of the same kind are not
+#   nested) and tags are matched case-insensitively.  All searches are bounded by [start, end).
+class HtmlScanner:
+
+    def __init__(self, page: str):
+        self.Page: str=page
+        self._lower: str=page.translate(_asciiLower)       # Searching is done in this so that tags match regardless of case
+        self._noCloseAfter: dict[tuple[str, int], int]={}   # For FindNext(): (tag, end) -> offset beyond which there is no closing tag before end
+
+
+    # ----------------------------------------------
+    def Contents(self, e: HtmlElement|None) -> str:
+        if e is None:
+            return ""
+        return self.Page[e.contentStart:e.contentEnd]
+
+
+    # The whole element, including its tags
+    def Outer(self, e: HtmlElement|None) -> str:
+        if e is None:
+            return ""
+        return self.Page[e.start:e.end]
+
+
+    def Text(self, start: int, end: int) -> str:
+        return self.Page[start:end]
+
+
+    # ----------------------------------------------
+    # Find a piece of (lower case) text in [start, end), regardless of the case of the page.  Returns its offset or -1.
+    def FindText(self, text: str, start: int=0, end: int|None=None) -> int:
+        if end is None:
+            end=len(self.Page)
+        return self._lower.find(text, start, end)
+
+
+    # ----------------------------------------------
+    # Find the first <tag ...>...</tag> which lies entirely within [start, end)
+    def Find(self, tag: str, start: int=0, end: int|None=None) -> HtmlElement|None:
+        if end is None:
+            end=len(self.Page)
+        tag=tag.lower()
+        opener="<"+tag
+        closer="</"+tag+">"
+        low=self._lower
+
+        loc=start
+        while True:
+            loc=low.find(opener, loc, end)
+            if loc < 0:
+                return None
+            # Make sure this is the tag and not just one which starts the same way (e.g., <a> vs. <abbr>)
+            after=loc+len(opener)
+            if after < end and low[after] in " \t\r\n>/":
+                break
+            loc=after
+
+        contentStart=low.find(">", after, end)
+        if contentStart < 0:
+            return None
+        contentStart+=1
+        contentEnd=low.find(closer, contentStart, end)
+        if contentEnd < 0:
+            return None
+        return HtmlElement(tag, loc, contentStart, contentEnd, contentEnd+len(closer))
+
+
+    # ----------------------------------------------
+    # Iterate through the successive <tag>...</tag> elements in [start, end)
+    def FindAll(self, tag: str, start: int=0, end: int|None=None) -> Iterator[HtmlElement]:
+        while True:
+            e=self.Find(tag, start, end)
+            if e is None:
+                return
+            yield e
+            start=e.end
+
+
+    # ----------------------------------------------
+    # Find the first element of any kind in [start, end) which has a closing tag.  (Tags with no closing tag, like <br>, are skipped.)
+    # This is the equivalent of FindNextBracketedText()
+    def FindNext(self, start: int=0, end: int|None=None) -> HtmlElement|None:
+        if end is None:
+            end=len(self.Page)
+        low=self._lower
+
+        loc=start
+        while True:
+            loc=low.find("<", loc, end)
+            if loc < 0:
+                return None
+            # Read the tag name
+            nameEnd=loc+1
+            while nameEnd < end and (low[nameEnd].isalnum() or low[nameEnd] == "-"):
+                nameEnd+=1
+            tag=low[loc+1:nameEnd]
+            if tag == "" or not tag[0].isalpha() or (nameEnd < end and low[nameEnd] not in " \t\r\n>/"):
+                loc+=1
+                continue
+
+            # We remember when there is no closing tag beyond some point so that a page full of unclosed tags is not rescanned for each one
+            if loc >= self._noCloseAfter.get((tag, end), end+1):
+                loc=nameEnd
+                continue
+            contentStart=low.find(">", nameEnd, end)
+            if contentStart < 0:
+                return None
+            contentStart+=1
+            closer="</"+tag+">"
+            contentEnd=low.find(closer, contentStart, end)
+            if contentEnd < 0:
+                self._noCloseAfter[(tag, end)]=loc
+                loc=nameEnd
+                continue
+            return HtmlElement(tag, loc, contentStart, contentEnd, contentEnd+len(closer))
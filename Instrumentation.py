@@ -0,0 +1,217 @@
+from __future__ import annotations
+
+import heapq
+import math
+import threading
+import time
+
+from PageSource import PageSource
+
+
+#####################################################################################
+# Counters and timing histograms for the stages of a run
+# This is off unless EnableInstrumentation() is called (main() does so for --profile), and when it's off, recording is
+#   a single test of a flag.  What is recorded:
+#       fetch               Latency of each page actually transferred (see InstrumentedPageSource) and its size in bytes
+#       parse.<kind>.<fmt>  Time to parse each series or con instance page, by the page's format
+#       rows.<kind>         Rows (con instances or files) found on each page
+#       count.<stage>       Time spent reducing rows and con instances to counts
+# Page times are also added up by series, and the slowest pages are remembered, so that the summary can show where a
+#   slow run went.
+# The worker processes of a --parse-processes run record into their own copy, which they Drain() and send back with
+#   each result for the parent to Merge().
+
+_enabled: bool=False
+_lock=threading.Lock()
+_numSlowest: int=10
+
+
+# ----------------------------------------------
+# A histogram of positive values, bucketed by powers of two
+class Histogram:
+
+    def __init__(self):
+        self.Count: int=0
+        self.Total: float=0
+        self.Min: float=math.inf
+        self.Max: float=0
+        self._buckets: dict[int, int]={}     # Exponent e -> number of values in [2**(e-1), 2**e)
+
+
+    def Add(self, value: float) -> None:
+        self.Count+=1
+        self.Total+=value
+        self.Min=min(self.Min, value)
+        self.Max=max(self.Max, value)
+        e=math.frexp(value)[1] if value > 0 else -1000
+        self._buckets[e]=self._buckets.get(e, 0)+1
+
+
+    def Merge(self, other: Histogram) -> None:
+        self.Count+=other.Count
+        self.Total+=other.Total
+        self.Min=min(self.Min, other.Min)
+        self.Max=max(self.Max, other.Max)
+        for e, n in other._buckets.items():
+            self._buckets[e]=self._buckets.get(e, 0)+n
+
+
+    # An estimate of the fraction'th percentile: the top of the bucket it falls in (but no more than the largest value)
+    def Percentile(self, fraction: float) -> float:
+        seen=0
+        for e in sorted(self._buckets):
+            seen+=self._buckets[e]
+            if seen >= fraction*self.Count:
+                return min(self.Max, 0 if e == -1000 else 2.0**e)
+        return self.Max
+
+
+class _Stats:
+    def __init__(self):
+        self.Counters: dict[str, int]={}
+        self.Histograms: dict[str, Histogram]={}
+        self.SeriesSeconds: dict[str, float]={}
+        self.SlowestPages: list[tuple[float, str, str]]=[]     # A heap of the slowest (seconds, what, path)
+
+
+_stats=_Stats()
+
+
+# ----------------------------------------------
+def EnableInstrumentation(enable: bool=True) -> None:
+    global _enabled
+    _enabled=enable
+
+
+def IsInstrumenting() -> bool:
+    return _enabled
+
+
+def Count(name: str, n: int=1) -> None:
+    if not _enabled:
+        return
+    with _lock:
+        _stats.Counters[name]=_stats.Counters.get(name, 0)+n
+
+
+def Observe(name: str, value: float) -> None:
+    if not _enabled:
+        return
+    with _lock:
+        _Histogram(name).Add(value)
+
+
+# Record how long it took to do something to a page.  The time is also charged to the page's series.
+def RecordTime(name: str, seconds: float, path: str="") -> None:
+    if not _enabled:
+        return
+    with _lock:
+        _Histogram(name).Add(seconds)
+        if path != "":
+            parts=[x for x in path.split("/") if x != ""]
+            if len(parts) > 1:      # i.e., it's not root/index.html
+                _stats.SeriesSeconds[parts[0]]=_stats.SeriesSeconds.get(parts[0], 0)+seconds
+            if len(_stats.SlowestPages) < _numSlowest:
+                heapq.heappush(_stats.SlowestPages, (seconds, name, path))
+            elif seconds > _stats.SlowestPages[0][0]:
+                heapq.heapreplace(_stats.SlowestPages, (seconds, name, path))
+
+
+def _Histogram(name: str) -> Histogram:
+    h=_stats.Histograms.get(name)
+    if h is None:
+        h=_stats.Histograms[name]=Histogram()
+    return h
+
+
+# ----------------------------------------------
+# Hand over (and clear) what has been recorded so far, e.g., to send it from a worker process to the parent
+def Drain() -> _Stats|None:
+    global _stats
+    if not _enabled:
+        return None
+    with _lock:
+        stats=_stats
+        _stats=_Stats()
+    return stats
+
+
+def Merge(stats: _Stats|None) -> None:
+    if stats is None or not _enabled:
+        return
+    with _lock:
+        for name, n in stats.Counters.items():
+            _stats.Counters[name]=_stats.Counters.get(name, 0)+n
+        for name, h in stats.Histograms.items():
+            _Histogram(name).Merge(h)
+        for series, seconds in stats.SeriesSeconds.items():
+            _stats.SeriesSeconds[series]=_stats.SeriesSeconds.get(series, 0)+seconds
+        for page in stats.SlowestPages:
+            if len(_stats.SlowestPages) < _numSlowest:
+                heapq.heappush(_stats.SlowestPages, page)
+            elif page[0] > _stats.SlowestPages[0][0]:
+                heapq.heapreplace(_stats.SlowestPages, page)
+
+
+# ----------------------------------------------
+# The summary table, as lines of text
+def Summary() -> list[str]:
+    with _lock:
+        lines=["", "Counters:"]
+        for name in sorted(_stats.Counters):
+            lines.append(f"   {name:30} {_stats.Counters[name]:12,}")
+
+        lines.append("")
+        lines.append(f"   {'Histogram':30} {'count':>8} {'total':>12} {'mean':>12} {'p50':>12} {'p90':>12} {'max':>12}")
+        for name in sorted(_stats.Histograms):
+            h=_stats.Histograms[name]
+            lines.append(f"   {name:30} {h.Count:8,} {h.Total:12.4g} {h.Total/max(h.Count, 1):12.4g} {h.Percentile(0.5):12.4g} {h.Percentile(0.9):12.4g} {h.Max:12.4g}")
+
+        lines.append("")
+        lines.append("Slowest series (seconds fetching and parsing their pages):")
+        for series, seconds in sorted(_stats.SeriesSeconds.items(), key=lambda x: x[1], reverse=True)[:_numSlowest]:
+            lines.append(f"   {seconds:10.3f}   {series}")
+
+        lines.append("")
+        lines.append("Slowest pages:")
+        for seconds, name, path in sorted(_stats.SlowestPages, reverse=True):
+            lines.append(f"   {seconds:10.3f}   {name:24} {path}")
+    return lines
+
+
+#####################################################################################
+# A PageSource which times the page fetches of the source it wraps and counts the bytes fetched
+# Put this around the source which does the actual transfers (the mirror or the FTP server) so that cache hits aren't counted.
+class InstrumentedPageSource(PageSource):
+
+    def __init__(self, source: PageSource):
+        self._source: PageSource=source
+
+
+    def Close(self) -> None:
+        self._source.Close()
+
+
+    def GetFileAsString(self, directory: str, fname: str) -> str|None:
+        start=time.perf_counter()
+        try:
+            page=self._source.GetFileAsString(directory, fname)
+        except Exception:
+            Count("fetch.errors")
+            raise
+        path="/"+"/".join(PageSource.PathParts(directory, fname))
+        RecordTime("fetch", time.perf_counter()-start, path)
+        if page is None:
+            Count("fetch.missing")
+        else:
+            Count("fetch.pages")
+            if _enabled:
+                Observe("fetch.bytes", len(page.encode("utf-8", errors="replace")))
+        return page
+
+
+    def GetFileMetadata(self, directory: str, fname: str) -> tuple[int, str]|None:
+        start=time.perf_counter()
+        metadata=self._source.GetFileMetadata(directory, fname)
+        RecordTime("fetch.metadata", time.perf_counter()-start)
+        return metadata
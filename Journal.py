@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import json
+import threading
+
+from Log import LogError
+from LogLevels import LogInfo
+from ConpubsCounts import ConpubsCounts
+
+
+#####################################################################################
+# A checkpoint journal for long runs
+# Each con instance whose counts have been computed and each series which has been completed is appended to the journal
+#   as a line of json, and flushed at once.  If a run is cut short (e.g., the FTP connection drops), the next run can
+#   resume from the journal: completed series and con instances are not loaded again, and their counts are taken from
+#   the journal.  Since the counts are saved exactly, the final totals are the same as those of an uninterrupted run.
+# The lines are:
+#   {"series": name, "instance": name, "counts": {...}}      A con instance is done
+#   {"series": name, "counts": {...}}                        The whole series is done
+class Journal:
+
+    def __init__(self, filename: str, resume: bool):
+        self._filename: str=filename
+        self._lock=threading.Lock()
+        self._series: dict[str, ConpubsCounts]={}
+        self._instances: dict[tuple[str, str], ConpubsCounts]={}
+        self._needsNewline: bool=False
+
+        if resume:
+            self._Read()
+            LogInfo("Journal: resuming with %d series and %d con instances already done", len(self._series), len(self._instances))
+            self._file=open(filename, "a", encoding="utf-8")
+            if self._needsNewline:
+                self._file.write("\n")     # Don't append to a line which was cut off
+        else:
+            self._file=open(filename, "w", encoding="utf-8")
+
+
+    def _Read(self) -> None:
+        try:
+            self._series, self._instances, self._needsNewline=_ReadJournal(self._filename)
+        except FileNotFoundError:
+            LogInfo("Journal: '%s' not found, so starting from the beginning", self._filename)
+
+
+    def Close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+    # The counts of the series completed by the run which wrote a journal, read before a new run starts it again
+    # (The scheduler uses these to estimate the sizes of the series.)
+    @staticmethod
+    def SeriesCountsIn(filename: str) -> dict[str, ConpubsCounts]:
+        try:
+            return _ReadJournal(filename)[0]
+        except FileNotFoundError:
+            return {}
+
+
+    # ----------------------------------------------
+    # The counts of a series or con instance completed in an earlier run, or None
+    def SeriesCounts(self, seriesname: str) -> ConpubsCounts|None:
+        return self._series.get(seriesname)
+
+
+    def InstanceCounts(self, seriesname: str, coninstancename: str) -> ConpubsCounts|None:
+        return self._instances.get((seriesname, coninstancename))
+
+
+    # ----------------------------------------------
+    def RecordInstance(self, seriesname: str, coninstancename: str, counts: ConpubsCounts) -> None:
+        self._Write({"series": seriesname, "instance": coninstancename, "counts": counts.AsDict()})
+
+
+    def RecordSeries(self, seriesname: str, counts: ConpubsCounts) -> None:
+        self._Write({"series": seriesname, "counts": counts.AsDict()})
+
+
+    def _Write(self, d: dict) -> None:
+        with self._lock:
+            self._file.write(json.dumps(d)+"\n")
+            self._file.flush()
+
+
+# ----------------------------------------------
+# Returns the series and con instances in a journal, and whether its last line was cut off
+def _ReadJournal(filename: str) -> tuple[dict[str, ConpubsCounts], dict[tuple[str, str], ConpubsCounts], bool]:
+    series: dict[str, ConpubsCounts]={}
+    instances: dict[tuple[str, str], ConpubsCounts]={}
+    with open(filename, encoding="utf-8") as f:
+        lines=f.readlines()
+
+    for i, line in enumerate(lines):
+        try:
+            d=json.loads(line)
+        except json.decoder.JSONDecodeError:
+            # The last line may have been cut off when the run died.  Anything else is damage.
+            if i < len(lines)-1:
+                LogError(f"Journal: line {i+1} of '{filename}' can't be read and is ignored")
+            continue
+        counts=ConpubsCounts().FromDict(d["counts"])
+        if "instance" in d:
+            instances[(d["series"], d["instance"])]=counts
+        else:
+            series[d["series"]]=counts
+    return series, instances, len(lines) > 0 and not lines[-1].endswith("\n")
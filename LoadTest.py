@@ -0,0 +1,272 @@
+from __future__ import annotations
+from typing import Callable
+
+import argparse
+import json
+import math
+import random
+import tempfile
+import threading
+import time
+
+from Log import LogOpen
+import LogLevels
+from LogLevels import SetLogLevel
+
+from ConpubsAnalyzer import DownloadMainConlist
+from Crawler import CrawlSite
+from ConpubsCounts import ConpubsCounts, NameLinkCounts
+from FetchPolicy import RetryingPageSource
+from PageSource import PageSource, PageFetchError, MirrorPageSource
+from SyntheticSite import SyntheticSite
+
+
+#####################################################################################
+# Load testing the crawler against a stand-in for the server which is slow and unreliable in controlled ways
+# StandInPageSource serves a directory tree (a real mirror or a synthetic site) through the PageSource interface which
+#   FTP() and FTPConnectionPool present to the crawler, and adds:
+#       latency         a delay before each request is answered, drawn from a distribution (see ParseLatency())
+#       bandwidth       a cap on the bytes/s of all transfers together (they share one link)
+#       maxConnections  requests beyond this many at once are refused, as a server with a session limit does ("421")
+#       drops           a request fails part way through, as a dropped connection does
+#       timeouts        a request hangs for the timeout and then fails, as a stalled transfer does
+#       missing         a page is reported as not existing (always the same pages, whatever the attempt)
+# Every fault is decided from the seed, the page and the attempt number, so the same settings fail the same requests
+#   each time, however the requests are interleaved by the worker threads.
+# The load test runs the crawl once for each combination of workers and retries and reports its time and its outcome.
+
+
+# ----------------------------------------------
+# A latency distribution, returning seconds:
+#   "0.05"                  always 50ms
+#   "uniform:0.01:0.2"      evenly spread between 10ms and 200ms
+#   "exp:0.05"              exponentially distributed with a mean of 50ms
+#   "lognormal:0.05:1"      lognormally distributed with a median of 50ms and a sigma of 1 (a long tail, like a real server)
+def ParseLatency(spec: str) -> Callable[[random.Random], float]:
+    kind, _, params=spec.partition(":")
+    try:
+        if params == "":
+            seconds=float(kind)
+            return lambda rand: seconds
+        values=[float(x) for x in params.split(":")]
+        if kind == "uniform" and len(values) == 2:
+            return lambda rand: rand.uniform(values[0], values[1])
+        if kind == "exp" and len(values) == 1:
+            return lambda rand: rand.expovariate(1/values[0]) if values[0] > 0 else 0
+        if kind == "lognormal" and len(values) == 2:
+            return lambda rand: rand.lognormvariate(math.log(values[0]), values[1]) if values[0] > 0 else 0
+    except ValueError:
+        pass
+    raise ValueError(f"Bad latency '{spec}': use SECONDS, uniform:MIN:MAX, exp:MEAN or lognormal:MEDIAN:SIGMA")
+
+
+#####################################################################################
+class StandInPageSource(PageSource):
+
+    def __init__(self, root: str, latency: str="0", bandwidth: float=0, maxConnections: int=0, dropRate: float=0, timeoutRate: float=0,
+                 missingRate: float=0, timeout: float=2, seed: int=1):
+        self._mirror: MirrorPageSource=MirrorPageSource(root)
+        self._latency: Callable[[random.Random], float]=ParseLatency(latency)
+        self._bandwidth: float=bandwidth            # Bytes/s (0: no cap)
+        self._maxConnections: int=maxConnections    # (0: no limit)
+        self._dropRate: float=dropRate
+        self._timeoutRate: float=timeoutRate
+        self._missingRate: float=missingRate
+        self._timeout: float=timeout                # How long a stalled request hangs before it fails
+        self._seed: int=seed
+        self._lock=threading.Lock()
+        self._active: int=0
+        self._linkFree: float=0                     # When the shared link will have finished the transfers queued on it
+        self._attempts: dict[str, int]={}
+
+        self.NumRequests: int=0
+        self.NumDropped: int=0
+        self.NumTimedOut: int=0
+        self.NumRefused: int=0
+        self.PeakConnections: int=0
+        self.MissingPages: set[str]=set()
+
+
+    # ----------------------------------------------
+    def GetFileAsString(self, directory: str, fname: str) -> str|None:
+        path="/"+"/".join(PageSource.PathParts(directory, fname))
+        return self._Request(path, lambda: self._mirror.GetFileAsString(directory, fname), lambda page: len(page.encode("utf-8")))
+
+
+    def GetFileMetadata(self, directory: str, fname: str) -> tuple[int, str]|None:
+        path="/"+"/".join(PageSource.PathParts(directory, fname))
+        return self._Request(path, lambda: self._mirror.GetFileMetadata(directory, fname), lambda metadata: 0)
+
+
+    # ----------------------------------------------
+    # Serve one request, with whatever delay and fault the settings call for
+    def _Request(self, path: str, read: Callable, size: Callable) -> object:
+        with self._lock:
+            self.NumRequests+=1
+            attempt=self._attempts.get(path, 0)
+            self._attempts[path]=attempt+1
+            if 0 < self._maxConnections <= self._active:
+                self.NumRefused+=1
+                raise PageFetchError(f"421 Too many connections ({self._active}): '{path}'")
+            self._active+=1
+            self.PeakConnections=max(self.PeakConnections, self._active)
+
+        try:
+            rand=random.Random(f"{self._seed}:{path}:{attempt}")
+            time.sleep(self._latency(rand))
+
+            fault=rand.random()
+            if fault < self._timeoutRate:
+                time.sleep(self._timeout)
+                with self._lock:
+                    self.NumTimedOut+=1
+                raise PageFetchError(f"Timed out: '{path}'")
+            if fault < self._timeoutRate+self._dropRate:
+                with self._lock:
+                    self.NumDropped+=1
+                raise PageFetchError(f"Connection dropped: '{path}'")
+
+            if random.Random(f"{self._seed}:{path}:missing").random() < self._missingRate:
+                with self._lock:
+                    self.MissingPages.add(path)
+                return None
+
+            result=read()
+            if result is not None and self._bandwidth > 0:
+                self._Transfer(size(result))
+            return result
+        finally:
+            with self._lock:
+                self._active-=1
+
+
+    # Wait for nbytes to go over the shared link, behind whatever is already queued on it
+    def _Transfer(self, nbytes: int) -> None:
+        with self._lock:
+            start=max(time.monotonic(), self._linkFree)
+            self._linkFree=start+nbytes/self._bandwidth
+            done=self._linkFree
+        time.sleep(max(0.0, done-time.monotonic()))
+
+
+#####################################################################################
+# The series on the site, read from its root page without any delays or faults
+def SiteSeries(root: str) -> list[NameLinkCounts]:
+    return DownloadMainConlist(MirrorPageSource(root))
+
+
+# The site with some of its pages taken out, to work out what a crawl which lost them should have counted
+# The failed pages can't be read (and aren't counted at all); the missing ones don't exist (and count as empty)
+class _MirrorWithout(MirrorPageSource):
+
+    def __init__(self, root: str, failed: set[str], missing: set[str]):
+        super().__init__(root)
+        self._failed: set[str]=failed
+        self._missing: set[str]=missing
+
+
+    def GetFileAsString(self, directory: str, fname: str) -> str|None:
+        path="/"+"/".join(PageSource.PathParts(directory, fname))
+        if path in self._failed:
+            raise PageFetchError(path)
+        if path in self._missing:
+            return None
+        return super().GetFileAsString(directory, fname)
+
+
+def _Crawl(listOfConSeries: list[NameLinkCounts], source: PageSource, workers: int, parseProcesses: int) -> ConpubsCounts:
+    total=ConpubsCounts()
+    for counts in CrawlSite(listOfConSeries, source, workers, parseProcesses=parseProcesses):
+        total+=counts
+    return total
+
+
+# ----------------------------------------------
+# Crawl the site once for each combination of workers and retries, through a fresh StandInPageSource made by makeSource()
+# Each result is compared with a crawl of the site without any faults.  Its outcome is one of:
+#   exact           the totals are right (any faults were overcome by retrying)
+#   incomplete      the totals are short, but are exactly what the site without the pages reported as failed (or missing) adds up to
+#   WRONG           the totals are wrong, and the pages reported don't account for it
+#   crashed         the crawl raised an exception
+def RunLoadTest(root: str, makeSource: Callable[[], StandInPageSource], workers: list[int], retries: list[int], backoff: float,
+                parseProcesses: int=0) -> list[dict]:
+    listOfConSeries=SiteSeries(root)
+    expected=_Crawl(listOfConSeries, MirrorPageSource(root), 1, 0).AsDict()
+    print(f"{len(listOfConSeries)} series; expected totals: {expected}")
+    print(f"{'workers':>7} {'retries':>7} {'seconds':>8} {'requests':>8} {'retried':>7} {'dropped':>7} {'timeouts':>8} {'refused':>7} "
+          f"{'peak':>4} {'missing':>7} {'failed':>6}  outcome")
+
+    results=[]
+    for w in workers:
+        for r in retries:
+            standin=makeSource()
+            source=RetryingPageSource(standin, maxRetries=r, backoff=backoff)
+            start=time.perf_counter()
+            try:
+                total=_Crawl(listOfConSeries, source, w, parseProcesses).AsDict()
+                if total == expected:
+                    outcome="exact"
+                elif total == _Crawl(listOfConSeries, _MirrorWithout(root, set(source.FailedPages), standin.MissingPages), 1, 0).AsDict():
+                    outcome="incomplete"
+                else:
+                    outcome="WRONG"
+            except Exception as e:
+                total=None
+                outcome=f"crashed: {type(e).__name__}: {e}"
+            elapsed=time.perf_counter()-start
+
+            result={"workers": w, "retries": r, "seconds": elapsed, "requests": standin.NumRequests, "retried": source.NumRetries,
+                    "dropped": standin.NumDropped, "timeouts": standin.NumTimedOut, "refused": standin.NumRefused,
+                    "peak connections": standin.PeakConnections, "missing": len(standin.MissingPages),
+                    "failed": len(source.FailedPages), "outcome": outcome, "totals": total}
+            print(f"{w:7} {r:7} {elapsed:8.2f} {standin.NumRequests:8} {source.NumRetries:7} {standin.NumDropped:7} {standin.NumTimedOut:8} "
+                  f"{standin.NumRefused:7} {standin.PeakConnections:4} {len(standin.MissingPages):7} {len(source.FailedPages):6}  {outcome}")
+            results.append(result)
+    return results
+
+
+def _IntList(s: str) -> list[int]:
+    return [int(x) for x in s.split(",") if x.strip() != ""]
+
+
+#############################################
+if __name__ == "__main__":
+    parser=argparse.ArgumentParser(description="Load test the ConpubsAnalyzer crawl against a slow and unreliable stand-in for the server")
+    parser.add_argument("--site", metavar="DIR", default="", help="Serve the site in DIR (default: generate a synthetic site)")
+    parser.add_argument("--series", type=int, default=100, help="Number of series in the synthetic site")
+    parser.add_argument("--cons", type=int, default=10, help="Average number of con instances per series in the synthetic site")
+    parser.add_argument("--files", type=int, default=12, help="Average number of files per con instance in the synthetic site")
+    parser.add_argument("--workers", default="1,4,8", help="Comma-separated numbers of workers to try (default 1,4,8)")
+    parser.add_argument("--retries", default="0,4", help="Comma-separated numbers of retries to try (default 0,4)")
+    parser.add_argument("--backoff", type=float, default=0.1, help="Base delay between retries, in seconds (default 0.1)")
+    parser.add_argument("--parse-processes", type=int, default=0, help="Parse the pages in this many separate processes")
+    parser.add_argument("--latency", default="lognormal:0.02:0.5", help="Per-request latency: SECONDS, uniform:MIN:MAX, exp:MEAN or lognormal:MEDIAN:SIGMA")
+    parser.add_argument("--bandwidth", type=float, default=0, help="Cap on the total transfer rate, in KB/s (default 0: no cap)")
+    parser.add_argument("--max-connections", type=int, default=0, help="Refuse requests beyond this many at once (default 0: no limit)")
+    parser.add_argument("--drop", type=float, default=0.02, help="Fraction of requests which are dropped part way (default 0.02)")
+    parser.add_argument("--timeouts", type=float, default=0.005, help="Fraction of requests which stall until they time out (default 0.005)")
+    parser.add_argument("--timeout", type=float, default=2, help="How long a stalled request hangs before failing, in seconds (default 2)")
+    parser.add_argument("--missing", type=float, default=0, help="Fraction of pages reported as not existing (default 0)")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for the faults and the latencies")
+    parser.add_argument("--save", metavar="FILE", default="", help="Save the results as json")
+    args=parser.parse_args()
+
+    LogOpen("Log -- LoadTest.txt", "Log (Errors) -- LoadTest.txt")
+    SetLogLevel(LogLevels.Quiet)
+    ParseLatency(args.latency)      # Check it before generating a site
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root=args.site
+        if root == "":
+            root=tmp
+            print(f"Generating a synthetic site with {args.series} series...")
+            SyntheticSite(args.series, args.cons, args.files).Write(root)
+
+        def MakeSource() -> StandInPageSource:
+            return StandInPageSource(root, latency=args.latency, bandwidth=args.bandwidth*1024, maxConnections=args.max_connections,
+                                     dropRate=args.drop, timeoutRate=args.timeouts, missingRate=args.missing, timeout=args.timeout, seed=args.seed)
+        results=RunLoadTest(root, MakeSource, _IntList(args.workers), _IntList(args.retries), args.backoff, parseProcesses=args.parse_processes)
+
+    if args.save != "":
+        with open(args.save, "w") as f:
+            f.write(json.dumps(results, indent=2))
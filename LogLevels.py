@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+from Log import Log
+
+
+#####################################################################################
+# Level-gated logging on top of Log()
+# Messages are given as a %-format string and its arguments, and are only formatted if they are going to be logged.
+#   This matters on the parse hot paths, where a trace message may include the whole remainder of a page.
+#       Debug   Everything, including the per-tag and per-row parse trace
+#       Info    One or two lines per page (the default)
+#       Quiet   Nothing but errors (which always go through LogError()) and the final totals (which main() logs directly)
+
+Debug=10
+Info=20
+Quiet=30
+
+_level: int=Info
+
+
+def SetLogLevel(level: int) -> None:
+    global _level
+    _level=level
+
+
+def GetLogLevel() -> int:
+    return _level
+
+
+# Use this to skip building an expensive message altogether
+def IsLogging(level: int) -> bool:
+    return level >= _level
+
+
+def LogDebug(msg: str, *args) -> None:
+    if _level <= Debug:
+        Log(msg % args if len(args) > 0 else msg)
+
+
+def LogInfo(msg: str, *args) -> None:
+    if _level <= Info:
+        Log(msg % args if len(args) > 0 else msg)
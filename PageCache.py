@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+from Log import LogError
+from LogLevels import LogInfo
+from PageSource import PageSource
+
+
+#####################################################################################
+# A persistent on-disk cache of pages, keyed by their path on the server
+# It is a PageSource which sits in front of another PageSource, so it can be handed to ConSeriesPage and ConInstance
+#   in place of the source.
+# Before a cached page is used, it is revalidated with the source's GetFileMetadata() (the file's size and mtime), which
+#   is far cheaper than downloading the page.  Only pages whose size or mtime has changed are downloaded again.
+# If the source can't supply metadata, every page is downloaded (and the cache is refreshed).
+class PageCache(PageSource):
+
+    indexFilename="cacheindex.json"
+
+    def __init__(self, source: PageSource, cacheDir: str, maxMB: float=500, maxAgeDays: float=365, forceRefresh: bool=False):
+        self._source=source
+        self._cacheDir: str=cacheDir
+        self._maxBytes: int=int(maxMB*1024*1024)
+        self._maxAgeSecs: float=maxAgeDays*24*60*60
+        self._forceRefresh: bool=forceRefresh    # If True, ignore what's in the cache and download everything
+        self._lock=threading.Lock()
+
+        # The index holds an entry for each cached page: path -> {"file", "size", "mtime", "bytes", "used"}
+        self._index: dict[str, dict]={}
+
+        self.NumHits: int=0        # Pages served from the cache
+        self.NumDownloads: int=0   # Pages whose bodies had to be downloaded
+
+        os.makedirs(cacheDir, exist_ok=True)
+        try:
+            with open(os.path.join(cacheDir, PageCache.indexFilename)) as f:
+                self._index=json.loads(f.read())
+        except FileNotFoundError:
+            pass
+        except json.decoder.JSONDecodeError:
+            LogError(f"PageCache: The cache index in {cacheDir} is damaged and will be rebuilt")
+            self._index={}
+
+        self.Evict()
+
+
+    # The PageSource the cache sits in front of
+    @property
+    def Source(self) -> PageSource:
+        return self._source
+
+
+    # ----------------------------------------------
+    # Write the index out, after evicting anything too old or beyond the size limit.  The cache can be reused by the next run.
+    def Close(self) -> None:
+        self.Evict()
+        with self._lock:
+            with open(os.path.join(self._cacheDir, PageCache.indexFilename), "w") as f:
+                f.write(json.dumps(self._index))
+        LogInfo("PageCache: %d pages from cache, %d pages downloaded", self.NumHits, self.NumDownloads)
+        self._source.Close()
+
+
+    # ----------------------------------------------
+    # Drop pages not used for more than maxAgeDays, then drop the least recently used pages until we are under maxMB
+    def Evict(self) -> None:
+        with self._lock:
+            now=time.time()
+            for path in [p for p, e in self._index.items() if now-e["used"] > self._maxAgeSecs]:
+                self._Remove(path)
+
+            total=sum(e["bytes"] for e in self._index.values())
+            if total <= self._maxBytes:
+                return
+            for path in sorted(self._index.keys(), key=lambda p: self._index[p]["used"]):
+                total-=self._index[path]["bytes"]
+                self._Remove(path)
+                if total <= self._maxBytes:
+                    break
+
+
+    # Remove an entry and its file.  The caller must hold the lock.
+    def _Remove(self, path: str) -> None:
+        entry=self._index.pop(path, None)
+        if entry is None:
+            return
+        try:
+            os.remove(os.path.join(self._cacheDir, entry["file"]))
+        except FileNotFoundError:
+            pass
+
+
+    # ----------------------------------------------
+    @staticmethod
+    def _Key(directory: str, fname: str) -> str:
+        return "/"+"/".join(PageSource.PathParts(directory, fname))
+
+
+    def GetFileMetadata(self, directory: str, fname: str) -> tuple[int, str]|None:
+        return self._source.GetFileMetadata(directory, fname)
+
+
+    # ----------------------------------------------
+    def GetFileAsString(self, directory: str, fname: str) -> str|None:
+        path=PageCache._Key(directory, fname)
+
+        metadata=self._source.GetFileMetadata(directory, fname)
+
+        if not self._forceRefresh and metadata is not None:
+            with self._lock:
+                entry=self._index.get(path)
+            if entry is not None and entry["size"] == metadata[0] and entry["mtime"] == metadata[1]:
+                try:
+                    with open(os.path.join(self._cacheDir, entry["file"]), encoding="utf-8") as f:
+                        page=f.read()
+                    with self._lock:
+                        entry["used"]=time.time()
+                        self.NumHits+=1
+                    return page
+                except FileNotFoundError:
+                    pass    # The cache file has gone missing, so just download it again
+
+        page=self._source.GetFileAsString(directory, fname)
+        with self._lock:
+            self.NumDownloads+=1
+            if page is None:
+                self._Remove(path)
+                return None
+            if metadata is None:
+                return page     # We can't revalidate it later, so there's no point in keeping it
+
+            entry={"file": hashlib.sha1(path.encode("utf-8")).hexdigest()+".html", "size": metadata[0], "mtime": metadata[1],
+                   "bytes": len(page), "used": time.time()}
+            self._index[path]=entry
+        with open(os.path.join(self._cacheDir, entry["file"]), "w", encoding="utf-8") as f:
+            f.write(page)
+
+        return page
@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+from HtmlScanner import HtmlScanner, HtmlElement
+
+
+#####################################################################################
+# Work out what kind of page this is, in one pass, before any real parsing is done
+# The loaders used to search the whole page for <fanac-json>, then search it again for the fanac-version comment, and
+#   then the HTML parser lower-cased it and searched it yet again.  Here the page is lower-cased just once (by the
+#   HtmlScanner, which is then handed on to the HTML parser) and each marker is found by a single search.
+#       Json        The contents of the <fanac-json> block, or None if there isn't one (or it's too short to be real)
+#       Version     The text of the <!-- fanac-version ... --> comment, or "" if there isn't one
+#       Table       For a page without json, the first <fanac-table> element (or None)
+class PageHeader:
+
+    def __init__(self, page: str):
+        self.Scanner: HtmlScanner=HtmlScanner(page)
+        self.Json: str|None=None
+        self.Version: str=""
+        self.Table: HtmlElement|None=None
+
+        json=self.Scanner.Find("fanac-json")
+        if json is not None and json.contentEnd-json.contentStart >= 20:
+            self.Json=self.Scanner.Contents(json)
+        self.Version=self._FindVersion()
+        if self.Json is None:
+            self.Table=self.Scanner.Find("fanac-table")
+
+
+    @property
+    def IsJson(self) -> bool:
+        return self.Json is not None
+
+
+    # ----------------------------------------------
+    # The same as ExtractInvisibleTextInsideFanacComment(page, "version")
+    def _FindVersion(self) -> str:
+        page=self.Scanner.Page
+        loc=0
+        while True:
+            loc=self.Scanner.FindText("fanac-version", loc)
+            if loc < 0:
+                return ""
+            if page.endswith("<!--", 0, loc) or page.endswith("<!-- ", 0, loc):
+                end=self.Scanner.FindText("-->", loc)
+                if end < 0:
+                    return ""
+                return page[loc+len("fanac-version"):end].strip()
+            loc+=1
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+import mmap
+import os
+
+from LogLevels import LogInfo
+from FTP import FTP
+
+
+#####################################################################################
+# Raised by a PageSource when a page could not be read for a reason which may go away if we try again
+#   (a dropped connection, a timeout, etc.), as opposed to the page not existing, which returns None
+class PageFetchError(Exception):
+    pass
+
+
+#####################################################################################
+# The interface to wherever the site's pages come from
+# Pages are named as they are for FTP(): a directory (e.g., "/Boskone/Boskone 1") and a filename (e.g., "index.html").
+#   Callers are not consistent about leading and doubled slashes in the directory, so implementations must accept them.
+class PageSource(ABC):
+
+    # Return the contents of a file, or None if it does not exist
+    # Raises PageFetchError if the read failed in a way which is worth retrying
+    @abstractmethod
+    def GetFileAsString(self, directory: str, fname: str) -> str|None:
+        ...
+
+
+    # Return a file's (size, modification time) without reading it, or None if that can't be done.
+    # The mtime is an opaque string: it is only ever compared for equality.
+    def GetFileMetadata(self, directory: str, fname: str) -> tuple[int, str]|None:
+        return None
+
+
+    # Sources which sit in front of another source close it as well
+    def Close(self) -> None:
+        pass
+
+
+    # Split a directory and filename into the list of path components
+    @staticmethod
+    def PathParts(directory: str, fname: str) -> list[str]:
+        return [x for x in directory.split("/") if x != ""]+[fname]
+
+
+#####################################################################################
+# Pages read from the server through the shared FTP() session
+# The session must already be open (FTP().OpenConnection()).  Only one transfer can be in progress at a time.
+class FTPPageSource(PageSource):
+
+    def GetFileAsString(self, directory: str, fname: str) -> str|None:
+        return FTP().GetFileAsString(directory, fname)
+
+
+#####################################################################################
+# Pages read from a local mirror of the site (e.g., an rsync of the web root), so that the analyzer can be run offline
+# The page /<series>/<con>/index.html is read from <root>/<series>/<con>/index.html
+class MirrorPageSource(PageSource):
+
+    mmapThreshold=256*1024      # Files at least this big are memory-mapped rather than read
+
+    def __init__(self, root: str):
+        self._root: str=root
+
+
+    def _Path(self, directory: str, fname: str) -> str:
+        return os.path.join(self._root, *PageSource.PathParts(directory, fname))
+
+
+    def GetFileAsString(self, directory: str, fname: str) -> str|None:
+        path=self._Path(directory, fname)
+        try:
+            with open(path, "rb") as f:
+                size=os.fstat(f.fileno()).st_size
+                if size < MirrorPageSource.mmapThreshold:
+                    return f.read().decode("utf-8", errors="replace")
+                # Decode straight from the mapped pages without first copying the file into a bytes object
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    return str(mm, "utf-8", "replace")
+        except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+            LogInfo("MirrorPageSource: '%s' does not exist", path)
+            return None
+
+
+    def GetFileMetadata(self, directory: str, fname: str) -> tuple[int, str]|None:
+        try:
+            st=os.stat(self._Path(directory, fname))
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        return st.st_size, str(st.st_mtime_ns)
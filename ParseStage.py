@@ -0,0 +1,259 @@
+from __future__ import annotations
+
+from collections.abc import Callable, Iterator, Iterable
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future
+
+from Log import LogError
+from LogLevels import LogInfo, SetLogLevel, GetLogLevel
+from ConSeries import ConSeriesPage
+from ConInstance import ConInstance, CountConFiles, CountConFileColumns
+from ConpubsCounts import ConpubsCounts, NameLinkCounts
+from ResultsIndex import ResultsIndex, PageHash, FileRow
+from Journal import Journal
+from PdfPages import PdfPageCounter, SetPdfPageCounter, GetPdfPageCounter
+from Instrumentation import EnableInstrumentation, IsInstrumenting, Count, Drain, Merge
+from PageSource import PageFetchError
+from Scheduler import BiggestFirst, Schedule
+from FileIndex import FileEntries, GetFileIndex
+
+
+#####################################################################################
+# A crawl in which downloading and parsing are separate stages
+# Pages are downloaded by a pool of threads (downloading is I/O bound) and handed as soon as they arrive to a pool of
+#   processes, which parse and count them (parsing is pure Python and CPU bound, so threads would all share one core).
+# The worker processes get just the page text and send back compact records:
+#   for a series page, the (possibly corrected) series name and the (name, URL) of each con instance
+#   for a con instance page, an InstanceRecord
+# and the parent reduces the records into each series' ConpubsCounts.
+
+
+# The counts of one con instance page: (numpdfs, numpages, numimages, numlinks)
+InstanceRecord=tuple[int, int, int, int]
+
+
+def CountsToRecord(counts: ConpubsCounts) -> InstanceRecord:
+    return counts.numpdfs, counts.numpages, counts.numimages, counts.numlinks
+
+
+def RecordToCounts(record: InstanceRecord) -> ConpubsCounts:
+    cpc=ConpubsCounts()
+    cpc.numpdfs, cpc.numpages, cpc.numimages, cpc.numlinks=record
+    return cpc
+
+
+# ----------------------------------------------
+# How many series to keep in flight when crawling with maxWorkers download threads
+def SeriesWindow(maxWorkers: int) -> int:
+    return max(4, 4*maxWorkers)
+
+
+# The running reduction of a series: add the counts of each of its con instances in turn to those of the series page
+# A con instance whose page could not be read has counts of None.  It isn't counted, and the series is incomplete.
+# Returns the series' counts and whether it is complete.  (An incomplete series is not journaled, so that --resume
+#   will try its missing con instances again.)
+def SumSeries(counts: ConpubsCounts, instanceCounts: Iterable[ConpubsCounts|None]) -> tuple[ConpubsCounts, bool]:
+    complete=True
+    for ic in instanceCounts:
+        if ic is None:
+            complete=False
+            continue
+        counts+=ic
+        counts.numcons+=1
+    Count("count.series")
+    return counts, complete
+
+
+# ----------------------------------------------
+# These run in the worker processes
+
+def _InitWorker(level: int, instrumenting: bool, pdfRoot: str, pdfCacheFile: str) -> None:
+    SetLogLevel(level)
+    EnableInstrumentation(instrumenting)
+    if pdfRoot != "":
+        # Each worker counts PDF pages itself, starting from the parent's cache (see ParseConInstancePage())
+        SetPdfPageCounter(PdfPageCounter(pdfRoot, pdfCacheFile, saveCache=False))
+
+
+# Each of these also returns what the worker's instrumentation recorded (see Instrumentation.Drain())
+# ParseConInstancePage() also returns the PDF page counts the worker added to its cache, for the parent's cache
+
+# Returns the series name and the list of (name, URL) of its con instances which have pages, or None if the page can't be read
+def ParseSeriesPage(seriesname: str, page: str) -> tuple[str, list[tuple[str, str]]|None, object]:
+    csp=ConSeriesPage(seriesname, loadInstances=False, page=page)
+    if csp.Counts.numseries == 0:
+        return csp.Seriesname, None, Drain()
+    return csp.Seriesname, [(nlc.name, nlc.URL) for nlc in csp.ConInstanceNLCs], Drain()
+
+
+# Returns the instance's counts and, if wanted, its parsed rows and their counts for the ResultsIndex
+# (The index keeps the page's own counts, from before any page counts are filled in from the PDFs.)
+# If wantFiles, it also returns the rows' entries for the FileIdentityIndex (see FileIndex.py), else None
+def ParseConInstancePage(seriesname: str, coninstancename: str, page: str, wantRows: bool, wantFiles: bool=False) \
+        -> tuple[InstanceRecord, InstanceRecord|None, list[tuple], object, dict, list|None]:
+    ci=ConInstance("/"+seriesname, coninstancename, page=page)
+    rows=[FileRow(cf) for cf in ci.ConFiles] if wantRows else []
+    counter=GetPdfPageCounter()
+    if counter is None:
+        columns=ci.ComputeColumns
+        record=CountsToRecord(columns.Counts)
+        pageRecord=record if wantRows else None
+        pdfPages={}
+    else:
+        pageRecord=CountsToRecord(CountConFiles("/"+seriesname, coninstancename, ci.ConFiles, fillInPages=False)) if wantRows else None
+        columns=ci.ComputeColumns
+        record=CountsToRecord(columns.Counts)
+        pdfPages=counter.DrainCounted()
+    entries=FileEntries(seriesname, coninstancename, ci.ConFiles, columns) if wantFiles else None    # (With the pages as filled in)
+    return record, pageRecord, rows, Drain(), pdfPages, entries
+
+
+# What the workers need to set up their own PdfPageCounter: the mirror's root and the cache file ("" if none)
+def _PdfCounterArgs() -> tuple[str, str]:
+    counter=GetPdfPageCounter()
+    if counter is None:
+        return "", ""
+    return counter.Root, counter.CacheFile
+
+
+# ----------------------------------------------
+# Crawl the site with maxWorkers download threads and parseProcesses parsing processes
+# The results are the same as CrawlSite()'s: an iterator of the counts of each series, in the order of listOfConSeries.
+# With a journal, completed con instances are skipped and new ones are checkpointed, as in CrawlSite()
+def CrawlSiteWithParseProcesses(listOfConSeries: list[NameLinkCounts], source, maxWorkers: int, parseProcesses: int,
+                                index: ResultsIndex|None=None, journal: Journal|None=None, costs: dict[str, float]|None=None) -> Iterator[ConpubsCounts]:
+
+    wantRows=index is not None
+    fileIndex=GetFileIndex()
+    with ThreadPoolExecutor(max_workers=max(1, maxWorkers), thread_name_prefix="Download") as downloaders, \
+         ProcessPoolExecutor(max_workers=parseProcesses, initializer=_InitWorker, initargs=(GetLogLevel(), IsInstrumenting(), *_PdfCounterArgs())) as parsers:
+
+        # Download a con instance page and pass it on to be parsed.  This runs on a download thread.
+        # Returns either the stored counts (if the index has them), or the Future of the parse and the function which saves
+        #   its results (see InstanceCounts()), or None if the page couldn't be read
+        def FetchConInstance(seriesname: str, coninstancename: str) -> ConpubsCounts|tuple[Future, Callable]|None:
+            if journal is not None:
+                counts=journal.InstanceCounts(seriesname, coninstancename)
+                if counts is not None:
+                    if fileIndex is not None:
+                        fileIndex.AddStored(index, seriesname, coninstancename)
+                    return counts
+
+            try:
+                page=source.GetFileAsString(f"/{seriesname}/{coninstancename}", "index.html")
+            except PageFetchError:
+                return None     # It's listed in the source's FailedPages and not journaled, so --resume will try it again
+            if page is None:
+                LogInfo("CrawlSite: /%s/%s/index.html does not exist", seriesname, coninstancename)
+                counts=ConpubsCounts()
+                if journal is not None:
+                    journal.RecordInstance(seriesname, coninstancename, counts)
+                return counts
+
+            path=f"/{seriesname}/{coninstancename}/index.html"
+            pagehash=""
+            if index is not None:
+                pagehash=PageHash(page)
+                counts=index.LookupInstance(path, pagehash)
+                if counts is not None and (GetPdfPageCounter() is not None or fileIndex is not None):
+                    files=index.InstanceFiles(path)
+                    columns=None
+                    if GetPdfPageCounter() is not None:
+                        # The PDFs may have changed even though the page hasn't, so count the stored rows again
+                        columns=CountConFileColumns("/"+seriesname, coninstancename, files)
+                        counts=columns.Counts
+                    if fileIndex is not None:
+                        fileIndex.Add(seriesname, coninstancename, files, columns)
+                if counts is not None:
+                    if journal is not None:
+                        journal.RecordInstance(seriesname, coninstancename, counts)
+                    return counts
+
+            # Save the results of the parse and return the instance's counts
+            def Save(parsed: tuple) -> ConpubsCounts:
+                record, pageRecord, rows, stats, pdfPages, entries=parsed
+                Merge(stats)
+                if len(pdfPages) > 0:
+                    GetPdfPageCounter().MergeCounted(pdfPages)
+                if entries is not None:
+                    fileIndex.AddEntries(seriesname, coninstancename, entries)
+                if index is not None:
+                    index.StoreInstance(path, seriesname, pagehash, rows, RecordToCounts(pageRecord))
+                counts=RecordToCounts(record)
+                if journal is not None:
+                    journal.RecordInstance(seriesname, coninstancename, counts)
+                return counts
+            return parsers.submit(ParseConInstancePage, seriesname, coninstancename, page, wantRows, fileIndex is not None), Save
+
+        # Queue the con instance pages of a parsed series page to be downloaded
+        # Returns the series name and the Futures of its con instances, or None if the series page doesn't exist or couldn't be parsed
+        def QueueInstances(seriesname: str, instances: list[tuple[str, str]]|None) -> tuple[str, list[Future]]|None:
+            if instances is None:
+                return None
+            LogInfo("CrawlSite: %s: queueing %d con instances", seriesname, len(instances))
+            return seriesname, [downloaders.submit(FetchConInstance, seriesname, name) for name, _ in instances]
+
+        # Download a series page and pass it on to be parsed.  Once it has been parsed, its con instances are queued.
+        # Returns a Future of QueueInstances()'s result, or None if the page could not be downloaded (and should be tried again)
+        def FetchSeries(seriesname: str) -> Future|None:
+            try:
+                page=source.GetFileAsString("/"+seriesname, "index.html")
+            except PageFetchError:
+                return None
+            queued=Future()
+            if page is None:
+                # As in ConSeriesPage, a series without a page has no con instances, and it is done
+                LogError(f"CrawlSite: /{seriesname}/index.html does not exist")
+                queued.set_result(None)
+                return queued
+            path=f"/{seriesname}/index.html"
+            pagehash=""
+            if index is not None:
+                pagehash=PageHash(page)
+                stored=index.LookupSeriesPage(path, pagehash)
+                if stored is not None:
+                    name, nlcs=stored
+                    queued.set_result(QueueInstances(name, [(nlc.name, nlc.URL) for nlc in nlcs if nlc.URL != ""]))
+                    return queued
+
+            # This runs on the process pool's management thread when the parse is done
+            def Parsed(f: Future) -> None:
+                try:
+                    name, instances, stats=f.result()
+                    Merge(stats)
+                    if index is not None and instances is not None:
+                        index.StoreSeriesPage(path, pagehash, name, [NameLinkCounts(Name=n, URL=u) for n, u in instances])
+                    queued.set_result(QueueInstances(name, instances))
+                except Exception as e:
+                    queued.set_exception(e)
+            parsers.submit(ParseSeriesPage, seriesname, page).add_done_callback(Parsed)
+            return queued
+
+        # A con instance's counts, once it has been parsed
+        # Its results are saved here, on the thread which reduces the series, so that every con instance is journaled before
+        #   its series, and an exception in the parse is raised just once, here
+        def InstanceCounts(f: Future) -> ConpubsCounts|None:
+            result=f.result()
+            if isinstance(result, tuple):
+                parse, Save=result
+                return Save(parse.result())
+            return result
+
+        # Keep a window of series in flight (the biggest started first) and reduce them, one at a time and in order, just as the
+        #   serial crawl does
+        for i, sf in Schedule(len(listOfConSeries), lambda i: downloaders.submit(FetchSeries, listOfConSeries[i].name), SeriesWindow(maxWorkers),
+                              BiggestFirst(listOfConSeries, costs or {})):
+            csnl=listOfConSeries[i]
+            counts=ConpubsCounts()
+            counts.title=csnl.name
+            queued=sf.result()
+            if queued is None:
+                yield counts    # The page could not be downloaded.  The series is not journaled, so that --resume will try it again.
+                continue
+            result=queued.result()
+            complete=True
+            if result is not None:
+                counts.numseries=1
+                counts, complete=SumSeries(counts, (InstanceCounts(f) for f in result[1]))
+            if journal is not None and complete:
+                journal.RecordSeries(csnl.name, counts)
+            yield counts
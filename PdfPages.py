@@ -0,0 +1,262 @@
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor
+import json
+import mmap
+import os
+import re
+import threading
+import zlib
+
+from Log import LogError
+from LogLevels import LogInfo
+from HelpersPackage import Int0
+from ConFileData import ConFileData, FileKind, KindPdf
+
+
+#####################################################################################
+# Count the pages of the PDFs in a local mirror of the site, to fill in the page counts the site's pages don't give
+# (Rows from json of version 7 or earlier have no _pages, and HTML rows without "pp" in their <small> get nothing.)
+# A PDF is not parsed.  It is memory-mapped and we look for the root of its page tree, the /Type /Pages dictionary
+#   which has no /Parent, and take its /Count.  If the page tree is inside compressed object streams (PDF 1.5 and later),
+#   those streams are inflated and searched too.  If there's no page tree to be found, we count the /Type /Page leaves.
+# Counting runs in a pool of processes, and results are cached (by the file's size and mtime) in a json file.
+
+_pagesType=re.compile(rb"/Type\s*/Pages(?![A-Za-z])")
+_pageType=re.compile(rb"/Type\s*/Page(?![A-Za-z])")
+_objStmType=re.compile(rb"/Type\s*/ObjStm(?![A-Za-z])")
+_count=re.compile(rb"/Count\s+(\d+)")
+_parent=re.compile(rb"/Parent\s")
+
+
+# Returns the number of pages in the PDF, or None if it can't be read or no pages can be found
+def CountPdfPages(pathname: str) -> int|None:
+    try:
+        with open(pathname, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return None
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                if data[:5] != b"%PDF-":
+                    return None
+                pages=_PageTreeCount(data)
+                if pages is not None:
+                    return pages
+                streams=_ObjectStreams(data)
+                for stream in streams:
+                    pages=_PageTreeCount(stream)
+                    if pages is not None:
+                        return pages
+                leaves=len(_pageType.findall(data))+sum(len(_pageType.findall(x)) for x in streams)
+                return leaves if leaves > 0 else None
+    except (OSError, ValueError):
+        return None
+
+
+# Find the /Count of the page tree's root in data (the last one, if the file has been updated incrementally)
+def _PageTreeCount(data) -> int|None:
+    roots: list[int]=[]
+    nodes: list[int]=[]
+    for m in _pagesType.finditer(data):
+        bounds=_EnclosingDict(data, m.start())
+        if bounds is None:
+            continue
+        d=data[bounds[0]:bounds[1]]
+        c=_count.search(d)
+        if c is None:
+            continue
+        nodes.append(int(c.group(1)))
+        if _parent.search(d) is None:
+            roots.append(int(c.group(1)))
+    if len(roots) > 0:
+        return roots[-1]
+    if len(nodes) > 0:
+        return max(nodes)
+    return None
+
+
+# The [start, end) of the << ... >> dictionary which contains pos, allowing for dictionaries nested inside it
+def _EnclosingDict(data, pos: int) -> tuple[int, int]|None:
+    depth=0
+    loc=pos
+    while True:
+        opener=data.rfind(b"<<", 0, loc)
+        closer=data.rfind(b">>", 0, loc)
+        if opener < 0:
+            return None
+        if closer > opener:
+            depth+=1
+            loc=closer
+            continue
+        if depth == 0:
+            start=opener
+            break
+        depth-=1
+        loc=opener
+
+    depth=0
+    loc=pos
+    while True:
+        opener=data.find(b"<<", loc)
+        closer=data.find(b">>", loc)
+        if closer < 0:
+            return None
+        if 0 <= opener < closer:
+            depth+=1
+            loc=opener+2
+            continue
+        if depth == 0:
+            return start, closer+2
+        depth-=1
+        loc=closer+2
+
+
+# Inflate the compressed object streams of a PDF
+def _ObjectStreams(data) -> list[bytes]:
+    streams=[]
+    for m in _objStmType.finditer(data):
+        bounds=_EnclosingDict(data, m.start())
+        if bounds is None or b"/FlateDecode" not in data[bounds[0]:bounds[1]]:
+            continue
+        start=data.find(b"stream", bounds[1])
+        if start < 0:
+            continue
+        start+=len("stream")
+        if data[start:start+2] == b"\r\n":
+            start+=2
+        elif data[start:start+1] == b"\n":
+            start+=1
+        end=data.find(b"endstream", start)
+        if end < 0:
+            continue
+        try:
+            streams.append(zlib.decompressobj().decompress(data[start:end]))
+        except zlib.error:
+            continue
+    return streams
+
+
+#####################################################################################
+# Counts the pages of the PDFs under a mirror's root directory, caching the results
+# This is safe to use from several threads.  If processes is 0, the counting is done in the calling thread.
+# If saveCache is False the cache file is only read.  (The parse worker processes use this: each has its own counter,
+#   and sends what it counts back to the parent's with DrainCounted() and MergeCounted().)
+class PdfPageCounter:
+
+    def __init__(self, root: str, cacheFile: str="", processes: int=0, saveCache: bool=True):
+        self._root: str=os.path.abspath(root)
+        self._cacheFile: str=cacheFile
+        self._saveCache: bool=saveCache and cacheFile != ""
+        self._lock=threading.Lock()
+        self._cache: dict[str, list]={}     # Path relative to the root -> [size, mtime_ns, pages or None]
+        self._counted: dict[str, list]={}   # The entries added to the cache since the last DrainCounted()
+        self._pool=ProcessPoolExecutor(max_workers=processes) if processes > 0 else None
+        self.NumCounted: int=0
+        self.NumCached: int=0
+
+        if cacheFile != "":
+            try:
+                with open(cacheFile, encoding="utf-8") as f:
+                    self._cache=json.load(f)
+            except FileNotFoundError:
+                pass
+            except (OSError, json.decoder.JSONDecodeError) as e:
+                LogError(f"PdfPageCounter: the cache file '{cacheFile}' can't be read and is ignored: {e}")
+
+
+    @property
+    def Root(self) -> str:
+        return self._root
+
+
+    @property
+    def CacheFile(self) -> str:
+        return self._cacheFile
+
+
+    def Close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown()
+        if self._saveCache:
+            with self._lock:
+                with open(self._cacheFile+".tmp", "w", encoding="utf-8") as f:
+                    json.dump(self._cache, f)
+                os.replace(self._cacheFile+".tmp", self._cacheFile)
+        LogInfo("PdfPageCounter: counted the pages of %d PDFs, and took %d from the cache", self.NumCounted, self.NumCached)
+
+
+    # ----------------------------------------------
+    # The page counts of a list of PDFs (paths relative to the root), with None for any which can't be counted
+    def Pages(self, relpaths: list[str]) -> list[int|None]:
+        results: list[int|None]=[None]*len(relpaths)
+        todo: list[tuple[int, str, list]]=[]      # (index, full path, [size, mtime_ns])
+        for i, relpath in enumerate(relpaths):
+            pathname=os.path.normpath(os.path.join(self._root, relpath))
+            if not pathname.startswith(self._root+os.sep):
+                continue        # Don't go outside the mirror
+            try:
+                st=os.stat(pathname)
+            except OSError:
+                continue
+            key=[st.st_size, st.st_mtime_ns]
+            with self._lock:
+                cached=self._cache.get(relpath)
+            if cached is not None and cached[:2] == key:
+                results[i]=cached[2]
+                with self._lock:
+                    self.NumCached+=1
+                continue
+            todo.append((i, pathname, key))
+
+        if len(todo) > 0:
+            pathnames=[x[1] for x in todo]
+            if self._pool is not None and len(todo) > 1:
+                counted=list(self._pool.map(CountPdfPages, pathnames))
+            else:
+                counted=[CountPdfPages(x) for x in pathnames]
+            with self._lock:
+                for (i, _, key), pages in zip(todo, counted):
+                    results[i]=pages
+                    self._cache[relpaths[i]]=self._counted[relpaths[i]]=key+[pages]
+                    self.NumCounted+=1
+        return results
+
+
+    # ----------------------------------------------
+    # Hand over (and clear) the entries counted since the last call, e.g., to send them from a worker process to the parent
+    def DrainCounted(self) -> dict[str, list]:
+        with self._lock:
+            counted=self._counted
+            self._counted={}
+        return counted
+
+
+    # Add entries counted by another PdfPageCounter to the cache
+    def MergeCounted(self, counted: dict[str, list]) -> None:
+        with self._lock:
+            self._cache.update(counted)
+            self.NumCounted+=len(counted)
+
+
+    # Fill in the missing page counts of the PDF rows of a con instance
+    def FillInPages(self, seriesname: str, coninstancename: str, files: list[ConFileData]) -> None:
+        rows=[cf for cf in files if not cf.IsLinkRow and not cf.IsTextRow and Int0(cf.Pages) == 0 and FileKind(cf.SiteFilename) == KindPdf]
+        if len(rows) == 0:
+            return
+        directory="/".join(x for x in (seriesname.strip("/"), coninstancename) if x != "")
+        for cf, pages in zip(rows, self.Pages([f"{directory}/{cf.SiteFilename}" for cf in rows])):
+            if pages is not None:
+                cf.Pages=pages
+
+
+# ----------------------------------------------
+# The counter which ConInstance.ComputeCounts() uses to fill in missing page counts (None: don't)
+_counter: PdfPageCounter|None=None
+
+
+def SetPdfPageCounter(counter: PdfPageCounter|None) -> None:
+    global _counter
+    _counter=counter
+
+
+def GetPdfPageCounter() -> PdfPageCounter|None:
+    return _counter
@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import threading
+
+from LogLevels import LogInfo
+from ConpubsCounts import ConpubsCounts, NameLinkCounts
+from ConFileData import ConFileData
+
+
+# The ConpubsCounts members which are stored
+_countFields=("numpdfs", "numpages", "numimages", "numcons", "numseries", "numlinks")
+
+
+# A ConFileData as a row of the files table (less its path and sequence number)
+FileRowFields=("DisplayTitle", "Notes", "SiteFilename", "Size", "Pages", "IsTextRow", "IsLinkRow")
+
+
+def FileRow(cf: ConFileData) -> tuple:
+    return cf.DisplayTitle, cf.Notes, cf.SiteFilename, cf.Size, cf.Pages, cf.IsTextRow, cf.IsLinkRow
+
+
+# And back again
+def FileFromRow(row) -> ConFileData:
+    cf=ConFileData()
+    cf.DisplayTitle, cf.Notes, cf.SiteFilename, cf.Size, cf.Pages=row[:5]
+    cf.IsTextRow=bool(row[5])
+    cf.IsLinkRow=bool(row[6])
+    return cf
+
+
+# The hash we use to tell if a page has changed
+def PageHash(page: str) -> str:
+    return hashlib.sha1(page.encode("utf-8", errors="replace")).hexdigest()
+
+
+#####################################################################################
+# A persistent index (a SQLite file) of the results of parsing each page, keyed by the page's path and a hash of its contents
+# For each con instance page it holds the parsed ConFileData rows and the page's ConpubsCounts; for each series page, the
+#   list of con instances it names.  On a rerun, a page whose hash matches what's in the index does not need to be parsed
+#   or counted again.
+# It also holds each series' totals from the last run so that we can report which series have changed.
+class ResultsIndex:
+
+    def __init__(self, filename: str):
+        self._filename: str=filename
+        self._lock=threading.Lock()
+        self._db=sqlite3.connect(filename, check_same_thread=False)
+        counts=", ".join(f"{x} INTEGER" for x in _countFields)
+        self._db.executescript(f"""
+            CREATE TABLE IF NOT EXISTS instances (path TEXT PRIMARY KEY, series TEXT, hash TEXT, {counts});
+            CREATE TABLE IF NOT EXISTS files (path TEXT, seq INTEGER, displaytitle TEXT, notes TEXT, sitefilename TEXT, size REAL,
+                                              pages INTEGER, istext INTEGER, islink INTEGER, PRIMARY KEY (path, seq));
+            CREATE TABLE IF NOT EXISTS seriespages (path TEXT PRIMARY KEY, hash TEXT, instances TEXT, seriesname TEXT);
+            CREATE TABLE IF NOT EXISTS series (name TEXT PRIMARY KEY, {counts});
+            CREATE TABLE IF NOT EXISTS seriesdigests (name TEXT PRIMARY KEY, digest TEXT);
+        """)
+        # Indexes made before the series name was kept in seriespages need the column.  (Their rows have no name, and are
+        #   treated as not indexed, so each series page is parsed once more.)
+        if "seriesname" not in [x[1] for x in self._db.execute("PRAGMA table_info(seriespages)")]:
+            self._db.execute("ALTER TABLE seriespages ADD COLUMN seriesname TEXT")
+        self.NumReused: int=0      # Pages whose stored results were used
+        self.NumParsed: int=0      # Pages which had to be parsed
+
+
+    def Close(self) -> None:
+        with self._lock:
+            self._db.commit()
+            self._db.close()
+        LogInfo("ResultsIndex: reused the results of %d pages, parsed %d pages", self.NumReused, self.NumParsed)
+
+
+    # ----------------------------------------------
+    @staticmethod
+    def _CountsFromRow(row) -> ConpubsCounts:
+        cpc=ConpubsCounts()
+        for field, val in zip(_countFields, row):
+            setattr(cpc, field, val)
+        return cpc
+
+
+    # ----------------------------------------------
+    # Return the stored counts of a con instance page if the page is unchanged, and None otherwise
+    def LookupInstance(self, path: str, pagehash: str) -> ConpubsCounts|None:
+        with self._lock:
+            row=self._db.execute(f"SELECT {', '.join(_countFields)} FROM instances WHERE path=? AND hash=?", (path, pagehash)).fetchone()
+            if row is None:
+                self.NumParsed+=1
+                return None
+            self.NumReused+=1
+        return ResultsIndex._CountsFromRow(row)
+
+
+    # Save the parsed rows (see FileRow()) and the counts of a con instance page
+    def StoreInstance(self, path: str, seriesname: str, pagehash: str, files: list[tuple], counts: ConpubsCounts) -> None:
+        with self._lock:
+            self._db.execute(f"INSERT OR REPLACE INTO instances VALUES (?, ?, ?, {', '.join('?'*len(_countFields))})",
+                             (path, seriesname, pagehash, *[getattr(counts, x) for x in _countFields]))
+            self._db.execute("DELETE FROM files WHERE path=?", (path,))
+            self._db.executemany("INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                 [(path, i, *row) for i, row in enumerate(files)])
+
+
+    # Get back the parsed rows of a con instance page
+    def InstanceFiles(self, path: str) -> list[ConFileData]:
+        with self._lock:
+            rows=self._db.execute("SELECT displaytitle, notes, sitefilename, size, pages, istext, islink FROM files WHERE path=? ORDER BY seq", (path,)).fetchall()
+        return [FileFromRow(row) for row in rows]
+
+
+    # Whether a con instance page has been indexed at all
+    def HasInstance(self, path: str) -> bool:
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM instances WHERE path=?", (path,)).fetchone() is not None
+
+
+    # ----------------------------------------------
+    # Return the stored series name and list of con instances of a series page if the page is unchanged, and None otherwise
+    # (The series name is the one its con instances are under.  It's the page's directory, except for a v0 page, which
+    #   names the series itself: see ConSeriesPage.FromJson().)
+    def LookupSeriesPage(self, path: str, pagehash: str) -> tuple[str, list[NameLinkCounts]]|None:
+        with self._lock:
+            row=self._db.execute("SELECT seriesname, instances FROM seriespages WHERE path=? AND hash=? AND seriesname IS NOT NULL",
+                                 (path, pagehash)).fetchone()
+            if row is None:
+                self.NumParsed+=1
+                return None
+            self.NumReused+=1
+        return row[0], [NameLinkCounts(Name=name, URL=url) for name, url in json.loads(row[1])]
+
+
+    def StoreSeriesPage(self, path: str, pagehash: str, seriesname: str, nlcs: list[NameLinkCounts]) -> None:
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO seriespages VALUES (?, ?, ?, ?)",
+                             (path, pagehash, json.dumps([(x.name, x.URL) for x in nlcs]), seriesname))
+
+
+    # The series name and the names of the con instances (with pages) of the series page as it was last parsed, or None
+    #   if it never has been
+    def SeriesPageInstances(self, path: str) -> tuple[str, list[str]]|None:
+        with self._lock:
+            row=self._db.execute("SELECT seriesname, instances FROM seriespages WHERE path=? AND seriesname IS NOT NULL", (path,)).fetchone()
+        if row is None:
+            return None
+        return row[0], [name for name, url in json.loads(row[1]) if url != ""]
+
+
+    # ----------------------------------------------
+    # The digest of a series' pages as of the last run (see Digests.py), or None
+    def SeriesDigest(self, seriesname: str) -> str|None:
+        with self._lock:
+            row=self._db.execute("SELECT digest FROM seriesdigests WHERE name=?", (seriesname,)).fetchone()
+        return None if row is None else row[0]
+
+
+    # A digest of None forgets the series' digest, so that it will be crawled next time
+    def StoreSeriesDigest(self, seriesname: str, digest: str|None) -> None:
+        with self._lock:
+            if digest is None:
+                self._db.execute("DELETE FROM seriesdigests WHERE name=?", (seriesname,))
+            else:
+                self._db.execute("INSERT OR REPLACE INTO seriesdigests VALUES (?, ?)", (seriesname, digest))
+
+
+    # ----------------------------------------------
+    # Each series' totals from the last run
+    def SeriesTotals(self) -> dict[str, ConpubsCounts]:
+        with self._lock:
+            rows=self._db.execute(f"SELECT name, {', '.join(_countFields)} FROM series").fetchall()
+        return {row[0]: ResultsIndex._CountsFromRow(row[1:]) for row in rows}
+
+
+    # Compare this run's series totals with those of the last run and save the new ones
+    # Returns the list of (this run's counts, last run's counts or None if the series is new) for the series whose totals moved
+    def UpdateSeriesTotals(self, seriesCounts: list[ConpubsCounts]) -> list[tuple[ConpubsCounts, ConpubsCounts|None]]:
+        changed=[]
+        with self._lock:
+            for counts in seriesCounts:
+                row=self._db.execute(f"SELECT {', '.join(_countFields)} FROM series WHERE name=?", (counts.title,)).fetchone()
+                old=None if row is None else ResultsIndex._CountsFromRow(row)
+                if old is None or any(getattr(old, x) != getattr(counts, x) for x in _countFields):
+                    changed.append((counts, old))
+                self._db.execute(f"INSERT OR REPLACE INTO series VALUES (?, {', '.join('?'*len(_countFields))})",
+                                 (counts.title, *[getattr(counts, x) for x in _countFields]))
+        return changed
@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import re
+
+from HelpersPackage import Float0, Int0
+
+
+#####################################################################################
+# Pulling the metadata out of a row of a con instance or con series page
+# These run once for every row on the site, so the patterns are compiled once, and each is anchored or scans its text
+#   just once.  They give the same results as the code they replaced in ConInstance.LoadConInstanceFromHTML() and
+#   ConSeriesPage.ConNameInfoUnpack(), except that an href like "x.pdf#page=2&view=Fit" no longer hangs (see NormalizeHref()).
+
+
+# An href with a "/" in it is a link to somewhere else rather than a file in the con instance's directory
+def IsLinkHref(href: str) -> bool:
+    return "/" in href
+
+
+# ----------------------------------------------
+# Strip any view=Fit specs from an href.  There may be more than one, of the forms
+#       #view=Fit
+#       #xxx=yyy&view=Fit
+#       #view=Fit&xxx=yyy
+# Each "view=Fit&" is removed and a "#view=Fit" not followed by "&" is removed with its "#", which leaves whatever else
+#   was in the fragment ("x.pdf#view=Fit&page=2" -> "x.pdf#page=2").  A "view=Fit" which is neither (e.g., at the end
+#   after a "&") is removed with the "&" or "#" before it.  (The old code looped forever on those.)
+_viewFit=re.compile("view=fit&|#view=fit(?!&)", re.IGNORECASE)
+_strayViewFit=re.compile("[&#]?view=fit", re.IGNORECASE)
+
+def NormalizeHref(href: str) -> str:
+    if "=" not in href:
+        return href     # Nearly every href
+    while "view=fit" in href.lower():
+        stripped=_viewFit.sub("", href)
+        if stripped == href:
+            stripped=_strayViewFit.sub("", href)
+            if stripped == href:
+                break
+        href=stripped
+    return href
+
+
+# ----------------------------------------------
+# The size (in MB) and page count in the <small>...</small> of a file's row, e.g. "(1.2 MB; 36 pp)".  Either is None if
+#   the row doesn't give it.
+# Both are found in one scan: the first number followed by " MB" and the first whole number followed by " pp", on the
+#   first line of the text.
+_sizeOrPages=re.compile(r"([0-9.]+) MB|([0-9]+) pp", re.IGNORECASE)
+
+def SmallMetadata(small: str) -> tuple[float|None, int|None]:
+    small=small.replace("&nbsp;", " ")
+    end=small.find("\n")
+    if end < 0:
+        end=len(small)
+    size=None
+    pages=None
+    for sizeText, pagesText in _sizeOrPages.findall(small, 0, end):
+        if sizeText != "":
+            if size is None:
+                size=Float0(sizeText)
+                if size > 500:  # We're looking for a value in MB, but if we get a value in bytes, convert it
+                    size=size/(1024**2)
+        elif pages is None:
+            pages=Int0(pagesText)
+    return size, pages
+
+
+# ----------------------------------------------
+# A con series page's Convention cell is of the form <a href=xxxx>yyyy</a>zzzz
+# Returns the name, the URL and the extra text.  If the cell isn't a link, it's all name.
+_conNameInfo=re.compile('<a href=\"?(.*?)\"?>(.*?)</a>(.*)$', re.IGNORECASE)
+
+def UnpackConNameInfo(packed: str) -> tuple[str, str, str]:
+    m=_conNameInfo.match(packed)
+    if m is None:
+        return packed, "", ""
+    url, name, extra=m.groups()
+    return name.strip(), url.strip(), extra.strip()
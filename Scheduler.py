@@ -0,0 +1,68 @@
+from __future__ import annotations
+from typing import Callable, Iterable, Iterator
+
+from concurrent.futures import Future
+
+from ConpubsCounts import ConpubsCounts, NameLinkCounts
+
+
+#####################################################################################
+# The order in which a concurrent crawl starts the series
+# The series differ enormously in size (Worldcon has far more con instances than most), and a big series started near the
+#   end of a run is its long pole.  So the outsized series are started first, biggest first, their size being estimated
+#   from the number of con instances each had in an earlier run (from the journal or the ResultsIndex).  The rest are
+#   started in the site's order.
+# Each con instance of a series is a separate piece of work, so a big series is spread across all the workers, and the
+#   results are still produced in the site's order.  That's why only the outsized series are moved: the series which is due
+#   next has to wait for all the work queued ahead of it, and if every series were started biggest first, the small ones
+#   would each wait at the back of the queue while the workers ran out of other things to do.
+
+outsizedFactor=4        # A series is outsized if it is estimated to cost this many times the average series
+
+
+# The estimated cost of each series, from the counts of earlier runs.  (Where there are several, the later ones win.)
+def SeriesCosts(*earlier: dict[str, ConpubsCounts]) -> dict[str, float]:
+    costs: dict[str, float]={}
+    for counts in earlier:
+        for name, cpc in counts.items():
+            costs[name]=1+cpc.numcons      # The series page and each of its con instance pages
+    return costs
+
+
+# The positions in listOfConSeries in the order they should be started: the outsized series, most costly first, then the
+#   rest in order
+def BiggestFirst(listOfConSeries: list[NameLinkCounts], costs: dict[str, float]) -> list[int]:
+    if len(costs) == 0:
+        return list(range(len(listOfConSeries)))
+    average=sum(costs.values())/len(costs)
+    outsized=[i for i, x in enumerate(listOfConSeries) if costs.get(x.name, 0) >= outsizedFactor*average]
+    outsized.sort(key=lambda i: -costs[listOfConSeries[i].name])
+    moved=set(outsized)
+    return outsized+[i for i in range(len(listOfConSeries)) if i not in moved]
+
+
+# ----------------------------------------------
+# Start n pieces of work, in the given order (default: 0..n-1), keeping no more than window of them in flight beyond
+#   the one the caller is waiting for.  Yields (i, start(i)'s Future) for i=0..n-1, in that order.
+# The piece due next is always started, even if the order would put it later, so the caller never waits on something
+#   which hasn't been started.
+def Schedule(n: int, start: Callable[[int], Future], window: int, order: Iterable[int]|None=None) -> Iterator[tuple[int, Future]]:
+    pending=iter(order if order is not None else range(n))
+    begun=[False]*n
+    started: dict[int, Future]={}
+
+    def Start(i: int) -> None:
+        begun[i]=True
+        started[i]=start(i)
+
+    for i in range(n):
+        if not begun[i]:
+            Start(i)
+        f=started.pop(i)
+        while len(started) < window:
+            j=next(pending, None)
+            if j is None:
+                break
+            if not begun[j]:
+                Start(j)
+        yield i, f
@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+import csv
+import json
+import sys
+
+from ConpubsCounts import ConpubsCounts
+
+
+#####################################################################################
+# Write each series' counts out as soon as it is done, one line per series, so that a run can be watched as it goes
+#   and its output piped into other tools
+# The format is JSONL ({"series": name, "numpdfs": n, ...}) or CSV (with a header line), chosen by format or, if that's
+#   empty, by the filename's extension.  A filename of "-" writes to stdout.
+class SeriesWriter:
+
+    def __init__(self, filename: str, format: str=""):
+        if format == "":
+            format="csv" if filename.lower().endswith(".csv") else "jsonl"
+        self._format: str=format
+        self._file=sys.stdout if filename == "-" else open(filename, "w", encoding="utf-8", newline="")
+        self._csv=None
+        if format == "csv":
+            self._csv=csv.writer(self._file)
+            self._csv.writerow(("series",)+ConpubsCounts.Fields)
+            self._file.flush()
+
+
+    def Close(self) -> None:
+        if self._file is not sys.stdout:
+            self._file.close()
+
+
+    def Write(self, counts: ConpubsCounts) -> None:
+        if self._csv is not None:
+            self._csv.writerow([counts.title]+[getattr(counts, x) for x in ConpubsCounts.Fields])
+        else:
+            self._file.write(json.dumps({"series": counts.title} | counts.AsDict())+"\n")
+        self._file.flush()
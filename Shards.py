@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import argparse
+import json
+import zlib
+
+from ConpubsCounts import ConpubsCounts, NameLinkCounts
+
+
+#####################################################################################
+# Splitting a run across several machines, and putting the pieces back together
+# A shard is chosen by a stable hash of the series' name (so every machine, and every run, puts a series in the same
+#   shard), or by naming the series to be run.  Each run writes its per-series counts to a partial results file, and
+#   MergePartials() combines any set of partial files into the results for the whole site.
+# A partial results file is JSONL:
+#   {"partial": 1, "shard": "3/8" or "", "series": [the names selected, if a list was given], "site": [every series on the site, in order]}
+#   {"series": name, "counts": {...}}       one line for each series of the shard, written as it is finished
+#   {"done": n}                             n series were written.  (If this is missing, the run did not finish.)
+# Because every file lists the whole site, a merge can report the series which no file has (e.g., a shard that is
+#   missing) and those which more than one file has (e.g., a shard that was run twice), and can put the series back in
+#   the site's order however the files are given.
+
+
+# Parse "i/n" (1 <= i <= n) into (i, n).  Raises ValueError if it's not valid.
+def ParseShard(shard: str) -> tuple[int, int]:
+    i, _, n=shard.partition("/")
+    try:
+        i=int(i)
+        n=int(n)
+    except ValueError:
+        i=n=0
+    if n < 1 or i < 1 or i > n:
+        raise ValueError(f"'{shard}' is not a shard: it should be i/n with 1 <= i <= n")
+    return i, n
+
+
+# The argparse type of --shard: the shard as given, once it has been checked, so that a bad one is reported before anything is done
+# ("" is no shard: the whole site.)
+def ShardArgument(shard: str) -> str:
+    if shard == "":
+        return shard
+    try:
+        ParseShard(shard)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e)) from e
+    return shard
+
+
+# The shard (1..n) a series is in.  (Python's hash() of a str changes from run to run, so we use crc32.)
+def ShardOf(seriesname: str, n: int) -> int:
+    return zlib.crc32(seriesname.encode("utf-8"))%n+1
+
+
+def SelectShard(listOfConSeries: list[NameLinkCounts], i: int, n: int) -> list[NameLinkCounts]:
+    return [x for x in listOfConSeries if ShardOf(x.name, n) == i]
+
+
+#####################################################################################
+class PartialResultsWriter:
+
+    def __init__(self, filename: str, site: list[str], shard: str="", series: list[str]|None=None):
+        self._file=open(filename, "w", encoding="utf-8")
+        self._count: int=0
+        self._Write({"partial": 1, "shard": shard, "series": series or [], "site": site})
+
+
+    def Write(self, counts: ConpubsCounts) -> None:
+        self._Write({"series": counts.title, "counts": counts.AsDict()})
+        self._count+=1
+
+
+    # Only call this when the run has finished: it marks the file as complete
+    def Close(self) -> None:
+        self._Write({"done": self._count})
+        self._file.close()
+
+
+    def _Write(self, d: dict) -> None:
+        self._file.write(json.dumps(d)+"\n")
+        self._file.flush()
+
+
+#####################################################################################
+# Combine partial results files
+# Returns the counts of each series which was found, in the site's order, and a list of the problems found.  (If there
+#   are any problems, the totals are not those of the whole site.)
+def MergePartials(filenames: list[str]) -> tuple[list[ConpubsCounts], list[str]]:
+    problems: list[str]=[]
+    site: list[str]|None=None
+    found: dict[str, tuple[ConpubsCounts, str]]={}     # Series name -> (its counts, the file they came from)
+    shards: dict[str, str]={}                           # Shard -> the file it came from
+    numShards: set[int]=set()
+
+    for filename in filenames:
+        try:
+            with open(filename, encoding="utf-8") as f:
+                lines=[json.loads(line) for line in f if line.strip() != ""]
+        except (OSError, json.decoder.JSONDecodeError) as e:
+            problems.append(f"'{filename}' can't be read: {e}")
+            continue
+        if len(lines) == 0 or lines[0].get("partial") != 1:
+            problems.append(f"'{filename}' is not a partial results file")
+            continue
+
+        header=lines[0]
+        if site is None:
+            site=header["site"]
+        elif header["site"] != site:
+            problems.append(f"'{filename}' is from a run over a different list of series than '{filenames[0]}'")
+            continue
+
+        if header["shard"] != "":
+            if header["shard"] in shards:
+                problems.append(f"Shard {header['shard']} is in both '{shards[header['shard']]}' and '{filename}', so '{filename}' is ignored")
+                continue
+            shards[header["shard"]]=filename
+            numShards.add(ParseShard(header["shard"])[1])
+
+        results=[x for x in lines[1:] if "series" in x]
+        if "done" not in lines[-1] or lines[-1]["done"] != len(results):
+            problems.append(f"'{filename}' is incomplete: the run which wrote it did not finish")
+
+        for x in results:
+            name=x["series"]
+            if name in found:
+                problems.append(f"Series '{name}' is in both '{found[name][1]}' and '{filename}'")
+                continue
+            counts=ConpubsCounts().FromDict(x["counts"])
+            counts.title=name
+            found[name]=(counts, filename)
+
+    if site is None:
+        return [], problems+["No partial results were read"]
+
+    if len(numShards) > 1:
+        problems.append(f"The files come from runs split into different numbers of shards: {', '.join(str(x) for x in sorted(numShards))}")
+    elif len(numShards) == 1:
+        n=numShards.pop()
+        missing=[str(i) for i in range(1, n+1) if f"{i}/{n}" not in shards]
+        if len(missing) > 0:
+            problems.append(f"Missing shards (of {n}): {', '.join(missing)}")
+
+    missing=[x for x in site if x not in found]
+    if len(missing) > 0:
+        problems.append(f"{len(missing)} series are in none of the files: {', '.join(missing[:10])}{', ...' if len(missing) > 10 else ''}")
+    onSite=set(site)
+    unknown=[x for x in found if x not in onSite]
+    if len(unknown) > 0:
+        problems.append(f"{len(unknown)} series are not on the site: {', '.join(unknown[:10])}{', ...' if len(unknown) > 10 else ''}")
+
+    return [found[x][0] for x in site if x in found], problems
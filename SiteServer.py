@@ -0,0 +1,334 @@
+from __future__ import annotations
+from typing import Callable, NamedTuple
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+import json
+import threading
+import time
+
+from Log import Log, LogError
+from LogLevels import LogInfo, LogDebug
+from ConSeries import ConSeriesPage
+from ConInstance import ConInstance, CountConFiles
+from ConpubsCounts import ConpubsCounts, NameLinkCounts
+from ConFileData import ConFileRows
+from FetchPolicy import RetryingPageSource
+from PageHeader import PageHeader
+from PageSource import PageFetchError
+from ParseStage import SumSeries
+from PdfPages import GetPdfPageCounter
+from ResultsIndex import PageHash, FileRowFields
+
+
+#####################################################################################
+# A long-running server which keeps the whole site's counts in memory and answers queries about them over HTTP
+# SiteModel holds the parsed site: each series page's list of con instances, and each con instance page's rows and
+#   counts, along with a hash of each page.  Refresh() reloads the site, but only parses the pages whose hashes have
+#   changed.  (With a PageCache under the source, only changed pages are downloaded, too.)  Each refresh builds a new
+#   SiteSnapshot and swaps it in whole, so a query always sees one complete, consistent version of the site.
+# SiteServer refreshes the model on a schedule in the background and serves it as JSON:
+#   GET  /totals                    The site's grand total
+#   GET  /series                    The counts of each series, in the site's order
+#   GET  /series/<name>             A series' counts and those of each of its con instances
+#   GET  /series/<name>/<instance>  A con instance's counts and its file rows
+#   GET  /status                    When the model was last refreshed, how long that took, and the pages which failed
+#   POST /refresh                   Start a refresh now rather than waiting for the next one
+# If a page can't be read during a refresh, what was loaded for it last time is kept.
+
+class InstanceModel(NamedTuple):
+    Name: str
+    Hash: str                   # "" if the page doesn't exist
+    Rows: ConFileRows           # As on the page, before any page counts are filled in from PDFs
+    Counts: ConpubsCounts
+
+
+class SeriesModel(NamedTuple):
+    Name: str                   # As listed on the main page
+    PathName: str               # The series' directory (the series page may rename it)
+    Hash: str
+    PageCounts: ConpubsCounts   # The counts of the series page alone
+    Instances: list[str]        # The con instances which have pages, in order
+    Counts: ConpubsCounts       # Including all of its con instances
+
+
+class SiteSnapshot(NamedTuple):
+    RootHash: str
+    SeriesList: list[NameLinkCounts]
+    Series: dict[str, SeriesModel]
+    Instances: dict[tuple[str, str], InstanceModel]     # (Series name, con instance name) -> InstanceModel
+    Total: ConpubsCounts
+    Refreshed: float            # time.time() at the end of the refresh
+    Seconds: float              # How long the refresh took
+    NumParsed: int              # Pages which were parsed
+    NumReused: int              # Pages which were unchanged
+    FailedPages: list[str]
+
+
+#####################################################################################
+class SiteModel:
+
+    # loadSeriesList reads the main page (see ConpubsAnalyzer.DownloadMainConlist())
+    # source should be safe to use from several threads if workers > 1
+    def __init__(self, source: RetryingPageSource, loadSeriesList: Callable[[RetryingPageSource, PageHeader], list[NameLinkCounts]], workers: int=1):
+        self._source: RetryingPageSource=source
+        self._loadSeriesList=loadSeriesList
+        self._workers: int=max(1, workers)
+        self._site: SiteSnapshot|None=None
+        self._refreshLock=threading.Lock()     # One refresh at a time
+        self.Refreshing: bool=False
+
+
+    # The current snapshot, or None if the site hasn't been loaded yet
+    @property
+    def Site(self) -> SiteSnapshot|None:
+        return self._site
+
+
+    # ----------------------------------------------
+    # Reload the site, parsing only the pages which have changed.  Returns False if the main page couldn't be read.
+    def Refresh(self) -> bool:
+        with self._refreshLock:
+            self.Refreshing=True
+            try:
+                return self._Refresh()
+            finally:
+                self.Refreshing=False
+
+
+    def _Refresh(self) -> bool:
+        start=time.perf_counter()
+        old=self._site
+        numFailed=len(self._source.FailedPages)
+
+        try:
+            page=self._source.GetFileAsString("", "index.html")
+        except PageFetchError:
+            page=None
+        if page is None:
+            LogError("SiteModel: root/index.html can't be read, so the site has not been refreshed")
+            return False
+        roothash=PageHash(page)
+        if old is not None and old.RootHash == roothash:
+            listOfConSeries=old.SeriesList
+        else:
+            listOfConSeries=self._loadSeriesList(self._source, PageHeader(page))
+
+        # First the series pages, then all of their con instance pages
+        with ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="Refresh") as pool:
+            series=list(pool.map(lambda x: self._RefreshSeries(x.name, old), listOfConSeries))
+            todo=[(s, name) for s, _ in series for name in s.Instances]
+            loaded=list(pool.map(lambda x: self._RefreshInstance(x[0], x[1], old), todo))
+
+        instances: dict[tuple[str, str], InstanceModel]={}
+        for (s, _), (im, _) in zip(todo, loaded):
+            instances[(s.Name, im.Name)]=im
+
+        # Add up the series in the site's order, exactly as a crawl does
+        total=ConpubsCounts()
+        seriesModels: dict[str, SeriesModel]={}
+        for s, _ in series:
+            counts, _=SumSeries(s.PageCounts, (instances[(s.Name, name)].Counts for name in s.Instances))
+            counts.title=s.Name
+            seriesModels[s.Name]=s._replace(Counts=counts)
+            total+=counts
+
+        numParsed=sum(1 for _, parsed in series if parsed)+sum(1 for _, parsed in loaded if parsed)
+        seconds=time.perf_counter()-start
+        self._site=SiteSnapshot(roothash, listOfConSeries, seriesModels, instances, total, time.time(), seconds,
+                                numParsed, len(series)+len(loaded)-numParsed, self._source.FailedPages[numFailed:])
+        Log(f"SiteModel: refreshed in {seconds:.1f}s: {numParsed} pages parsed, {len(series)+len(loaded)-numParsed} unchanged, "
+            f"{len(self._site.FailedPages)} failed.  Total: {total.Debug()}")
+        return True
+
+
+    # ----------------------------------------------
+    # Returns the series' model (its Counts are filled in later) and whether its page had to be parsed
+    def _RefreshSeries(self, seriesname: str, old: SiteSnapshot|None) -> tuple[SeriesModel, bool]:
+        previous=old.Series.get(seriesname) if old is not None else None
+        try:
+            page=self._source.GetFileAsString("/"+seriesname, "index.html")
+        except PageFetchError:
+            if previous is not None:
+                return previous, False      # Keep what we had
+            counts=ConpubsCounts()
+            counts.title=seriesname
+            return SeriesModel(seriesname, seriesname, "", counts, [], counts), False
+        if page is None:
+            LogInfo("SiteModel: /%s/index.html does not exist", seriesname)
+            counts=ConpubsCounts()
+            counts.title=seriesname
+            return SeriesModel(seriesname, seriesname, "", counts, [], counts), False
+
+        pagehash=PageHash(page)
+        if previous is not None and previous.Hash == pagehash:
+            return previous, False
+        csp=ConSeriesPage(seriesname, loadInstances=False, page=page)
+        return SeriesModel(seriesname, csp.Seriesname, pagehash, csp.Counts, [nlc.name for nlc in csp.ConInstanceNLCs], csp.Counts), True
+
+
+    # Returns the con instance's model and whether its page had to be parsed
+    def _RefreshInstance(self, series: SeriesModel, coninstancename: str, old: SiteSnapshot|None) -> tuple[InstanceModel, bool]:
+        previous=old.Instances.get((series.Name, coninstancename)) if old is not None else None
+        try:
+            page=self._source.GetFileAsString(f"/{series.PathName}/{coninstancename}", "index.html")
+        except PageFetchError:
+            if previous is not None:
+                return previous, False
+            return InstanceModel(coninstancename, "", ConFileRows(), ConpubsCounts()), False
+        if page is None:
+            LogInfo("SiteModel: /%s/%s/index.html does not exist", series.PathName, coninstancename)
+            return InstanceModel(coninstancename, "", ConFileRows(), ConpubsCounts()), False
+
+        pagehash=PageHash(page)
+        if previous is not None and previous.Hash == pagehash:
+            if GetPdfPageCounter() is None:
+                return previous, False
+            # The PDFs may have changed even if the page hasn't, so they're always counted again
+            counts=CountConFiles("/"+series.PathName, coninstancename, previous.Rows.Files())
+            return previous._replace(Counts=counts), False
+
+        ci=ConInstance("/"+series.PathName, coninstancename, page=page)
+        return InstanceModel(coninstancename, pagehash, ConFileRows(ci.ConFiles), ci.ComputeCounts), True
+
+
+#####################################################################################
+# Serves a SiteModel over HTTP, refreshing it every refreshMinutes
+class SiteServer:
+
+    def __init__(self, model: SiteModel, host: str, port: int, refreshMinutes: float=60):
+        self._model: SiteModel=model
+        self._interval: float=refreshMinutes*60
+        self._wake=threading.Event()
+        self._stop=threading.Event()
+        self.NextRefresh: float=0
+
+        self._httpd=ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads=True
+        self._httpd.SiteServer=self
+
+
+    @property
+    def Model(self) -> SiteModel:
+        return self._model
+
+
+    @property
+    def Address(self) -> tuple[str, int]:
+        return self._httpd.server_address[:2]
+
+
+    # Start a refresh now (if one is running, another starts as soon as it's done)
+    def RefreshNow(self) -> None:
+        self._wake.set()
+
+
+    # ----------------------------------------------
+    # Serve until interrupted (or until Shutdown() is called from another thread)
+    def Run(self) -> None:
+        refresher=threading.Thread(target=self._Refresher, name="Refresher", daemon=True)
+        refresher.start()
+        host, port=self.Address
+        Log(f"SiteServer: serving on http://{host}:{port}/, refreshing every {self._interval/60:g} minutes", isError=True)
+        try:
+            self._httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._stop.set()
+            self._wake.set()
+            if self._model.Refreshing:
+                Log("SiteServer: waiting for the refresh to finish", isError=True)
+            refresher.join()
+            self._httpd.server_close()
+
+
+    def Shutdown(self) -> None:
+        self._httpd.shutdown()
+
+
+    def _Refresher(self) -> None:
+        while not self._stop.is_set():
+            self._wake.clear()
+            try:
+                self._model.Refresh()
+            except Exception as e:      # Keep serving what we have: the next refresh may do better
+                LogError(f"SiteServer: the refresh failed: {e!r}")
+            self.NextRefresh=time.time()+self._interval
+            self._wake.wait(self._interval)
+
+
+# ----------------------------------------------
+def _Timestamp(t: float) -> str:
+    return datetime.fromtimestamp(t).isoformat(timespec="seconds") if t > 0 else ""
+
+
+def _FileDict(row: tuple) -> dict:
+    return dict(zip(FileRowFields, row))
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def do_GET(self) -> None:
+        server: SiteServer=self.server.SiteServer
+        parts=[unquote(x) for x in urlsplit(self.path).path.split("/") if x != ""]
+        site=server.Model.Site
+
+        if parts == ["status"]:
+            status={"loaded": site is not None, "refreshing": server.Model.Refreshing, "nextRefresh": _Timestamp(server.NextRefresh)}
+            if site is not None:
+                status|={"refreshed": _Timestamp(site.Refreshed), "seconds": round(site.Seconds, 3), "pagesParsed": site.NumParsed,
+                         "pagesUnchanged": site.NumReused, "failedPages": site.FailedPages}
+            self._Reply(200, status)
+            return
+
+        if len(parts) == 0 or parts[0] not in ("totals", "series") or len(parts) > 3:
+            self._Reply(404, {"error": f"No such query: {self.path}"})
+            return
+        if site is None:
+            self._Reply(503, {"error": "The site is still being loaded"})
+            return
+
+        if parts == ["totals"]:
+            self._Reply(200, {"counts": site.Total.AsDict(), "refreshed": _Timestamp(site.Refreshed)})
+        elif parts == ["series"]:
+            self._Reply(200, {"series": [{"name": s.Name, "counts": s.Counts.AsDict()} for s in site.Series.values()],
+                              "refreshed": _Timestamp(site.Refreshed)})
+        else:
+            series=site.Series.get(parts[1])
+            if series is None:
+                self._Reply(404, {"error": f"No such series: {parts[1]}"})
+            elif len(parts) == 2:
+                self._Reply(200, {"name": series.Name, "counts": series.Counts.AsDict(),
+                                  "instances": [{"name": x, "counts": site.Instances[(series.Name, x)].Counts.AsDict()} for x in series.Instances],
+                                  "refreshed": _Timestamp(site.Refreshed)})
+            else:
+                instance=site.Instances.get((series.Name, parts[2]))
+                if instance is None:
+                    self._Reply(404, {"error": f"No such con instance: {parts[1]}/{parts[2]}"})
+                else:
+                    self._Reply(200, {"series": series.Name, "name": instance.Name, "counts": instance.Counts.AsDict(),
+                                      "files": [_FileDict(x) for x in instance.Rows], "refreshed": _Timestamp(site.Refreshed)})
+
+
+    def do_POST(self) -> None:
+        if [x for x in urlsplit(self.path).path.split("/") if x != ""] != ["refresh"]:
+            self._Reply(404, {"error": f"No such request: {self.path}"})
+            return
+        self.server.SiteServer.RefreshNow()
+        self._Reply(202, {"refreshing": True})
+
+
+    def _Reply(self, status: int, body: dict) -> None:
+        data=json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+    def log_message(self, format: str, *args) -> None:
+        LogDebug("SiteServer: "+format, *args)
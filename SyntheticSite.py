@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+
+
+#####################################################################################
+# Generate a synthetic fanac.org convention site as a directory tree which can be read with MirrorPageSource
+# The pages cover all the formats the loaders understand:
+#   Series pages:       v0 (embedded fanac-json), v1 (HTML fanac-table, no version comment) and v2 (HTML with a version comment)
+#   Con instance pages: v0 (embedded fanac-json, with _conFileList rows of json ver 1 through 9) and HTML <ul>/<li>/<small> pages,
+#                       with text rows, link rows, nested <ul>s and #view=Fit hrefs
+# The same seed always generates the same site.
+class SyntheticSite:
+
+    def __init__(self, numSeries: int=2000, consPerSeries: int=10, filesPerCon: int=12, seed: int=1):
+        self.NumSeries: int=numSeries
+        self.ConsPerSeries: int=consPerSeries
+        self.FilesPerCon: int=filesPerCon
+        self._rand=random.Random(seed)
+
+
+    # ----------------------------------------------
+    # Write the site to root
+    def Write(self, root: str) -> None:
+        os.makedirs(root, exist_ok=True)
+        seriesNames=[f"Series {i:05}" for i in range(self.NumSeries)]
+        self._WritePage(root, "", self._RootPage(seriesNames))
+
+        for i, seriesname in enumerate(seriesNames):
+            # Vary the number of cons so that there are a few very large series, like Worldcon
+            numcons=max(1, int(self._rand.expovariate(1/self.ConsPerSeries)))
+            connames=[f"{seriesname} - {j}" for j in range(numcons)]
+            seriesformat=i % 3      # 0, 1 or 2 for v0, v1 and v2 pages
+            self._WritePage(root, seriesname, self._SeriesPage(seriesname, connames, seriesformat))
+            for j, conname in enumerate(connames):
+                if seriesformat == 0 or (i+j) % 4 == 0:
+                    page=self._JsonConPage(conname)
+                else:
+                    page=self._HtmlConPage(conname)
+                self._WritePage(root, f"{seriesname}/{conname}", page)
+
+
+    @staticmethod
+    def _WritePage(root: str, directory: str, page: str) -> None:
+        path=os.path.join(root, directory)
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "index.html"), "w", encoding="utf-8") as f:
+            f.write(page)
+
+
+    # ----------------------------------------------
+    def _RootPage(self, seriesNames: list[str]) -> str:
+        rows=[]
+        for i, name in enumerate(seriesNames):
+            rows.append(f'<tr><td><a href="{name}/index.html">{name}</a></td><td>Some description</td></tr>')
+            if i % 50 == 49:
+                rows.append("<tr><td>-----------</td></tr>")     # A divider line
+        return ("<html><head><title>Convention Publications</title><!-- fanac-version 2.0 --></head>\n<body>\n<fanac-table><table>\n"
+                "<thead><tr><th>Convention Series</th><th>Description</th></tr></thead>\n<tbody>\n"+"\n".join(rows)+
+                "\n</tbody></table></fanac-table>\n</body></html>\n")
+
+
+    # ----------------------------------------------
+    def _SeriesPage(self, seriesname: str, connames: list[str], seriesformat: int) -> str:
+        if seriesformat == 0:
+            cons={"_name": seriesname, "_stuff": ""}
+            for i, conname in enumerate(connames):
+                con={"_name": conname}
+                if i % 7 != 6:      # Some cons have no page yet
+                    con["_URL"]=f"{conname}/index.html"
+                cons[str(i)]=json.dumps(con)
+            page={"ver": 3, "_textConSeries": seriesname, "_textFancyURL": "", "_textComments": "", "_datasource": json.dumps(cons)}
+            return f"<html><head><title>{seriesname}</title></head>\n<body>\n<h1>{seriesname}</h1>\n<fanac-json>{json.dumps(page)}</fanac-json>\n</body></html>\n"
+
+        rows=[]
+        for i, conname in enumerate(connames):
+            if i % 7 == 6:
+                cell=conname        # A con with no page yet
+            elif i % 5 == 4:
+                cell=f'<a href="{conname}/index.html">{conname}</a> (cancelled)'
+            else:
+                cell=f'<a href="{conname}/index.html">{conname}</a>'
+            rows.append(f"<tr><td>{cell}</td><td>{1940+i}</td><td>Somewhere, USA</td><td>GoH Name</td></tr>")
+        version="<!-- fanac-version 2.0 -->" if seriesformat == 2 else ""
+        return (f"<html><head><title>{seriesname}</title>{version}</head>\n<body>\n<h1>{seriesname}</h1>\n"
+                "<fanac-table><table>\n<thead><tr><th>Convention</th><th>Dates</th><th>Location</th><th>GoHs</th></tr></thead>\n"
+                "<tbody>\n"+"\n".join(rows)+"\n</tbody></table></fanac-table>\n</body></html>\n")
+
+
+    # ----------------------------------------------
+    # The files of a con, as (displaytitle, sitefilename, sizeMB, pages, kind) where kind is "file", "link" or "text"
+    def _ConFiles(self, conname: str) -> list[tuple[str, str, float, int, str]]:
+        files=[]
+        numfiles=max(1, int(self._rand.gauss(self.FilesPerCon, self.FilesPerCon/3)))
+        for i in range(numfiles):
+            r=self._rand.random()
+            if r < 0.05:
+                files.append((f"Section {i}", "", 0, 0, "text"))
+            elif r < 0.12:
+                files.append((f"External {i}", f"https://example.org/{conname}/{i}.html", 0, 0, "link"))
+            elif r < 0.30:
+                ext=self._rand.choice([".jpg", ".jpeg", ".png", ".gif"])
+                files.append((f"Photo {i}", f"Photo {i}{ext}", round(self._rand.uniform(0.05, 3), 2), 1, "file"))
+            else:
+                files.append((f"Publication {i}", f"Publication {i}.pdf", round(self._rand.uniform(0.1, 40), 2), self._rand.randint(1, 200), "file"))
+        return files
+
+
+    # ----------------------------------------------
+    def _HtmlConPage(self, conname: str) -> str:
+        lines=[]
+        for i, (title, sitefilename, size, pages, kind) in enumerate(self._ConFiles(conname)):
+            if kind == "text":
+                lines.append(f"<b>{title}</b>")
+            elif kind == "link":
+                lines.append(f'<li id="conpagetable"><a href="{sitefilename}">{title}</a></li>')
+            else:
+                href=sitefilename
+                if sitefilename.endswith(".pdf"):
+                    href+=self._rand.choice(["#view=Fit", "#view=Fit&page=2", "", "#view=fit"])
+                # Vary the metadata in the <small> the way real pages do
+                small=self._rand.choice([f"({size}&nbsp;MB; {pages} pp)", f"{size} MB, {pages} pp", f"{size} MB", ""])
+                small=f" <small>{small}</small>" if small != "" else ""
+                lines.append(f'<li id="conpagetable"><a href="{href}">{title}</a>{small}</li>')
+            if i % 10 == 9:
+                lines.append("</ul>\n<ul id=\"conpagetable\">")     # Pages are often broken into several lists
+        return (f"<html><head><title>{conname}</title><!-- fanac-version 2.0 --></head>\n<body>\n<h1>{conname}</h1>\n"
+                '<fanac-table>\n<ul id="conpagetable">\n'+"\n".join(lines)+"\n</ul>\n</fanac-table>\n</body></html>\n")
+
+
+    # ----------------------------------------------
+    def _JsonConPage(self, conname: str) -> str:
+        rows=[]
+        for title, sitefilename, size, pages, kind in self._ConFiles(conname):
+            ver=self._rand.randint(1, 9)
+            if kind == "link":
+                ver=9       # Only the newest rows can be links
+            if kind == "text":
+                ver=max(ver, 6)
+            row={"ver": ver, "_displayTitle": title if ver > 4 or kind != "file" else sitefilename, "_notes": "", "_size": str(size)}
+            if ver > 4:
+                row["_sitefilename"]=sitefilename
+            if ver > 5:
+                row["_isText"]=kind == "text"
+            if ver > 6:
+                row["_pages"]=pages
+            if ver > 7:
+                row["_isLink"]=kind == "link"
+            if ver > 8:
+                row["_URL"]=sitefilename if kind == "link" else ""
+            rows.append(json.dumps(row))
+        datasource={"ver": 1, "_name": conname, "_conFileList": rows}
+        page={"ConInstanceName": conname, "_datasource": json.dumps(datasource)}
+        return f"<html><head><title>{conname}</title></head>\n<body>\n<h1>{conname}</h1>\n<fanac-json>{json.dumps(page)}</fanac-json>\n</body></html>\n"
+
+
+#############################################
+if __name__ == "__main__":
+    parser=argparse.ArgumentParser(description="Generate a synthetic fanac.org convention site")
+    parser.add_argument("root", help="Directory to write the site into")
+    parser.add_argument("--series", type=int, default=2000, help="Number of convention series")
+    parser.add_argument("--cons", type=int, default=10, help="Average number of con instances per series")
+    parser.add_argument("--files", type=int, default=12, help="Average number of files per con instance")
+    parser.add_argument("--seed", type=int, default=1)
+    args=parser.parse_args()
+    SyntheticSite(args.series, args.cons, args.files, args.seed).Write(args.root)
@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import random
+import re
+import unittest
+
+from HelpersPackage import Float0, Int0
+from RowMetadata import IsLinkHref, NormalizeHref, SmallMetadata, UnpackConNameInfo
+
+
+#####################################################################################
+# RowMetadata.py replaced code in ConInstance.LoadConInstanceFromHTML() and ConSeriesPage.ConNameInfoUnpack().  These
+#   check that it gives the same results as that code, which is kept here (as it was) to compare against, on the kinds
+#   of row the site's pages have, and on a deterministic mix of the pieces those rows are made of.
+
+
+# The old view=Fit stripping.  It loops forever on some hrefs (e.g., "x.pdf#page=2&view=Fit"), so here it gives up.
+class _Hung(Exception):
+    pass
+
+
+def _OldNormalizeHref(href: str) -> str:
+    passes=0
+    while "view=fit" in href.lower():
+        passes+=1
+        if passes > 100:
+            raise _Hung(href)
+        href=re.sub("view=fit&", "", href, count=99, flags=re.IGNORECASE)
+        href=re.sub("#view=fit", "", href, count=1, flags=re.IGNORECASE)
+    return href
+
+
+def _OldSmallMetadata(small: str) -> tuple[float|None, int|None]:
+    size=None
+    pages=None
+    small=small.replace("&nbsp;", " ")
+    m=re.match(".*?([0-9.]+) MB", small, re.IGNORECASE)
+    if m is not None:
+        val=Float0(m.group(1))
+        if val > 500:  # We're looking for a value in MB, but if we get a value in bytes, convert it
+            val=val/(1024**2)
+        size=val
+    m=re.match(".*?([0-9]+) pp", small, re.IGNORECASE)
+    if m is not None:
+        pages=Int0(m.group(1))
+    return size, pages
+
+
+def _OldUnpackConNameInfo(packed: str) -> tuple[str, str, str]:
+    name=packed
+    url=""
+    extra=""
+    m=re.match('<a href=\"?(.*?)\"?>(.*?)</a>(.*)$', packed, re.IGNORECASE)
+    if m is not None:
+        url=m.groups()[0].strip()
+        name=m.groups()[1].strip()
+        extra=m.groups()[2].strip()
+    return name, url, extra
+
+
+# ----------------------------------------------
+# Rows as they turn up on the site's con instance and con series pages
+_hrefs=["Boskone 23 Program Book.pdf", "Noreascon 3 PR1.pdf#view=Fit", "Noreascon 3 PR1.pdf#VIEW=FIT", "Disclave 1975 PB.pdf#view=Fit&page=2",
+        "Lunacon 1970.pdf#zoom=75&view=Fit&page=3", "Pocket Program.pdf#view=FitH", "Photo 12.jpg", "Minicon 10 Flyer.pdf#page=4",
+        "Arisia 90 PB.pdf#view=Fit#view=Fit", "Worldcon.pdf#view=Fit&view=Fit&page=5", "Progress Report 1.pdf#view=Fit&", "a=b.pdf",
+        "Hugo Ballot.pdf?view=Fit", "https://fanac.org/conpubs/Boskone/Boskone 1/index.html", "../Boskone 2/Program Book.pdf#view=Fit", ""]
+
+_smalls=["(1.2 MB; 36 pp)", "(12.1&nbsp;MB; 84&nbsp;pp)", "(0.4 MB)", "(36 pp)", "(1534000 MB; 2 pp)", "(36 pp)\n(1.2 MB)", "(1.2 MB)\n(36 pp)",
+         "(2.5 mb; 10 PP)", "(1.2.3 MB)", "(v2: 3.1 MB, 12 pp)", "(3 pp; 4 MB; 5 pp)", "(0 MB; 0 pp)", "(1,234 pp)", "(7 MB7 pp)", "", "(scan to come)"]
+
+_packed=['<a href="Boskone 1/index.html">Boskone 1</a>', '<a href="Boskone 2/index.html">Boskone 2</a> (cancelled)', '<a href=Lunacon.html>Lunacon</a>',
+         '<A HREF="Minicon 3/index.html">Minicon 3</A>', 'Boskone 3', '<a href="x">Arisia</a>\n', '<a href="x">Arisia</a> 1990\nsecond line',
+         '<a href="">Disclave</a>', '<a href="a"b">Odd quotes</a> extra', '']
+
+# The pieces rows are made of, for the mixed-up cases
+_pieces=["view=fit", "VIEW=Fit", "&", "#", "a.pdf", "page=2", "=", "v", "iew=fit", " MB", "pp", " pp", "1", "2.5", ".", "\n", "&nbsp;", "x", " "]
+
+
+def _Mixed(n: int) -> list[str]:
+    rnd=random.Random(24)
+    return ["".join(rnd.choice(_pieces) for _ in range(rnd.randint(0, 8))) for _ in range(n)]
+
+
+#####################################################################################
+class TestRowMetadata(unittest.TestCase):
+
+    def testNormalizeHref(self):
+        for href in _hrefs+_Mixed(3000):
+            try:
+                expected=_OldNormalizeHref(href)
+            except _Hung:
+                # The old code never finished on these.  Every view=Fit is stripped.
+                self.assertNotIn("view=fit", NormalizeHref(href).lower(), href)
+                continue
+            self.assertEqual(expected, NormalizeHref(href), href)
+
+
+    def testNormalizeHrefWhichHung(self):
+        with self.assertRaises(_Hung):
+            _OldNormalizeHref("Disclave.pdf#page=2&view=Fit")
+        self.assertEqual("Disclave.pdf#page=2", NormalizeHref("Disclave.pdf#page=2&view=Fit"))
+        self.assertEqual("Disclave.pdf#page=2", NormalizeHref("Disclave.pdf#page=2&VIEW=FIT"))
+        self.assertEqual("Disclave.pdf", NormalizeHref("Disclave.pdf#view=Fit&view=Fit"))
+
+
+    def testSmallMetadata(self):
+        for small in _smalls+_Mixed(3000):
+            self.assertEqual(_OldSmallMetadata(small), SmallMetadata(small), small)
+
+
+    def testUnpackConNameInfo(self):
+        mixed=_Mixed(1000)
+        for packed in _packed+[f'<a href="{x}">{y}</a>{x}' for x, y in zip(mixed, reversed(mixed))]:
+            self.assertEqual(_OldUnpackConNameInfo(packed), UnpackConNameInfo(packed), packed)
+
+
+    def testIsLinkHref(self):
+        for href in _hrefs:
+            self.assertEqual("/" in href, IsLinkHref(href), href)
+
+
+if __name__ == "__main__":
+    unittest.main()